@@ -72,6 +72,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'TradingAnalysisAi.wsgi.application'
+ASGI_APPLICATION = 'TradingAnalysisAi.asgi.application'
 
 DATABASES = {
     'default': {
@@ -183,6 +184,14 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'market_data.tasks.schedule_all_active_symbols_fetching',
         'schedule': 900.0,  # 900 seconds = 15 minutes
     },
+    'prune-expired-candles-every-hour': {
+        'task': 'market_data.tasks.prune_expired_candles',
+        'schedule': 3600.0,
+    },
+    'create-candle-partitions-every-day': {
+        'task': 'market_data.tasks.create_candle_partitions',
+        'schedule': 86400.0,
+    },
 }
 
 # Liara AI API Settings
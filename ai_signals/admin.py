@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Signal
+from .models import Signal, SignalAccuracy
 
 
 @admin.register(Signal)
@@ -15,11 +15,13 @@ class SignalAdmin(admin.ModelAdmin):
         'direction_next_candle',
         'confidence_next_candle',
         'direction_3rd_candle',
+        'source',
         'created_at'
     )
-    list_filter = ('candle__symbol__name', 'direction_next_candle', 'direction_3rd_candle')
-    search_fields = ('candle__symbol__name',)
-    date_hierarchy = 'candle__timestamp'
+    list_filter = ('symbol__name', 'source', 'direction_next_candle', 'direction_3rd_candle')
+    search_fields = ('symbol__name',)
+    date_hierarchy = 'timestamp'
+    list_select_related = ('symbol',)
     ordering = ('-created_at',)
 
     # Make all fields read-only in the detail view
@@ -35,14 +37,31 @@ class SignalAdmin(admin.ModelAdmin):
         return False
 
     # Custom methods for better display in the admin list
-    @admin.display(description='Symbol', ordering='candle__symbol__name')
+    @admin.display(description='Symbol', ordering='symbol__name')
     def get_symbol_name(self, obj):
-        if obj.candle and obj.candle.symbol:
-            return obj.candle.symbol.name
-        return "N/A"
+        return obj.symbol.name
 
-    @admin.display(description='Candle Time', ordering='candle__timestamp')
+    @admin.display(description='Candle Time', ordering='timestamp')
     def get_candle_timestamp(self, obj):
-        if obj.candle:
-            return obj.candle.timestamp
-        return "N/A"
+        return obj.timestamp
+
+
+@admin.register(SignalAccuracy)
+class SignalAccuracyAdmin(admin.ModelAdmin):
+    """
+    Read-only view of the accuracy counters maintained by the signal outcome evaluator.
+    """
+    list_display = ('symbol', 'horizon', 'confidence_bucket', 'predictions', 'correct', 'directional', 'hits')
+    list_filter = ('horizon', 'confidence_bucket')
+    search_fields = ('symbol__name',)
+    list_select_related = ('symbol',)
+    ordering = ('symbol__name', 'horizon', 'confidence_bucket')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,18 @@
+import pickle
+
+import django
+
+# The process-pool side of run_backtest. This module imports nothing from the apps, so a spawned
+# worker can load its initializer before Django is set up; the predictor is unpickled after setup.
+_predictor = None
+
+
+def init_worker(pickled_predictor: bytes):
+    global _predictor
+    django.setup()
+    _predictor = pickle.loads(pickled_predictor)
+
+
+def backtest_in_worker(symbol_name, timestamps, ohlcv, step, neutral_band):
+    from .backtesting import backtest_series
+    return backtest_series(_predictor, symbol_name, timestamps, ohlcv, step, neutral_band)
@@ -0,0 +1,280 @@
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from market_data.candle_buffer import BUFFER_CAPACITY, OHLCV_FIELDS, CLOSE
+from market_data.indicators import EMA_SPANS, RSI_PERIOD, MIN_CANDLES, ema, advance_state, summarise
+from market_data.models import Candle
+from .models import Signal
+from .services import SIGNAL_HORIZONS
+from .backtest_worker import init_worker, backtest_in_worker
+
+logger = logging.getLogger(__name__)
+
+# Candles ahead that each predicted horizon refers to
+HORIZON_CANDLES = dict(zip(SIGNAL_HORIZONS, (1, 3, 5, 10)))
+# Direction codes: predictions and realised moves are compared as small integers
+DIRECTION_CODES = {Signal.SignalDirection.BEARISH: -1, Signal.SignalDirection.NEUTRAL: 0,
+                   Signal.SignalDirection.BULLISH: 1}
+# A realised move smaller than this fraction of the close counts as NEUTRAL
+NEUTRAL_BAND = 0.001
+
+
+def load_series(symbols: list, since: datetime = None, until: datetime = None,
+                interval: str = Candle.Interval.FIFTEEN_MINUTES):
+    """
+    Loads the candles of several symbols with one query.
+    Returns {symbol name: (timestamps, ohlcv)} with UNIX-second int64 timestamps and a (5, n) float64 OHLCV array.
+    """
+    candles = Candle.objects.filter(symbol__in=symbols, interval=interval)
+    if since is not None:
+        candles = candles.filter(timestamp__gte=since)
+    if until is not None:
+        candles = candles.filter(timestamp__lte=until)
+    rows = candles.order_by('symbol_id', 'timestamp').values_list('symbol_id', 'timestamp', *OHLCV_FIELDS)
+
+    names = {symbol.id: symbol.name for symbol in symbols}
+    grouped = {}
+    for symbol_id, timestamp, *ohlcv in rows.iterator(chunk_size=10000):
+        grouped.setdefault(symbol_id, []).append((timestamp.timestamp(), *ohlcv))
+    series = {}
+    for symbol_id, candles in grouped.items():
+        columns = np.array(candles, dtype=np.float64).T
+        series[names[symbol_id]] = (columns[0].astype(np.int64), np.ascontiguousarray(columns[1:]))
+    return series
+
+
+def indicator_rules(closes, emas: dict, rsi):
+    """
+    The indicator model's rules, over arrays of closes, EMAs (keyed by span) and RSI values.
+    The two short horizons follow the EMA 9/21 spread, reversed when RSI is overbought or oversold;
+    the two long ones follow the EMA 9/21/50 trend and are NEUTRAL when the EMAs are not aligned.
+    Confidence grows with the size of the EMA spread behind each prediction.
+    Returns (directions, confidences) as (horizons, len(closes)) arrays.
+    """
+    spread = (emas[9] - emas[21]) / closes
+    trend = np.where((emas[9] > emas[21]) & (emas[21] > emas[50]), 1,
+                     np.where((emas[9] < emas[21]) & (emas[21] < emas[50]), -1, 0))
+    reversal = np.where(rsi >= 70, -1, np.where(rsi <= 30, 1, 0))
+    short = np.where(reversal != 0, reversal, np.sign(spread)).astype(np.int8)
+    short_confidence = np.clip(50 + 1e4 * np.abs(spread), 50, 90)
+    long_confidence = np.where(trend != 0, np.clip(50 + 1e4 * np.abs(emas[9] - emas[50]) / closes, 50, 90), 50)
+
+    directions = np.stack([short, short, trend, trend]).astype(np.int8)
+    confidences = np.stack([short_confidence, short_confidence, long_confidence, long_confidence])
+    return directions, confidences
+
+
+class IndicatorPredictor:
+    """
+    A local model predicting from the same indicators the LLM is given, computed for a whole series at once
+    and turned into predictions by `indicator_rules`. The live fallback model applies the same rules to
+    the feature summary of a single candle.
+    """
+
+    def predict(self, symbol_name: str, timestamps, ohlcv, indices):
+        closes = ohlcv[CLOSE]
+        emas = {span: ema(closes, span) for span in EMA_SPANS}
+        deltas = np.diff(closes, prepend=closes[0])
+        gains, losses = np.clip(deltas, 0, None), np.clip(-deltas, 0, None)
+        avg_gain = ema(gains, alpha=1 / RSI_PERIOD, seed=gains[1:RSI_PERIOD + 1].mean())
+        avg_loss = ema(losses, alpha=1 / RSI_PERIOD, seed=losses[1:RSI_PERIOD + 1].mean())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = np.where(avg_loss > 0, 100 - 100 / (1 + avg_gain / avg_loss), 100.0)
+
+        directions, confidences = indicator_rules(closes, emas, rsi)
+        return directions[:, indices], confidences[:, indices]
+
+
+class RecordedPredictor:
+    """
+    Replays recorded signals, e.g. the LLM's own past signals, keyed by symbol name and candle time.
+    Candles without a recorded signal are left unpredicted.
+    """
+
+    def __init__(self, responses: dict):
+        self.responses = responses
+
+    @classmethod
+    def from_signals(cls, symbols: list):
+        """Records the signals stored for the symbols' candles."""
+        responses = {}
+        for signal in Signal.objects.filter(symbol__in=symbols).select_related('symbol'):
+            responses.setdefault(signal.symbol.name, {})[int(signal.timestamp.timestamp())] = {
+                horizon: {'direction': getattr(signal, f"direction_{suffix}_candle"),
+                          'confidence': float(getattr(signal, f"confidence_{suffix}_candle"))}
+                for horizon, suffix in zip(SIGNAL_HORIZONS, ('next', '3rd', '5th', '10th'))
+            }
+        return cls(responses)
+
+    @classmethod
+    def from_file(cls, path: str):
+        """Reads JSON lines of {"symbol", "timestamp" (UNIX seconds), "signal" (a model response)}."""
+        responses = {}
+        with open(path) as file:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    responses.setdefault(record['symbol'], {})[int(record['timestamp'])] = record['signal']
+        return cls(responses)
+
+    def predict(self, symbol_name: str, timestamps, ohlcv, indices):
+        recorded = self.responses.get(symbol_name, {})
+        return _parse_responses([recorded.get(int(timestamps[i])) for i in indices])
+
+
+class ResponderPredictor:
+    """
+    Asks a responder for each candle's signal, given the indicator summary the live pipeline would
+    build at that candle from the BUFFER_CAPACITY candles before it. The responder is a callable
+    taking the features and returning a model response, or None: a stub, or the LLM itself, e.g.
+    `LiaraAIService().generate_signal_from_features`.
+    """
+
+    def __init__(self, responder):
+        self.responder = responder
+
+    def predict(self, symbol_name: str, timestamps, ohlcv, indices):
+        responses = []
+        state = None
+        for i in indices:
+            start = max(0, i + 1 - BUFFER_CAPACITY)
+            window_timestamps, window = timestamps[start:i + 1], ohlcv[:, start:i + 1]
+            if state is not None and state['timestamp'] < window_timestamps[0]:
+                state = None
+            state = advance_state(state, window_timestamps, window[CLOSE])
+            responses.append(self.responder(summarise(state, window_timestamps, window, Candle.Interval.FIFTEEN_MINUTES)))
+        return _parse_responses(responses)
+
+
+def _parse_responses(responses: list):
+    """Turns model responses into direction codes and confidences; missing responses get a NaN confidence."""
+    directions = np.zeros((len(SIGNAL_HORIZONS), len(responses)), dtype=np.int8)
+    confidences = np.full((len(SIGNAL_HORIZONS), len(responses)), np.nan)
+    for column, response in enumerate(responses):
+        if not response:
+            continue
+        for row, horizon in enumerate(SIGNAL_HORIZONS):
+            prediction = response.get(horizon) or {}
+            if prediction.get('direction') in DIRECTION_CODES:
+                directions[row, column] = DIRECTION_CODES[prediction['direction']]
+                confidences[row, column] = float(prediction.get('confidence', 0))
+    return directions, confidences
+
+
+def realised_directions(closes, indices, neutral_band: float = NEUTRAL_BAND):
+    """
+    Returns the direction the close actually moved over each horizon after each candle in `indices`,
+    as a (horizons, len(indices)) array of direction codes, and a mask of the moves that are known.
+    """
+    directions = np.zeros((len(SIGNAL_HORIZONS), len(indices)), dtype=np.int8)
+    known = np.zeros(directions.shape, dtype=bool)
+    for row, ahead in enumerate(HORIZON_CANDLES.values()):
+        known[row] = indices + ahead < closes.size
+        targets = indices[known[row]]
+        change = closes[targets + ahead] / closes[targets] - 1
+        directions[row, known[row]] = np.where(change > neutral_band, 1, np.where(change < -neutral_band, -1, 0))
+    return directions, known
+
+
+def score(predicted, confidences, realised, known):
+    """
+    Scores predictions against realised moves, per horizon. For every horizon it counts the scored
+    predictions and the correct ones, and separately the BULLISH/BEARISH calls and those that got
+    the sign of the move right (the hit rate). The mean confidence of right and wrong calls is kept
+    as sums, so reports from several symbols can be added up.
+    """
+    scored = known & ~np.isnan(confidences)
+    correct = scored & (predicted == realised)
+    directional = scored & (predicted != 0)
+    hits = directional & (predicted == realised)
+    confidence = np.nan_to_num(confidences)
+    return {
+        horizon: {
+            'predictions': int(scored[row].sum()),
+            'correct': int(correct[row].sum()),
+            'directional': int(directional[row].sum()),
+            'hits': int(hits[row].sum()),
+            'confidence_correct': float(confidence[row][correct[row]].sum()),
+            'confidence_wrong': float(confidence[row][scored[row] & ~correct[row]].sum()),
+        }
+        for row, horizon in enumerate(SIGNAL_HORIZONS)
+    }
+
+
+def backtest_series(predictor, symbol_name: str, timestamps, ohlcv, step: int = 1, neutral_band: float = NEUTRAL_BAND):
+    """
+    Replays one symbol's series through a predictor: every `step`-th candle from the first one with
+    enough history gets a prediction, which is scored against the closes that followed it.
+    """
+    indices = np.arange(MIN_CANDLES - 1, timestamps.size, step)
+    if not indices.size:
+        empty = np.zeros((len(SIGNAL_HORIZONS), 0))
+        return {'candles': 0, 'horizons': score(empty.astype(np.int8), empty, empty.astype(np.int8), empty.astype(bool))}
+    predicted, confidences = predictor.predict(symbol_name, timestamps, ohlcv, indices)
+    realised, known = realised_directions(ohlcv[CLOSE], indices, neutral_band)
+    return {'candles': int(indices.size), 'horizons': score(predicted, confidences, realised, known)}
+
+
+def merge_reports(reports):
+    """Adds up the horizon counts of several reports (before their rates are added) and derives the rates."""
+    total = {'candles': 0, 'horizons': {horizon: {} for horizon in SIGNAL_HORIZONS}}
+    for report in reports:
+        total['candles'] += report['candles']
+        for horizon, counts in report['horizons'].items():
+            for name, value in counts.items():
+                total['horizons'][horizon][name] = total['horizons'][horizon].get(name, 0) + value
+    for counts in total['horizons'].values():
+        _add_rates(counts)
+    return total
+
+
+def _add_rates(counts: dict):
+    wrong = counts.get('predictions', 0) - counts.get('correct', 0)
+    counts['accuracy'] = round(counts['correct'] / counts['predictions'], 4) if counts.get('predictions') else None
+    counts['hit_rate'] = round(counts['hits'] / counts['directional'], 4) if counts.get('directional') else None
+    counts['mean_confidence_correct'] = (round(counts['confidence_correct'] / counts['correct'], 2)
+                                         if counts.get('correct') else None)
+    counts['mean_confidence_wrong'] = round(counts['confidence_wrong'] / wrong, 2) if wrong else None
+
+
+def run_backtest(symbols: list, predictor, since: datetime = None, until: datetime = None, step: int = 1,
+                 workers: int = None, neutral_band: float = NEUTRAL_BAND):
+    """
+    Backtests a predictor over the stored 15-minute candles of the symbols.
+    The series are loaded with one query and replayed on a process pool, one symbol per task;
+    each predictor works on whole NumPy arrays, so a task is a handful of vectorised passes rather
+    than a loop over candles. With `workers=1` everything runs in this process.
+    Returns {'symbols': {symbol name: report}, 'total': report, 'duration': seconds}, where each
+    report has the number of candles predicted and the scores of every horizon.
+    """
+    started_at = time.monotonic()
+    series = load_series(symbols, since, until)
+    workers = workers or min(len(series), os.cpu_count() or 1) or 1
+
+    if workers == 1:
+        reports = {name: backtest_series(predictor, name, timestamps, ohlcv, step, neutral_band)
+                   for name, (timestamps, ohlcv) in series.items()}
+    else:
+        # Spawned workers start without this process's database connections (and the caller's transaction);
+        # they are handed the series and never query the database
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker, initargs=(pickle.dumps(predictor),)) as pool:
+            futures = {name: pool.submit(backtest_in_worker, name, timestamps, ohlcv, step, neutral_band)
+                       for name, (timestamps, ohlcv) in series.items()}
+            reports = {name: future.result() for name, future in futures.items()}
+
+    total = merge_reports(reports.values())
+    for report in reports.values():
+        for counts in report['horizons'].values():
+            _add_rates(counts)
+    duration = round(time.monotonic() - started_at, 3)
+    logger.info(f"Backtested {total['candles']} candles of {len(reports)} symbols in {duration}s.")
+    return {'symbols': reports, 'total': total, 'duration': duration}
@@ -0,0 +1,56 @@
+import logging
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+
+from market_data.aggregation import BASE_INTERVAL
+from market_data.ingestion import last_closed_candle_start
+from market_data.models import Candle
+from market_data.services import INTERVAL_SECONDS
+from .services import SIGNAL_BATCH_SIZE
+from .tasks import generate_signals_for_candles
+
+logger = logging.getLogger(__name__)
+
+# A queued job that has not started before the next candle closes is discarded by the broker
+SIGNAL_JOB_EXPIRES = INTERVAL_SECONDS[BASE_INTERVAL]
+
+
+def _dispatch_key(symbol_name: str, timestamp: datetime):
+    return f"signal-job:{symbol_name}:{int(timestamp.timestamp())}"
+
+
+def dispatch_signal_jobs(symbols: list, now: datetime = None):
+    """
+    Enqueues a signal for at most one candle per symbol, its latest closed 15-minute candle.
+    Called after each ingestion batch with the symbols of that batch; a symbol qualifies only
+    when its high-water mark is the most recent closed candle, so backfilled history and
+    symbols that are behind never reach the LLM. A candle is enqueued once even if several
+    ingestion runs see it, and the candles are grouped into jobs of SIGNAL_BATCH_SIZE symbols
+    that are each served by one batched LLM request.
+    Returns the number of candles enqueued.
+    """
+    now = now or datetime.now(timezone.utc)
+    last_closed = datetime.fromtimestamp(last_closed_candle_start(BASE_INTERVAL, now), tz=timezone.utc)
+    fresh = {symbol.id: symbol for symbol in symbols if symbol.last_candle_at == last_closed}
+    if not fresh:
+        return 0
+
+    keys = {symbol_id: _dispatch_key(symbol.name, last_closed) for symbol_id, symbol in fresh.items()}
+    already_dispatched = cache.get_many(list(keys.values()))
+    candle_ids = Candle.objects.filter(
+        symbol_id__in=[symbol_id for symbol_id, key in keys.items() if key not in already_dispatched],
+        interval=BASE_INTERVAL, timestamp=last_closed,
+    ).values_list('symbol_id', 'id')
+
+    # `add` is atomic, so concurrent dispatchers cannot both enqueue the same candle
+    to_dispatch = [
+        candle_id for symbol_id, candle_id in candle_ids
+        if cache.add(keys[symbol_id], candle_id, timeout=2 * SIGNAL_JOB_EXPIRES)
+    ]
+    for start in range(0, len(to_dispatch), SIGNAL_BATCH_SIZE):
+        generate_signals_for_candles.apply_async(
+            args=[to_dispatch[start:start + SIGNAL_BATCH_SIZE]], expires=SIGNAL_JOB_EXPIRES)
+
+    logger.info(f"Dispatched signals for {len(to_dispatch)} candles closed at {last_closed}.")
+    return len(to_dispatch)
@@ -0,0 +1,182 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import random
+import threading
+import time
+
+from openai import (AsyncOpenAI, OpenAIError, APIConnectionError, APITimeoutError, RateLimitError,
+                    InternalServerError)
+
+from market_data.ratelimit import AsyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Number of LLM calls in flight at once per process
+LLM_MAX_CONCURRENCY = 32
+# Upstream quota, enforced locally so requests wait instead of failing with 429s
+LLM_REQUESTS_PER_MINUTE = 500
+LLM_TOKENS_PER_MINUTE = 200000
+# Rough allowance for the completion when estimating the tokens of a request
+COMPLETION_TOKENS_ESTIMATE = 600
+LLM_MAX_RETRIES = 4
+# Consecutive upstream failures that open the circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30.0
+
+# Errors worth retrying: the upstream is unreachable, overloaded or rate limiting us
+TRANSIENT_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+
+class CircuitOpenError(OpenAIError):
+    """Raised instead of calling the upstream while the circuit breaker is open."""
+
+
+# Errors meaning no answer is coming in time: the circuit is open, or the call ran past its deadline
+UNAVAILABLE_ERRORS = (CircuitOpenError, concurrent.futures.TimeoutError)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0):
+    """Exponential backoff with full jitter: a random delay up to base * 2 ** attempt, capped."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing upstream.
+    After `failure_threshold` consecutive failures the circuit opens and calls are refused for
+    `reset_timeout` seconds; then a single trial call is let through, which closes the circuit
+    on success or opens it again on failure. A trial call that ends for another reason (a bad
+    request, a cancelled caller) says nothing about the upstream, so it is only released.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """Returns True if a call may be made now."""
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def release(self):
+        """Frees the trial call slot without counting a success or a failure."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"LLM circuit opened after {self.failures} consecutive failures.")
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+
+class LLMExecutor:
+    """
+    Runs LLM calls for the whole process on one long-lived event loop.
+    The loop lives in a background thread with a single AsyncOpenAI client, so its connection
+    pool is shared by every caller. Calls are bounded by a semaphore and request/token rate
+    limiters, retried with jittered exponential backoff on transient errors, and refused
+    while the circuit breaker is open. Synchronous code (e.g. Celery tasks) hands coroutines
+    to `run`; many callers can wait on the same executor at once.
+    """
+
+    def __init__(self, base_url: str, api_key: str, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 requests_per_minute: int = LLM_REQUESTS_PER_MINUTE, tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+                 max_retries: int = LLM_MAX_RETRIES):
+        # Retries are handled here, with the circuit breaker, instead of inside the client
+        self.client = AsyncOpenAI(base_url=base_url, api_key=api_key, max_retries=0)
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._request_limiter = AsyncTokenBucket(requests_per_minute, 60)
+        self._token_limiter = AsyncTokenBucket(tokens_per_minute, 60)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='llm-executor', daemon=True)
+        self._thread.start()
+        self.pid = os.getpid()
+
+    def run(self, coroutine, timeout: float = None):
+        """
+        Runs a coroutine on the executor loop and waits for its result.
+        After `timeout` seconds the coroutine is cancelled, the overrun counts as an upstream failure
+        and concurrent.futures.TimeoutError is raised.
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self._loop.call_soon_threadsafe(self.breaker.record_failure)
+            raise
+
+    async def complete(self, model: str, messages: list, **kwargs):
+        """Makes one chat completion and returns the message content."""
+        estimated_tokens = sum(len(message['content']) for message in messages) // 4 + COMPLETION_TOKENS_ESTIMATE
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError("The LLM circuit is open; not calling the upstream.")
+            try:
+                await self._request_limiter.acquire()
+                await self._token_limiter.acquire(min(estimated_tokens, self._token_limiter.capacity))
+                async with self._semaphore:
+                    completion = await self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"LLM call failed ({e}); retrying in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # A rejected request or a cancelled caller is not an upstream failure, but must not keep
+                # the trial call slot of a half-open circuit; timeouts are counted by `run`
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return completion.choices[0].message.content
+
+    def close(self):
+        self.run(self.client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_llm_executor():
+    """
+    Returns the LLM executor of this process, creating it on first use.
+    A forked worker process gets its own, since the parent's loop thread does not survive the fork.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None or _executor.pid != os.getpid():
+            api_key = os.environ.get('LIARA_API_KEY')
+            base_url = os.environ.get('LIARA_BASE_URL')
+            if not api_key or not base_url:
+                raise ValueError("LIARA_API_KEY and LIARA_BASE_URL must be set.")
+            _executor = LLMExecutor(base_url=base_url, api_key=api_key)
+        return _executor
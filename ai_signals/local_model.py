@@ -0,0 +1,47 @@
+import numpy as np
+
+from market_data.indicators import EMA_SPANS
+from .backtesting import DIRECTION_CODES, indicator_rules
+from .services import SIGNAL_HORIZONS
+
+_DIRECTIONS = {code: direction.value for direction, code in DIRECTION_CODES.items()}
+
+
+class LocalSignalModel:
+    """
+    A deterministic, CPU-only signal model: the indicator rules of the backtester, applied to the
+    feature summary the LLM would be given. It answers in well under a millisecond, so it stands in
+    when the LLM is unavailable and serves the symbols whose signals are not worth an LLM call.
+    Its responses have the shape of the LLM's and pass `validate_signal`. Its accuracy is what
+    `backtest_signals --predictor indicator` reports.
+    """
+
+    def generate_signal_from_features(self, features: dict):
+        """Returns a signal for the indicator summary of market_data.indicators, or None without features."""
+        if not features:
+            return None
+        close = np.array([features['close']], dtype=np.float64)
+        emas = {span: np.array([features['ema'][str(span)]], dtype=np.float64) for span in EMA_SPANS}
+        directions, confidences = indicator_rules(close, emas, np.array([features['rsi_14']], dtype=np.float64))
+
+        signal_data = {
+            horizon: {'direction': _DIRECTIONS[int(directions[row, 0])],
+                      'confidence': round(float(confidences[row, 0]), 1)}
+            for row, horizon in enumerate(SIGNAL_HORIZONS)
+        }
+        spread_pct = (emas[9][0] - emas[21][0]) / close[0] * 100
+        signal_data['probability_text'] = (
+            f"Local indicator model: EMA 9/21 spread of {spread_pct:+.3f}% of the close, EMA trend "
+            f"{features['ema_trend']}, RSI {features['rsi_14']} ({features['rsi_state']}). The short horizons "
+            f"follow the EMA 9/21 spread unless RSI is overbought or oversold; the long ones follow the "
+            f"EMA 9/21/50 alignment."
+        )
+        signal_data['risk_text'] = (
+            f"A rule-based estimate made without the AI analysis. Volatility over the last 20 candles is "
+            f"{features.get('volatility_pct_20')}%; confidence is capped at 90."
+        )
+        return signal_data
+
+    def generate_signals_batch(self, features_by_symbol: dict):
+        """Returns a dict mapping each symbol to its signal, like LiaraAIService.generate_signals_batch."""
+        return {symbol: self.generate_signal_from_features(features) for symbol, features in features_by_symbol.items()}
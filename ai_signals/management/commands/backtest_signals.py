@@ -0,0 +1,62 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_signals.backtesting import IndicatorPredictor, RecordedPredictor, run_backtest
+from market_data.models import Symbol
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays the stored 15-minute candles of symbols through a signal predictor and scores its "
+        "next/3rd/5th/10th candle directions against the closes that followed. Predictors: 'indicator' "
+        "(the local indicator model), 'signals' (the signals stored by the live pipeline) and 'file' "
+        "(recorded responses, see --responses)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('symbols', nargs='*', help="Symbol names; all active symbols if omitted.")
+        parser.add_argument('--days', type=int, default=365, help="Days of history to replay.")
+        parser.add_argument('--predictor', choices=['indicator', 'signals', 'file'], default='indicator')
+        parser.add_argument('--responses', metavar='FILE',
+                            help='JSON lines of {"symbol", "timestamp", "signal"} for the file predictor.')
+        parser.add_argument('--step', type=int, default=1, help="Predict every STEP-th candle.")
+        parser.add_argument('--workers', type=int, help="Worker processes; one per CPU by default.")
+        parser.add_argument('--json', action='store_true', help="Print the full report as JSON.")
+
+    def handle(self, *args, **options):
+        symbols = list(Symbol.objects.filter(name__in=options['symbols']) if options['symbols']
+                       else Symbol.objects.filter(is_active=True))
+        missing = set(options['symbols']) - {symbol.name for symbol in symbols}
+        if missing:
+            raise CommandError(f"Unknown symbols: {', '.join(sorted(missing))}")
+        if options['predictor'] == 'file' and not options['responses']:
+            raise CommandError("The file predictor needs --responses.")
+
+        if options['predictor'] == 'signals':
+            predictor = RecordedPredictor.from_signals(symbols)
+        elif options['predictor'] == 'file':
+            predictor = RecordedPredictor.from_file(options['responses'])
+        else:
+            predictor = IndicatorPredictor()
+
+        since = datetime.now(timezone.utc) - timedelta(days=options['days'])
+        result = run_backtest(symbols, predictor, since=since, step=options['step'], workers=options['workers'])
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+
+        for name, report in [*sorted(result['symbols'].items()), ('TOTAL', result['total'])]:
+            self.stdout.write(f"{name}: {report['candles']} candles")
+            for horizon, counts in report['horizons'].items():
+                self.stdout.write(f"  {horizon}: accuracy {_percent(counts['accuracy'])}, "
+                                  f"hit rate {_percent(counts['hit_rate'])} "
+                                  f"over {counts['predictions']} predictions")
+        self.stdout.write(self.style.SUCCESS(
+            f"Backtested {result['total']['candles']} candles of {len(result['symbols'])} symbols "
+            f"in {result['duration']}s."))
+
+
+def _percent(rate):
+    return '-' if rate is None else f"{rate * 100:.1f}%"
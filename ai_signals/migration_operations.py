@@ -0,0 +1,28 @@
+"""
+Data migrations for the signal table. The apps do not commit their migrations, so these are meant to be
+called from the generated ones; see "Upgrading an existing database" in the README.
+"""
+from django.db.models import OuterRef, Subquery
+
+
+def copy_candle_fields(apps, schema_editor):
+    """
+    RunPython operation filling Signal.symbol and Signal.timestamp from each signal's candle.
+    PostgreSQL joins the candles in one UPDATE ... FROM; other databases use a correlated subquery.
+    """
+    Signal = apps.get_model('ai_signals', 'Signal')
+    Candle = apps.get_model('market_data', 'Candle')
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        quote = schema_editor.quote_name
+        schema_editor.execute(
+            f"UPDATE {quote(Signal._meta.db_table)} AS s "
+            f"SET {quote('symbol_id')} = c.{quote('symbol_id')}, {quote('timestamp')} = c.{quote('timestamp')} "
+            f"FROM {quote(Candle._meta.db_table)} AS c WHERE c.{quote('id')} = s.{quote('candle_id')}"
+        )
+    else:
+        candle = Candle.objects.using(connection.alias).filter(pk=OuterRef('candle_id'))
+        Signal.objects.using(connection.alias).update(
+            symbol_id=Subquery(candle.values('symbol_id')[:1]),
+            timestamp=Subquery(candle.values('timestamp')[:1]),
+        )
@@ -1,5 +1,5 @@
 from django.db import models
-from market_data.models import Candle
+from market_data.models import Symbol, Candle
 
 
 class Signal(models.Model):
@@ -13,7 +13,14 @@ class Signal(models.Model):
         BEARISH = 'BEARISH', 'Bearish'
         NEUTRAL = 'NEUTRAL', 'Neutral'
 
+    class Source(models.TextChoices):
+        LLM = 'llm', 'LLM'
+        LOCAL = 'local', 'Local model'
+
     candle = models.OneToOneField(Candle, on_delete=models.CASCADE, related_name='signal')
+    # Copied from the candle, so the latest signal of a symbol is a single index seek without a join
+    symbol = models.ForeignKey(Symbol, on_delete=models.CASCADE, related_name='signals', editable=False)
+    timestamp = models.DateTimeField(editable=False, help_text="The start time of the candle")
 
     # --- Predictions for 4 timeframes ---
     direction_next_candle = models.CharField(max_length=10, choices=SignalDirection.choices)
@@ -28,6 +35,17 @@ class Signal(models.Model):
     direction_10th_candle = models.CharField(max_length=10, choices=SignalDirection.choices)
     confidence_10th_candle = models.DecimalField(max_digits=5, decimal_places=2)
 
+    # --- Realised directions, marked by the outcome evaluator as each horizon's candle closes ---
+    outcome_next_candle = models.CharField(max_length=10, choices=SignalDirection.choices, null=True, editable=False)
+    outcome_3rd_candle = models.CharField(max_length=10, choices=SignalDirection.choices, null=True, editable=False)
+    outcome_5th_candle = models.CharField(max_length=10, choices=SignalDirection.choices, null=True, editable=False)
+    outcome_10th_candle = models.CharField(max_length=10, choices=SignalDirection.choices, null=True, editable=False)
+    # Horizons evaluated so far, in order; an outcome whose candle never arrived stays empty
+    horizons_evaluated = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    # The model that produced the signal: the LLM, or the local model standing in for it
+    source = models.CharField(max_length=10, choices=Source.choices, default=Source.LLM)
+
     # --- AI-generated textual analysis ---
     probability_text = models.TextField()
     risk_text = models.TextField()
@@ -35,7 +53,43 @@ class Signal(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Signal for {self.candle.symbol.name} @ {self.candle.timestamp}"
+        return f"Signal for {self.symbol.name} @ {self.timestamp}"
+
+    def save(self, *args, **kwargs):
+        self.symbol_id = self.candle.symbol_id
+        self.timestamp = self.candle.timestamp
+        super().save(*args, **kwargs)
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            # Latest signal per symbol, and DISTINCT ON (symbol) for the latest of every symbol
+            models.Index(fields=['symbol', '-timestamp'], name='signal_symbol_ts_desc'),
+            # Signals still awaiting an outcome, for the evaluator; fully evaluated signals drop out of it
+            models.Index(fields=['horizons_evaluated', 'timestamp'], name='signal_pending_outcome',
+                         condition=models.Q(horizons_evaluated__lt=4)),
+        ]
+
+
+class SignalAccuracy(models.Model):
+    """
+    Materialised accuracy counters of the evaluated signals, per symbol, horizon and confidence bucket.
+    The outcome evaluator only ever increments them, so reading accuracy never touches signals or candles.
+    """
+    symbol = models.ForeignKey(Symbol, on_delete=models.CASCADE, related_name='signal_accuracy')
+    horizon = models.CharField(max_length=20)
+    confidence_bucket = models.PositiveSmallIntegerField(help_text="Lower bound of the 10-point confidence bucket")
+
+    predictions = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    # BULLISH/BEARISH calls, and those that got the sign of the move right
+    directional = models.PositiveIntegerField(default=0)
+    hits = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.symbol.name} {self.horizon} {self.confidence_bucket}+: {self.correct}/{self.predictions}"
 
     class Meta:
-        ordering = ['-candle__timestamp']
+        constraints = [
+            models.UniqueConstraint(fields=['symbol', 'horizon', 'confidence_bucket'], name='signal_accuracy_unique'),
+        ]
@@ -0,0 +1,182 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from market_data.aggregation import BASE_INTERVAL
+from market_data.models import Candle
+from market_data.services import INTERVAL_SECONDS
+from .backtesting import HORIZON_CANDLES, NEUTRAL_BAND
+from .models import Signal, SignalAccuracy
+from .services import SIGNAL_HORIZONS
+
+logger = logging.getLogger(__name__)
+
+# Signals evaluated and committed together
+EVALUATION_BATCH_SIZE = 1000
+# How long an evaluated horizon waits for a missing candle (e.g. an ingestion gap) before its outcome is given up
+OUTCOME_GRACE = timedelta(hours=6)
+
+HORIZON_SUFFIXES = dict(zip(SIGNAL_HORIZONS, ('next', '3rd', '5th', '10th')))
+COUNTER_FIELDS = ('predictions', 'correct', 'directional', 'hits')
+OUTCOME_FIELDS = [f"outcome_{suffix}_candle" for suffix in HORIZON_SUFFIXES.values()]
+
+
+def confidence_bucket(confidence) -> int:
+    """The lower bound of the 10-point bucket a confidence falls in; 100 shares the 90 bucket."""
+    return min(int(confidence) // 10 * 10, 90)
+
+
+def realised_direction(close: float, target_close: float, neutral_band: float = NEUTRAL_BAND):
+    """The direction the close moved from `close` to `target_close`, NEUTRAL within the band."""
+    change = target_close / close - 1
+    if change > neutral_band:
+        return Signal.SignalDirection.BULLISH
+    if change < -neutral_band:
+        return Signal.SignalDirection.BEARISH
+    return Signal.SignalDirection.NEUTRAL
+
+
+def due_signals(now: datetime, step: timedelta):
+    """The signals whose next horizon to evaluate has closed by `now`."""
+    condition = Q()
+    for evaluated, ahead in enumerate(HORIZON_CANDLES.values()):
+        # The horizon's candle starts `ahead` candles after the signal's and closes one candle later
+        condition |= Q(horizons_evaluated=evaluated, timestamp__lte=now - (ahead + 1) * step)
+    # Repeats the index condition, so the planner can tell the pending-outcome index covers the query
+    return Signal.objects.filter(condition, horizons_evaluated__lt=len(SIGNAL_HORIZONS))
+
+
+def _evaluate_batch(signals: list, now: datetime, step: timedelta, summary: dict):
+    """
+    Marks the outcome of every closed horizon of the signals and returns the counter increments,
+    keyed by (symbol id, horizon, confidence bucket). The closes are read with one query.
+    """
+    wanted = {signal.timestamp + ahead * step for signal in signals for ahead in (0, *HORIZON_CANDLES.values())}
+    closes = {
+        (symbol_id, timestamp): close for symbol_id, timestamp, close in Candle.objects.filter(
+            symbol_id__in={signal.symbol_id for signal in signals}, interval=BASE_INTERVAL, timestamp__in=wanted,
+        ).values_list('symbol_id', 'timestamp', 'close')
+    }
+
+    increments = {}
+    changed = []
+    for signal in signals:
+        evaluated = signal.horizons_evaluated
+        base = closes.get((signal.symbol_id, signal.timestamp))
+        for horizon in SIGNAL_HORIZONS[signal.horizons_evaluated:]:
+            ahead = HORIZON_CANDLES[horizon]
+            closed_at = signal.timestamp + (ahead + 1) * step
+            if closed_at > now:
+                break
+            target = closes.get((signal.symbol_id, signal.timestamp + ahead * step))
+            if base is None or target is None:
+                if now - closed_at < OUTCOME_GRACE:
+                    break
+                summary['missing'] += 1
+            else:
+                suffix = HORIZON_SUFFIXES[horizon]
+                predicted = getattr(signal, f"direction_{suffix}_candle")
+                outcome = realised_direction(base, target)
+                setattr(signal, f"outcome_{suffix}_candle", outcome)
+                key = (signal.symbol_id, horizon, confidence_bucket(getattr(signal, f"confidence_{suffix}_candle")))
+                counts = increments.setdefault(key, dict.fromkeys(COUNTER_FIELDS, 0))
+                counts['predictions'] += 1
+                counts['correct'] += predicted == outcome
+                counts['directional'] += predicted != Signal.SignalDirection.NEUTRAL
+                counts['hits'] += predicted != Signal.SignalDirection.NEUTRAL and predicted == outcome
+                summary['outcomes'] += 1
+            signal.horizons_evaluated += 1
+        if signal.horizons_evaluated != evaluated:
+            changed.append(signal)
+
+    Signal.objects.bulk_update(changed, fields=[*OUTCOME_FIELDS, 'horizons_evaluated'])
+    summary['signals'] += len(changed)
+    return increments
+
+
+def _increment_counters(increments: dict):
+    """
+    Adds the increments to the accuracy counters. Missing counter rows are created first, and rows
+    are updated in key order, so concurrent evaluators neither collide on inserts nor deadlock.
+    """
+    keys = sorted(increments)
+    SignalAccuracy.objects.bulk_create([
+        SignalAccuracy(symbol_id=symbol_id, horizon=horizon, confidence_bucket=bucket)
+        for symbol_id, horizon, bucket in keys
+    ], ignore_conflicts=True)
+    for symbol_id, horizon, bucket in keys:
+        SignalAccuracy.objects.filter(symbol_id=symbol_id, horizon=horizon, confidence_bucket=bucket).update(**{
+            name: F(name) + value for name, value in increments[(symbol_id, horizon, bucket)].items()
+        })
+
+
+def evaluate_outcomes(now: datetime = None, batch_size: int = EVALUATION_BATCH_SIZE):
+    """
+    Scores the signals whose horizon candles have closed since the last run. Each horizon is evaluated
+    once, in order: its realised direction is stored on the signal and the accuracy counters of its
+    symbol, horizon and confidence bucket are incremented in the same transaction, so a signal is never
+    counted twice. Only signals with a horizon due are read, through the pending-outcome index, in
+    batches locked with SKIP LOCKED so evaluators running at the same time split the work.
+    Returns a summary dict with the number of signals updated, outcomes marked and outcomes given up.
+    """
+    started_at = time.monotonic()
+    now = now or datetime.now(timezone.utc)
+    step = timedelta(seconds=INTERVAL_SECONDS[BASE_INTERVAL])
+    summary = {'signals': 0, 'outcomes': 0, 'missing': 0}
+    after = Q()
+    while True:
+        with transaction.atomic():
+            signals = list(
+                due_signals(now, step).filter(after).order_by('timestamp', 'id')
+                .select_for_update(skip_locked=True)[:batch_size]
+            )
+            if not signals:
+                break
+            _increment_counters(_evaluate_batch(signals, now, step, summary))
+        # Signals still waiting for a late candle stay due; continue after this batch rather than re-reading them
+        last = signals[-1]
+        after = Q(timestamp__gt=last.timestamp) | Q(timestamp=last.timestamp, id__gt=last.id)
+        if len(signals) < batch_size:
+            break
+
+    summary['duration'] = round(time.monotonic() - started_at, 3)
+    logger.info(f"Marked {summary['outcomes']} signal outcomes on {summary['signals']} signals "
+                f"({summary['missing']} without candles) in {summary['duration']}s.")
+    return summary
+
+
+def _add_rates(counts: dict):
+    counts['accuracy'] = round(counts['correct'] / counts['predictions'], 4) if counts['predictions'] else None
+    counts['hit_rate'] = round(counts['hits'] / counts['directional'], 4) if counts['directional'] else None
+    return counts
+
+
+def accuracy_stats(symbol_id: int = None):
+    """
+    Reads the accuracy counters of one symbol, or of all symbols added up, as
+    {horizon: {counts, accuracy, hit_rate, 'buckets': {'70-80': {counts, accuracy, hit_rate}}}}.
+    A symbol has at most one counter row per horizon and bucket, so this is a bounded read.
+    """
+    counters = SignalAccuracy.objects.all()
+    if symbol_id is not None:
+        counters = counters.filter(symbol_id=symbol_id)
+
+    stats = {horizon: {**dict.fromkeys(COUNTER_FIELDS, 0), 'buckets': {}} for horizon in SIGNAL_HORIZONS}
+    for horizon, bucket, *values in counters.order_by('horizon', 'confidence_bucket').values_list(
+            'horizon', 'confidence_bucket', *COUNTER_FIELDS):
+        if horizon not in stats:
+            continue
+        buckets = stats[horizon]['buckets']
+        counts = buckets.setdefault(f"{bucket}-{bucket + 10}", dict.fromkeys(COUNTER_FIELDS, 0))
+        for name, value in zip(COUNTER_FIELDS, values):
+            counts[name] += value
+            stats[horizon][name] += value
+
+    for horizon_stats in stats.values():
+        _add_rates(horizon_stats)
+        for counts in horizon_stats['buckets'].values():
+            _add_rates(counts)
+    return stats
@@ -1,14 +1,124 @@
-from django.core.cache import cache
-import json
+import gzip
+import hashlib
 
+from django_redis import get_redis_connection
+from rest_framework.renderers import JSONRenderer
 
-def cache_latest_signal(symbol_name: str, signal_data: dict):
-    key = f"signal:{symbol_name}"
-    # Use Django's cache.set with a timeout of 1 day
-    cache.set(key, signal_data, timeout=86400)
+from .serializers import SignalSerializer
+
+# The entry is replaced whenever a newer signal is saved; the TTL only drops symbols that stopped updating
+SIGNAL_PAYLOAD_TTL = 86400
+# How long a symbol with no signal yet is remembered as such
+NO_SIGNAL_TTL = 60
+# Bodies at least this large are also stored gzip-compressed
+COMPRESS_MIN_BYTES = 512
+
+
+# Replaces a symbol's payload unless the cached one belongs to a newer signal, ordered by
+# (candle time, signal id). ARGV: candle time, signal id, TTL, then the payload's field/value pairs
+_REPLACE_PAYLOAD = """
+local cached = redis.call('HMGET', KEYS[1], 'version', 'signal_id')
+if cached[1] then
+    local version, signal_id = tonumber(cached[1]), tonumber(cached[2])
+    local new_version, new_signal_id = tonumber(ARGV[1]), tonumber(ARGV[2])
+    if version > new_version or (version == new_version and signal_id > new_signal_id) then
+        return 0
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'version', ARGV[1], 'signal_id', ARGV[2], unpack(ARGV, 4))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+# Marks a symbol as having no signal only if nothing is cached for it, so a payload stored in the
+# meantime keeps its fields and its TTL
+_MARK_MISSING = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], 'missing', 1)
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+"""
+
+
+# Hash fields stored next to a payload that are not part of it
+_BOOKKEEPING_FIELDS = {b'missing', b'version', b'signal_id'}
+
+
+def _payload_key(symbol_name: str):
+    return f"signal-payload:{symbol_name}"
+
+
+def build_signal_payload(signal):
+    """
+    Renders a signal once into the response body served for its symbol.
+    Returns a dict with the JSON `body`, its `etag` (the candle time plus a digest of the body)
+    and, for larger bodies, a `body_gzip` copy.
+    """
+    body = JSONRenderer().render(SignalSerializer(instance=signal).data)
+    version = int(signal.timestamp.timestamp())
+    payload = {'body': body, 'etag': f'"{version}-{hashlib.sha1(body).hexdigest()[:16]}"'}
+    if len(body) >= COMPRESS_MIN_BYTES:
+        payload['body_gzip'] = gzip.compress(body, compresslevel=6)
+    return payload
+
+
+def cache_latest_signals(signals):
+    """
+    Stores rendered signals as their symbols' latest, replacing the previous ones, in one pipeline.
+    The payloads are kept as raw bytes in Redis hashes, so serving them needs no unpickling or rendering.
+    A signal older than the cached one is not stored, so a slow cache fill cannot undo a newer signal.
+    Returns {symbol name: payload}.
+    """
+    payloads = {}
+    connection = get_redis_connection('default')
+    replace_payload = connection.register_script(_REPLACE_PAYLOAD)
+    pipeline = connection.pipeline()
+    for signal in signals:
+        symbol_name = signal.symbol.name
+        payloads[symbol_name] = build_signal_payload(signal)
+        fields = [item for field_value in payloads[symbol_name].items() for item in field_value]
+        replace_payload(keys=[_payload_key(symbol_name)],
+                        args=[int(signal.timestamp.timestamp()), signal.pk, SIGNAL_PAYLOAD_TTL, *fields],
+                        client=pipeline)
+    pipeline.execute()
+    return payloads
+
+
+def cache_latest_signal(signal):
+    """Stores a rendered signal as its symbol's latest. Returns the payload."""
+    return cache_latest_signals([signal])[signal.symbol.name]
+
+
+def cache_missing_signals(symbol_names: list):
+    """Remembers for a short while that the symbols have no signal, so repeated bulk reads skip the database."""
+    connection = get_redis_connection('default')
+    mark_missing = connection.register_script(_MARK_MISSING)
+    pipeline = connection.pipeline(transaction=False)
+    for symbol_name in symbol_names:
+        mark_missing(keys=[_payload_key(symbol_name)], args=[NO_SIGNAL_TTL], client=pipeline)
+    pipeline.execute()
+
+
+def get_cached_latest_signals(symbol_names: list):
+    """
+    Returns {symbol name: payload} for the symbols whose latest signal is cached, in one round trip.
+    Symbols known to have no signal map to None; symbols that are not cached are left out.
+    """
+    pipeline = get_redis_connection('default').pipeline(transaction=False)
+    for symbol_name in symbol_names:
+        pipeline.hgetall(_payload_key(symbol_name))
+    payloads = {}
+    for symbol_name, entry in zip(symbol_names, pipeline.execute()):
+        if b'body' in entry:
+            payload = {field.decode(): value for field, value in entry.items() if field not in _BOOKKEEPING_FIELDS}
+            payload['etag'] = payload['etag'].decode()
+            payloads[symbol_name] = payload
+        elif entry:
+            payloads[symbol_name] = None
+    return payloads
 
 
 def get_cached_latest_signal(symbol_name: str):
-    key = f"signal:{symbol_name}"
-    # Use Django's cache.get
-    return cache.get(key)
+    """Returns the cached payload of a symbol's latest signal, or None."""
+    return get_cached_latest_signals([symbol_name]).get(symbol_name)
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import logging
+import time
+
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# How long an identical request is answered from the cache
+LLM_CACHE_TTL = 3600
+# Entries kept before the least recently used ones are evicted
+LLM_CACHE_MAX_ENTRIES = 10000
+
+_PREFIX = 'llm-cache'
+
+
+def prompt_version(*templates):
+    """A short digest of the prompt templates (and schemas) a request is built from."""
+    return hashlib.sha256(json.dumps(templates, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def request_digest(model: str, version: str, payload):
+    """Content address of a request: the model, the prompt version and the canonicalised input."""
+    canonical = json.dumps([model, version, payload], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    A Redis cache of parsed LLM responses keyed by request digest.
+    Each entry expires after `ttl` seconds; a sorted set of last-access times bounds the number
+    of entries, evicting the least recently used ones. Hits and misses are counted in Redis so
+    the hit rate covers every process.
+    """
+
+    def __init__(self, ttl: int = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES, alias: str = 'default'):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.alias = alias
+        self._lru_key = f"{_PREFIX}:lru"
+        self._hits_key = f"{_PREFIX}:hits"
+        self._misses_key = f"{_PREFIX}:misses"
+
+    @property
+    def connection(self):
+        return get_redis_connection(self.alias)
+
+    def _entry_key(self, digest: str):
+        return f"{_PREFIX}:entry:{digest}"
+
+    def get(self, digest: str):
+        """Returns the cached response, or None on a miss."""
+        connection = self.connection
+        value = connection.get(self._entry_key(digest))
+        pipeline = connection.pipeline(transaction=False)
+        if value is None:
+            pipeline.incr(self._misses_key)
+        else:
+            pipeline.incr(self._hits_key)
+            pipeline.zadd(self._lru_key, {digest: time.time()})
+        pipeline.execute()
+        return None if value is None else json.loads(value)
+
+    def set(self, digest: str, response):
+        """Stores a response and evicts the least recently used entries beyond the size bound."""
+        connection = self.connection
+        now = time.time()
+        pipeline = connection.pipeline(transaction=False)
+        pipeline.set(self._entry_key(digest), json.dumps(response), ex=self.ttl)
+        pipeline.zadd(self._lru_key, {digest: now})
+        # Entries not read within the TTL have expired on their own
+        pipeline.zremrangebyscore(self._lru_key, '-inf', now - self.ttl)
+        pipeline.zcard(self._lru_key)
+        size = pipeline.execute()[-1]
+        if size > self.max_entries:
+            evicted = [member.decode() for member, _ in connection.zpopmin(self._lru_key, size - self.max_entries)]
+            connection.delete(*(self._entry_key(digest) for digest in evicted))
+
+    def stats(self):
+        """Returns the hit/miss counters, the hit rate and the number of entries."""
+        hits, misses = (int(value or 0) for value in self.connection.mget(self._hits_key, self._misses_key))
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+            'entries': self.connection.zcard(self._lru_key),
+        }
+
+    def clear(self):
+        connection = self.connection
+        digests = [member.decode() for member in connection.zrange(self._lru_key, 0, -1)]
+        connection.delete(self._lru_key, self._hits_key, self._misses_key,
+                          *(self._entry_key(digest) for digest in digests))
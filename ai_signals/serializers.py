@@ -8,8 +8,8 @@ class SignalSerializer(serializers.ModelSerializer):
     and for caching in Redis.
     """
     # To show the candle's timestamp and symbol name in the response
-    timestamp = serializers.DateTimeField(source='candle.timestamp', read_only=True)
-    symbol = serializers.CharField(source='candle.symbol.name', read_only=True)
+    timestamp = serializers.DateTimeField(read_only=True)
+    symbol = serializers.CharField(source='symbol.name', read_only=True)
 
     class Meta:
         model = Signal
@@ -19,5 +19,5 @@ class SignalSerializer(serializers.ModelSerializer):
             'direction_3rd_candle', 'confidence_3rd_candle',
             'direction_5th_candle', 'confidence_5th_candle',
             'direction_10th_candle', 'confidence_10th_candle',
-            'probability_text', 'risk_text',
+            'probability_text', 'risk_text', 'source',
         ]
@@ -1,63 +1,213 @@
+import asyncio
 import json
 import logging
-import os
-from openai import OpenAI, OpenAIError
+from openai import OpenAIError
 
-# The final, advanced prompt
-AI_SYSTEM_PROMPT = """
+from .executor import get_llm_executor, CircuitOpenError
+from .models import Signal
+from .response_cache import LLMResponseCache, prompt_version, request_digest
+
+# Number of symbols packed into one batched signal request
+SIGNAL_BATCH_SIZE = 20
+SIGNAL_HORIZONS = ('next_candle', 'third_candle', 'fifth_candle', 'tenth_candle')
+# Seconds a caller waits for the LLM's signals before giving up on them, well within one 15-minute candle
+LLM_SIGNAL_TIMEOUT = 60.0
+
+_ANALYSIS_PROMPT = """
 You are a world-class technical analysis AI for financial markets, specializing in cryptocurrency on a 15-minute timeframe. Your entire analysis must be objective, data-driven, and contain no financial advice.
 
-You will receive a JSON array of the last 100 15-minute candles for a specific crypto asset.
+You will receive a JSON object of indicators precomputed from the last 15-minute candles of a specific crypto asset:
+-   `close`, `change_pct` (price change over the last 1, 4, 16 and 96 candles) and `recent_closes` (oldest first).
+-   **Trend:** `ema` (EMA 9, 21, 50), `ema_trend` and `ema_9_21_crossover`.
+-   **Momentum:** `rsi_14` and `rsi_state`.
+-   **Price Action:** `patterns` (candlestick patterns of the last candles), `support` and `resistance` (nearest swing levels).
+-   **Activity:** `volume_ratio_20` (last volume over the 20-candle average) and `volatility_pct_20`.
 
-Your task is to perform a comprehensive technical analysis by synthesizing signals from multiple strategies:
-1.  **Trend Analysis:** Use Exponential Moving Averages (e.g., EMA 9, 21, 50).
-2.  **Momentum Analysis:** Use the Relative Strength Index (RSI 14).
-3.  **Price Action:** Identify key Candlestick Patterns and Support/Resistance levels.
+Your task is to perform a comprehensive technical analysis by synthesizing these trend, momentum and price action signals. Do not recompute the indicators; rely on the values provided.
 
 Based on your synthesis, you MUST provide four distinct predictions for the following timeframes:
 -   Next Candle (15 minutes)
 -   3rd Next Candle (45 minutes)
 -   5th Next Candle (1 an hour and 15 minutes)
 -   10th Next Candle (2.5 hours)
+"""
 
-Your final output MUST be a single, valid JSON object and nothing else. The JSON object must have the following keys:
-
-{
+_SIGNAL_FORMAT = """{
   "next_candle": {"direction": "BULLISH" or "BEARISH" or "NEUTRAL", "confidence": <0-100>},
   "third_candle": {"direction": "BULLISH" or "BEARISH" or "NEUTRAL", "confidence": <0-100>},
   "fifth_candle": {"direction": "BULLISH" or "BEARISH" or "NEUTRAL", "confidence": <0-100>},
   "tenth_candle": {"direction": "BULLISH" or "BEARISH" or "NEUTRAL", "confidence": <0-100>},
   "probability_text": "A concise text explaining the primary reasons for your predictions. Mention the key indicators (e.g., 'The short-term bullish outlook is driven by a recent EMA crossover...')",
   "risk_text": "A concise text stating the primary risks or conflicting signals. (e.g., 'The main risk is the strong resistance at $68,500. A bearish divergence on the RSI could invalidate the bullish signals.')"
-}
+}"""
 
-Now, analyze the following candle data:
+# The final, advanced prompt
+AI_SYSTEM_PROMPT = f"""{_ANALYSIS_PROMPT}
+Your final output MUST be a single, valid JSON object and nothing else. The JSON object must have the following keys:
+
+{_SIGNAL_FORMAT}
+
+Now, analyze the following indicators:
+"""
+
+# The same analysis for several assets in one request
+AI_BATCH_SYSTEM_PROMPT = f"""{_ANALYSIS_PROMPT}
+You will receive several assets at once, as a JSON object mapping each symbol to its indicators. Analyze every asset independently.
+
+Your final output MUST be a single, valid JSON object and nothing else, with exactly one key per symbol. The value of each symbol must be an object with the following keys:
+
+{_SIGNAL_FORMAT}
+
+Now, analyze the following assets:
 """
 
+_HORIZON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "direction": {"type": "string", "enum": list(Signal.SignalDirection.values)},
+        "confidence": {"type": "number"},
+    },
+    "required": ["direction", "confidence"],
+    "additionalProperties": False,
+}
+
+SIGNAL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        **{horizon: _HORIZON_SCHEMA for horizon in SIGNAL_HORIZONS},
+        "probability_text": {"type": "string"},
+        "risk_text": {"type": "string"},
+    },
+    "required": [*SIGNAL_HORIZONS, "probability_text", "risk_text"],
+    "additionalProperties": False,
+}
+
+
+# Cached responses are tied to the exact prompts they were generated with
+SIGNAL_PROMPT_VERSION = prompt_version(AI_SYSTEM_PROMPT)
+BATCH_PROMPT_VERSION = prompt_version(AI_BATCH_SYSTEM_PROMPT, SIGNAL_SCHEMA)
+
+
+def validate_signal(signal_data):
+    """Returns True if a model response has a valid direction and confidence for every horizon and both texts."""
+    if not isinstance(signal_data, dict):
+        return False
+    for horizon in SIGNAL_HORIZONS:
+        prediction = signal_data.get(horizon)
+        if not isinstance(prediction, dict) or prediction.get('direction') not in Signal.SignalDirection.values:
+            return False
+        confidence = prediction.get('confidence')
+        if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0 <= confidence <= 100:
+            return False
+    return all(isinstance(signal_data.get(key), str) and signal_data[key] for key in ('probability_text', 'risk_text'))
+
 
 class LiaraAIService:
+    """
+    Generates trading signals with the LLM.
+    Calls go through the process-wide LLM executor, so every instance shares one async client,
+    its concurrency and rate limits, and its circuit breaker. Valid responses are cached by
+    request digest, so a retried or duplicated job does not pay for the same completion twice.
+    """
+
     def __init__(self):
-        # ... (init method remains the same)
-        api_key = os.environ.get('LIARA_API_KEY')
-        base_url = os.environ.get('LIARA_BASE_URL')
-        if not api_key or not base_url:
-            raise ValueError("LIARA_API_KEY and LIARA_BASE_URL must be set.")
-        self.client = OpenAI(base_url=base_url, api_key=api_key)
+        self.executor = get_llm_executor()
         self.model = "openai/gpt-4o-mini"
+        self.response_cache = LLMResponseCache()
+
+    def generate_signal_from_features(self, features: dict):
+        """
+        Asks the model for a signal based on the indicator summary of market_data.indicators.
+        The summary is a few hundred characters instead of 100 raw candles, which keeps the
+        prompt small and leaves the arithmetic to NumPy.
+        Raises CircuitOpenError while the circuit is open, and concurrent.futures.TimeoutError
+        when no answer arrives within LLM_SIGNAL_TIMEOUT seconds.
+        """
+        return self.executor.run(self._request_signal(features), timeout=LLM_SIGNAL_TIMEOUT)
 
-    def generate_signal_from_candles(self, candles_data: list):
-        # ... (API call logic remains the same)
-        if len(candles_data) < 100:
+    def generate_signals_batch(self, features_by_symbol: dict):
+        """
+        Generates signals for many symbols with one request per SIGNAL_BATCH_SIZE symbols.
+        The response is constrained to a JSON schema keyed by symbol and each result is
+        validated on its own; only the symbols whose result is missing or invalid are
+        retried with an individual request. The requests of each stage run concurrently.
+        Returns a dict mapping each symbol to its signal, or None if it could not be generated.
+        Raises like `generate_signal_from_features` when the LLM is unavailable.
+        """
+        return self.executor.run(self._request_signals_batch(features_by_symbol), timeout=LLM_SIGNAL_TIMEOUT)
+
+    async def _request_signal(self, features: dict):
+        if not features:
             return None
-        candles_json_string = json.dumps(candles_data, default=str)
-        prompt_content = f"{AI_SYSTEM_PROMPT}\n{candles_json_string}"
+        features_json_string = json.dumps(features, separators=(',', ':'))
+        prompt_content = f"{AI_SYSTEM_PROMPT}\n{features_json_string}"
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
+            return await self._complete_json(
+                SIGNAL_PROMPT_VERSION, features, validate_signal,
                 messages=[{"role": "user", "content": prompt_content}],
                 response_format={"type": "json_object"}
             )
-            return json.loads(completion.choices[0].message.content)
+        except CircuitOpenError:
+            raise
         except (OpenAIError, json.JSONDecodeError) as e:
             logging.error(f"An error occurred during AI signal generation: {e}")
             return None
+
+    async def _request_signals_batch(self, features_by_symbol: dict):
+        symbols = [symbol for symbol, features in features_by_symbol.items() if features]
+        chunks = [symbols[start:start + SIGNAL_BATCH_SIZE] for start in range(0, len(symbols), SIGNAL_BATCH_SIZE)]
+        results = {}
+        for chunk_results in await asyncio.gather(*(
+                self._request_batch({symbol: features_by_symbol[symbol] for symbol in chunk})
+                for chunk in chunks if len(chunk) > 1)):
+            results.update(chunk_results)
+
+        failed = [symbol for symbol in symbols if not validate_signal(results.get(symbol))]
+        if failed and len(symbols) > 1:
+            logging.warning(f"Batched signal generation failed for {len(failed)} of {len(symbols)} symbols; "
+                            f"retrying them individually.")
+        retried = await asyncio.gather(*(self._request_signal(features_by_symbol[symbol]) for symbol in failed))
+        for symbol, signal_data in zip(failed, retried):
+            results[symbol] = signal_data if validate_signal(signal_data) else None
+        return {symbol: results.get(symbol) for symbol in features_by_symbol}
+
+    async def _request_batch(self, features_by_symbol: dict):
+        """Makes one batched request. Returns the parsed response, or an empty dict on error."""
+        features_json_string = json.dumps(features_by_symbol, separators=(',', ':'))
+        schema = {
+            "type": "object",
+            "properties": {symbol: SIGNAL_SCHEMA for symbol in features_by_symbol},
+            "required": list(features_by_symbol),
+            "additionalProperties": False,
+        }
+        try:
+            results = await self._complete_json(
+                BATCH_PROMPT_VERSION, features_by_symbol, lambda results: isinstance(results, dict),
+                messages=[{"role": "user", "content": f"{AI_BATCH_SYSTEM_PROMPT}\n{features_json_string}"}],
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": {"name": "signals", "schema": schema, "strict": True},
+                }
+            )
+            return results if isinstance(results, dict) else {}
+        except CircuitOpenError:
+            raise
+        except (OpenAIError, json.JSONDecodeError) as e:
+            logging.error(f"An error occurred during batched AI signal generation: {e}")
+            return {}
+
+    async def _complete_json(self, version: str, payload, is_valid, **kwargs):
+        """
+        Returns the parsed JSON response of a completion, from the response cache when the same
+        model, prompt version and input were requested before. Only responses passing `is_valid` are cached.
+        The cache is read and written in a worker thread: this runs on the executor loop, which every
+        LLM call in the process shares, and the Redis client blocks.
+        """
+        digest = request_digest(self.model, version, payload)
+        cached = await asyncio.to_thread(self.response_cache.get, digest)
+        if cached is not None:
+            return cached
+        result = json.loads(await self.executor.complete(self.model, **kwargs))
+        if is_valid(result):
+            await asyncio.to_thread(self.response_cache.set, digest, result)
+        return result
@@ -1,75 +1,128 @@
 from celery import shared_task
 from market_data.models import Candle
+from market_data.indicators import get_features
+from market_data.events import publish_event, SIGNAL_EVENT
 from .models import Signal
-from .services import LiaraAIService
-from .serializers import SignalSerializer
+from .executor import backoff_delay, UNAVAILABLE_ERRORS
+from .services import LiaraAIService, validate_signal
+from .local_model import LocalSignalModel
 from .redis_client import cache_latest_signal
+from .outcomes import evaluate_outcomes
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Task retries back off exponentially with jitter, so a cohort of failed jobs does not retry in lockstep
+RETRY_BACKOFF_BASE = 30
+RETRY_BACKOFF_CAP = 900
 
-@shared_task(bind=True, max_retries=3, default_retry_delay=60)
-def generate_signal_for_candle(self, candle_id: int):
+
+def _retry_countdown(task):
+    return backoff_delay(task.request.retries, base=RETRY_BACKOFF_BASE, cap=RETRY_BACKOFF_CAP)
+
+
+def _skip_reason(candle: Candle):
+    """Returns why no signal should be generated for a candle, or None if one should."""
+    if Signal.objects.filter(candle=candle).exists():
+        return f"Signal already exists for {candle}. Skipping."
+    # A newer candle has closed since this job was queued; its own job supersedes this one
+    latest = candle.symbol.last_candle_at
+    if candle.interval == Candle.Interval.FIFTEEN_MINUTES and latest and candle.timestamp < latest:
+        return f"A newer candle exists for {candle.symbol.name}. Skipping stale {candle}."
+    return None
+
+
+def _candle_features(candle: Candle):
+    """Indicators up to this candle, computed from the shared candle buffer."""
+    return get_features(candle.symbol.name, candle.interval, until=int(candle.timestamp.timestamp()))
+
+
+def _save_signal(candle: Candle, signal_data: dict, source: str = Signal.Source.LLM):
     """
-    A robust task that calls the AI, parses the new multi-timeframe response,
-    and saves it to the updated Signal model.
+    Parses the multi-timeframe AI response, saves it as a Signal tagged with its source and caches it
+    as the symbol's latest. Returns the new Signal, or None if the response is not a valid signal.
     """
-    try:
-        candle = Candle.objects.select_related('symbol').get(id=candle_id)
-        if Signal.objects.filter(candle=candle).exists():
-            return f"Signal already exists for {candle}. Skipping."
-
-        # Fetching data logic remains the same
-        candles_for_ai = Candle.objects.filter(
-            symbol=candle.symbol, timestamp__lte=candle.timestamp
-        ).order_by('-timestamp')[:100]
-        if len(candles_for_ai) < 100:
-            return f"Not enough historical data for {candle.symbol.name}."
-        candle_data_list = list(candles_for_ai.values('open', 'high', 'low', 'close', 'volume', 'timestamp'))
+    # A confidence of 0 is valid, so the response is checked with the validator rather than by truthiness
+    if not validate_signal(signal_data):
+        logger.error(f"Invalid signal data received from AI for {candle}: {signal_data}")
+        return None
 
-        ai_service = LiaraAIService()
-        signal_data = ai_service.generate_signal_from_candles(candle_data_list)
+    # --- This is the new, robust parsing logic ---
+    # It safely extracts data from the nested JSON response.
+    next_candle_data = signal_data.get('next_candle', {})
+    third_candle_data = signal_data.get('third_candle', {})
+    fifth_candle_data = signal_data.get('fifth_candle', {})
+    tenth_candle_data = signal_data.get('tenth_candle', {})
 
-        if not signal_data:
-            logger.error(f"AI service failed to generate a signal for {candle}.")
-            raise self.retry()
+    final_signal_data = {
+        'direction_next_candle': next_candle_data.get('direction'),
+        'confidence_next_candle': next_candle_data.get('confidence'),
 
-        # --- This is the new, robust parsing logic ---
-        # It safely extracts data from the nested JSON response.
-        next_candle_data = signal_data.get('next_candle', {})
-        third_candle_data = signal_data.get('third_candle', {})
-        fifth_candle_data = signal_data.get('fifth_candle', {})
-        tenth_candle_data = signal_data.get('tenth_candle', {})
+        'direction_3rd_candle': third_candle_data.get('direction'),
+        'confidence_3rd_candle': third_candle_data.get('confidence'),
 
-        final_signal_data = {
-            'direction_next_candle': next_candle_data.get('direction'),
-            'confidence_next_candle': next_candle_data.get('confidence'),
+        'direction_5th_candle': fifth_candle_data.get('direction'),
+        'confidence_5th_candle': fifth_candle_data.get('confidence'),
 
-            'direction_3rd_candle': third_candle_data.get('direction'),
-            'confidence_3rd_candle': third_candle_data.get('confidence'),
+        'direction_10th_candle': tenth_candle_data.get('direction'),
+        'confidence_10th_candle': tenth_candle_data.get('confidence'),
 
-            'direction_5th_candle': fifth_candle_data.get('direction'),
-            'confidence_5th_candle': fifth_candle_data.get('confidence'),
+        'probability_text': signal_data.get('probability_text'),
+        'risk_text': signal_data.get('risk_text'),
+    }
 
-            'direction_10th_candle': tenth_candle_data.get('direction'),
-            'confidence_10th_candle': tenth_candle_data.get('confidence'),
+    new_signal = Signal.objects.create(candle=candle, source=source, **final_signal_data)
 
-            'probability_text': signal_data.get('probability_text'),
-            'risk_text': signal_data.get('risk_text'),
-        }
+    # The rendered signal replaces the symbol's cached latest and is pushed to connected clients
+    payload = cache_latest_signal(new_signal)
+    publish_event(candle.symbol.name, SIGNAL_EVENT, payload['body'])
+    return new_signal
 
-        # Validate that we have all the necessary data before creating the object
-        if not all(final_signal_data.values()):
-            logger.error(f"Incomplete data received from AI for {candle}: {signal_data}")
-            return f"Incomplete data from AI for {candle}."
 
-        new_signal = Signal.objects.create(candle=candle, **final_signal_data)
+def _save_local_signal(candle: Candle, features: dict):
+    """Generates the candle's signal with the local model, in place of the LLM, and saves it."""
+    return _save_signal(candle, LocalSignalModel().generate_signal_from_features(features), Signal.Source.LOCAL)
 
-        # Caching logic remains the same
-        serializer = SignalSerializer(instance=new_signal)
-        cache_latest_signal(symbol_name=candle.symbol.name, signal_data=serializer.data)
 
+@shared_task(bind=True, max_retries=3)
+def generate_signal_for_candle(self, candle_id: int):
+    """
+    A robust task that calls the AI, parses the new multi-timeframe response,
+    and saves it to the updated Signal model.
+    Symbols that do not use the LLM get a signal from the local model instead. So does a candle
+    whose LLM call times out or finds the circuit open, or that is still without a valid signal
+    after the last retry, so its signal never waits on the upstream.
+    """
+    try:
+        candle = Candle.objects.select_related('symbol').get(id=candle_id)
+        skip_reason = _skip_reason(candle)
+        if skip_reason:
+            return skip_reason
+
+        features = _candle_features(candle)
+        if features is None:
+            return f"Not enough historical data for {candle.symbol.name}."
+
+        if not candle.symbol.use_llm_signals:
+            _save_local_signal(candle, features)
+            return f"Generated a local signal for {candle}."
+
+        try:
+            signal_data = LiaraAIService().generate_signal_from_features(features)
+        except UNAVAILABLE_ERRORS as exc:
+            logger.warning(f"The LLM is unavailable for {candle} ({exc!r}); using the local model.")
+            _save_local_signal(candle, features)
+            return f"Generated a local signal for {candle}; the LLM was unavailable."
+
+        # No response and an invalid one are treated alike: retried, then replaced by the local model
+        if not validate_signal(signal_data):
+            logger.error(f"AI service failed to generate a valid signal for {candle}: {signal_data}")
+            if self.request.retries >= self.max_retries:
+                _save_local_signal(candle, features)
+                return f"Generated a local signal for {candle} after the LLM failed."
+            raise self.retry(countdown=_retry_countdown(self))
+
+        _save_signal(candle, signal_data)
         logger.info(f"Successfully generated multi-timeframe signal for {candle}.")
         return f"Successfully generated multi-timeframe signal for {candle}."
 
@@ -77,4 +130,76 @@ def generate_signal_for_candle(self, candle_id: int):
         logger.error(f"Candle with id={candle_id} not found.")
     except Exception as exc:
         logger.error(f"An unexpected error occurred for candle_id {candle_id}: {exc}")
-        raise self.retry(exc=exc)
+        raise self.retry(exc=exc, countdown=_retry_countdown(self))
+
+
+@shared_task(bind=True, max_retries=3)
+def generate_signals_for_candles(self, candle_ids: list):
+    """
+    Generates the signals of many candles, one per symbol, with batched AI requests.
+    Only the candles without a valid signal in the response are retried. Symbols that do not use
+    the LLM get their signals from the local model, and so does every remaining candle when the
+    LLM times out or its circuit is open, or once the retries are used up.
+    """
+    candles_by_symbol = {}
+    features_by_symbol = {}
+    local = 0
+    for candle in Candle.objects.select_related('symbol').filter(id__in=candle_ids):
+        if _skip_reason(candle):
+            continue
+        features = _candle_features(candle)
+        if features is None:
+            logger.warning(f"Not enough historical data for {candle.symbol.name}.")
+            continue
+        if not candle.symbol.use_llm_signals:
+            local += _save_local_signal(candle, features) is not None
+            continue
+        candles_by_symbol[candle.symbol.name] = candle
+        features_by_symbol[candle.symbol.name] = features
+
+    if not features_by_symbol:
+        return f"Generated {local} local signals; no LLM signals to generate for {len(candle_ids)} candles."
+
+    llm_unavailable = False
+    try:
+        results = LiaraAIService().generate_signals_batch(features_by_symbol)
+    except UNAVAILABLE_ERRORS as exc:
+        logger.warning(f"The LLM is unavailable for a batch of {len(features_by_symbol)} candles ({exc!r}); "
+                       f"using the local model.")
+        results = dict.fromkeys(features_by_symbol)
+        llm_unavailable = True
+    except Exception as exc:
+        logger.error(f"An unexpected error occurred for a batch of {len(features_by_symbol)} candles: {exc}")
+        raise self.retry(exc=exc, countdown=_retry_countdown(self))
+
+    created, failed = 0, []
+    for symbol_name, signal_data in results.items():
+        if not validate_signal(signal_data):
+            failed.append(symbol_name)
+        else:
+            _save_signal(candles_by_symbol[symbol_name], signal_data)
+            created += 1
+
+    if failed and (llm_unavailable or self.request.retries >= self.max_retries):
+        for symbol_name in failed:
+            local += _save_local_signal(candles_by_symbol[symbol_name], features_by_symbol[symbol_name]) is not None
+        failed = []
+
+    logger.info(f"Generated {created} signals in a batch of {len(features_by_symbol)} candles, "
+                f"and {local} with the local model.")
+    if failed:
+        logger.error(f"AI service failed to generate signals for {len(failed)} candles; retrying them.")
+        raise self.retry(args=[[candles_by_symbol[symbol_name].id for symbol_name in failed]],
+                         countdown=_retry_countdown(self))
+    return f"Generated {created} LLM and {local} local signals for {len(candle_ids)} candles."
+
+
+@shared_task
+def evaluate_signal_outcomes():
+    """
+    Marks the outcome of every signal horizon whose candle has closed and updates the accuracy counters.
+    Queued after each ingestion run, once the candles it needs are stored.
+    """
+    summary = evaluate_outcomes()
+    return (f"Marked {summary['outcomes']} outcomes on {summary['signals']} signals "
+            f"({summary['missing']} without candles) in {summary['duration']}s.")
@@ -1,13 +1,34 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase
 from django.core.cache import cache  # 1. Import Django's cache framework
-from unittest.mock import patch, MagicMock
+from django_redis import get_redis_connection
+from unittest.mock import patch, MagicMock, AsyncMock
+from openai import APIConnectionError, BadRequestError
 from rest_framework.test import APIClient
 from rest_framework import status
 from market_data.models import Symbol, Candle
-from .models import Signal
-from .tasks import generate_signal_for_candle
+from market_data.symbol_registry import get_symbol_map, invalidate_symbol_registry
+from market_data.tests import query_plan, SORT_IN_PLAN
+from .models import Signal, SignalAccuracy
+from .executor import LLMExecutor, CircuitBreaker, CircuitOpenError
+from .response_cache import LLMResponseCache, request_digest
+from .redis_client import (cache_latest_signal, get_cached_latest_signal, get_cached_latest_signals,
+                           cache_missing_signals, NO_SIGNAL_TTL)
+from .services import LiaraAIService, validate_signal
+from .tasks import generate_signal_for_candle, generate_signals_for_candles
+from .dispatch import dispatch_signal_jobs
+from .local_model import LocalSignalModel
+from .migration_operations import copy_candle_fields
+from .outcomes import evaluate_outcomes, accuracy_stats, due_signals, OUTCOME_GRACE
+from .backtesting import (IndicatorPredictor, RecordedPredictor, ResponderPredictor, backtest_series, load_series,
+                          run_backtest)
 from datetime import datetime, timezone, timedelta
+import asyncio
+import concurrent.futures
+import gzip
+import httpx
 import json
+import threading
 
 # Sample response simulating a successful AI API call
 MOCK_AI_RESPONSE = {
@@ -17,6 +38,27 @@ MOCK_AI_RESPONSE = {
     "risk_text": "Mock risk text."
 }
 
+VALID_SIGNAL = {
+    "next_candle": {"direction": "BULLISH", "confidence": 70},
+    "third_candle": {"direction": "BULLISH", "confidence": 65},
+    "fifth_candle": {"direction": "NEUTRAL", "confidence": 50},
+    "tenth_candle": {"direction": "BEARISH", "confidence": 55},
+    "probability_text": "Mock probability text.",
+    "risk_text": "Mock risk text."
+}
+
+
+def create_rising_series(name, candles=80):
+    """Creates a symbol whose close rises 1% every candle."""
+    symbol = Symbol.objects.create(name=name, is_active=True)
+    start = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    Candle.objects.bulk_create([
+        Candle(symbol=symbol, timestamp=start + timedelta(minutes=15 * i), open=100 * 1.01 ** i,
+               high=100 * 1.01 ** (i + 1), low=100 * 1.01 ** i, close=100 * 1.01 ** (i + 1), volume=1000)
+        for i in range(candles)
+    ])
+    return symbol
+
 
 class ComprehensiveAISignalsTests(TestCase):
 
@@ -30,8 +72,10 @@ class ComprehensiveAISignalsTests(TestCase):
         )
         # 2. Clear the entire cache before each test to ensure isolation
         cache.clear()
+        # Symbol changes reach the registry on commit, which a test case never reaches
+        invalidate_symbol_registry()
 
-    @patch('ai_signals.services.LiaraAIService.generate_signal_from_candles')
+    @patch('ai_signals.services.LiaraAIService.generate_signal_from_features')
     def test_generate_signal_task_success(self, mock_generate_signal):
         """Test the successful execution of the signal generation task."""
         mock_generate_signal.return_value = MOCK_AI_RESPONSE
@@ -54,13 +98,12 @@ class ComprehensiveAISignalsTests(TestCase):
         self.assertEqual(signal.risk_text, "Mock risk text.")
 
         # 2. Assert Signal was cached in Redis using Django's cache
-        cache_key = f"signal:{self.symbol.name}"
-        cached_data = cache.get(cache_key)
-        self.assertIsNotNone(cached_data)
-        self.assertEqual(cached_data['risk_text'], "Mock risk text.")
+        cached_payload = get_cached_latest_signal(self.symbol.name)
+        self.assertIsNotNone(cached_payload)
+        self.assertEqual(json.loads(cached_payload['body'])['risk_text'], "Mock risk text.")
 
     @patch('ai_signals.tasks.generate_signal_for_candle.retry')
-    @patch('ai_signals.services.LiaraAIService.generate_signal_from_candles')
+    @patch('ai_signals.services.LiaraAIService.generate_signal_from_features')
     def test_task_failure_and_retry(self, mock_generate_signal, mock_retry):
         """Test that the task retries if the AI service fails."""
         mock_generate_signal.return_value = None
@@ -71,6 +114,197 @@ class ComprehensiveAISignalsTests(TestCase):
 
         mock_retry.assert_called_once()
 
+    @patch('ai_signals.services.LiaraAIService.generate_signal_from_features')
+    def test_task_skips_stale_candle(self, mock_generate_signal):
+        """Test that a job for a candle superseded by a newer one never calls the AI."""
+        self.symbol.last_candle_at = self.candle.timestamp + timedelta(minutes=15)
+        self.symbol.save()
+
+        result = generate_signal_for_candle(self.candle.id)
+
+        self.assertIn("Skipping stale", result)
+        mock_generate_signal.assert_not_called()
+
+    # --- Signal Dispatcher Tests ---
+
+    @patch('ai_signals.dispatch.generate_signals_for_candles.apply_async')
+    def test_dispatcher_queues_one_job_per_fresh_symbol(self, mock_apply_async):
+        """Test that only the latest closed candle of up-to-date symbols is queued, once."""
+        now = datetime(2025, 1, 1, 10, 20, 0, tzinfo=timezone.utc)  # The 10:00 candle is the last closed one
+        for i in range(1, 4):
+            Candle.objects.create(symbol=self.symbol, timestamp=self.candle.timestamp - timedelta(minutes=15 * i),
+                                  open=1, high=1, low=1, close=1, volume=1)
+        self.symbol.last_candle_at = self.candle.timestamp
+        lagging = Symbol.objects.create(name='LAG-USDT', last_candle_at=self.candle.timestamp - timedelta(hours=1))
+
+        self.assertEqual(dispatch_signal_jobs([self.symbol, lagging], now=now), 1)
+        mock_apply_async.assert_called_once()
+        self.assertEqual(mock_apply_async.call_args.kwargs['args'], [[self.candle.id]])
+
+        # A second ingestion run seeing the same candle does not queue it again
+        self.assertEqual(dispatch_signal_jobs([self.symbol, lagging], now=now), 0)
+        mock_apply_async.assert_called_once()
+
+    # --- Batched Signal Generation Tests ---
+
+    def _mock_completion(self, content):
+        completion = MagicMock()
+        completion.choices[0].message.content = json.dumps(content)
+        return completion
+
+    @patch.dict('os.environ', {'LIARA_API_KEY': 'key', 'LIARA_BASE_URL': 'http://llm.invalid'})
+    def test_batch_falls_back_to_individual_calls_for_invalid_symbols(self):
+        """Test one request serves many symbols and only the invalid ones are requested again."""
+        service = LiaraAIService()
+        with patch.object(service.executor, 'client') as client:
+            create = client.chat.completions.create = AsyncMock(side_effect=[
+                self._mock_completion({'AAA-USDT': VALID_SIGNAL, 'BBB-USDT': {**VALID_SIGNAL, 'risk_text': ''}}),
+                self._mock_completion(VALID_SIGNAL),
+            ])
+            results = service.generate_signals_batch({'AAA-USDT': {'close': 1}, 'BBB-USDT': {'close': 2}})
+
+        self.assertEqual(results, {'AAA-USDT': VALID_SIGNAL, 'BBB-USDT': VALID_SIGNAL})
+        self.assertEqual(create.call_count, 2)
+        batch_call, single_call = create.call_args_list
+        self.assertEqual(batch_call.kwargs['response_format']['type'], 'json_schema')
+        self.assertIn('"BBB-USDT":{"close":2}', batch_call.kwargs['messages'][0]['content'])
+        self.assertNotIn('AAA-USDT', single_call.kwargs['messages'][0]['content'])
+
+    # --- LLM Response Cache Tests ---
+
+    def test_response_cache_evicts_least_recently_used_and_counts_hits(self):
+        """Test the response cache is size-bounded by recency of use and reports hit/miss metrics."""
+        response_cache = LLMResponseCache(max_entries=2)
+        response_cache.set('a', {'answer': 1})
+        response_cache.set('b', {'answer': 2})
+        self.assertEqual(response_cache.get('a'), {'answer': 1})  # 'a' is now more recent than 'b'
+        response_cache.set('c', {'answer': 3})
+
+        self.assertIsNone(response_cache.get('b'))
+        self.assertEqual(response_cache.get('c'), {'answer': 3})
+        self.assertEqual(response_cache.stats(), {'hits': 2, 'misses': 1, 'hit_rate': 0.6667, 'entries': 2})
+
+    def test_request_digest_changes_with_prompt_version(self):
+        """Test the digest ignores key order but changes with the model or prompt version."""
+        digest = request_digest('model', 'v1', {'a': 1, 'b': 2})
+        self.assertEqual(digest, request_digest('model', 'v1', {'b': 2, 'a': 1}))
+        self.assertNotEqual(digest, request_digest('model', 'v2', {'a': 1, 'b': 2}))
+        self.assertNotEqual(digest, request_digest('other-model', 'v1', {'a': 1, 'b': 2}))
+
+    @patch.dict('os.environ', {'LIARA_API_KEY': 'key', 'LIARA_BASE_URL': 'http://llm.invalid'})
+    def test_identical_signal_request_is_served_from_cache(self):
+        """Test a repeated request for the same features does not call the upstream again."""
+        service = LiaraAIService()
+        with patch.object(service.executor, 'client') as client:
+            create = client.chat.completions.create = AsyncMock(return_value=self._mock_completion(VALID_SIGNAL))
+            self.assertEqual(service.generate_signal_from_features({'close': 1}), VALID_SIGNAL)
+            self.assertEqual(service.generate_signal_from_features({'close': 1}), VALID_SIGNAL)
+            self.assertEqual(create.call_count, 1)
+
+            service.generate_signal_from_features({'close': 2})
+            self.assertEqual(create.call_count, 2)
+
+        # The blocking cache calls stay off the executor loop shared by every LLM call
+        with patch.object(service.response_cache, 'get', side_effect=lambda digest: threading.current_thread().name):
+            self.assertNotEqual(service.generate_signal_from_features({'close': 3}), 'llm-executor')
+
+    # --- LLM Executor Tests ---
+
+    @patch('ai_signals.executor.backoff_delay', return_value=0)
+    def test_executor_retries_transient_errors_and_opens_circuit(self, mock_backoff_delay):
+        """Test transient failures are retried, and repeated failures open the circuit breaker."""
+        executor = LLMExecutor(base_url='http://llm.invalid', api_key='key', max_retries=2)
+        self.addCleanup(executor.close)
+        connection_error = APIConnectionError(request=httpx.Request('POST', 'http://llm.invalid'))
+        messages = [{"role": "user", "content": "Hi"}]
+
+        with patch.object(executor, 'client') as client:
+            client.chat.completions.create = AsyncMock(side_effect=[connection_error, self._mock_completion("ok")])
+            self.assertEqual(executor.run(executor.complete('model', messages)), json.dumps("ok"))
+
+            # Three failed attempts per call; the fifth consecutive failure opens the circuit
+            client.chat.completions.create = AsyncMock(side_effect=connection_error)
+            with self.assertRaises(APIConnectionError):
+                executor.run(executor.complete('model', messages))
+            with self.assertRaises(CircuitOpenError):
+                executor.run(executor.complete('model', messages))
+            self.assertTrue(executor.breaker.is_open)
+            self.assertEqual(client.chat.completions.create.call_count, 5)
+            with self.assertRaises(CircuitOpenError):
+                executor.run(executor.complete('model', messages))
+            self.assertEqual(client.chat.completions.create.call_count, 5)
+
+    def test_bad_requests_do_not_open_the_circuit_and_timeouts_do(self):
+        """Test a 400 neither counts as a failure nor keeps the trial slot, while a timed-out trial call reopens the circuit."""
+        executor = LLMExecutor(base_url='http://llm.invalid', api_key='key', max_retries=0)
+        self.addCleanup(executor.close)
+        executor.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        messages = [{"role": "user", "content": "Hi"}]
+        bad_request = BadRequestError('Bad request', body=None, response=httpx.Response(
+            400, request=httpx.Request('POST', 'http://llm.invalid')))
+
+        async def hang(**kwargs):
+            await asyncio.sleep(10)
+
+        with patch.object(executor, 'client') as client:
+            client.chat.completions.create = AsyncMock(side_effect=bad_request)
+            for _ in range(3):
+                with self.assertRaises(BadRequestError):
+                    executor.run(executor.complete('model', messages))
+            self.assertFalse(executor.breaker.is_open)
+            self.assertEqual(executor.breaker.failures, 0)
+
+            # A bad request on the trial call of an open circuit frees the slot for the next trial
+            executor.breaker.record_failure()
+            with self.assertRaises(BadRequestError):
+                executor.run(executor.complete('model', messages))
+            self.assertTrue(executor.breaker.is_open)
+            self.assertTrue(executor.breaker.allow())
+            executor.breaker.release()
+
+            client.chat.completions.create = AsyncMock(side_effect=hang)
+            with self.assertRaises(concurrent.futures.TimeoutError):
+                executor.run(executor.complete('model', messages), timeout=0.05)
+            executor.run(asyncio.sleep(0.05))
+            self.assertTrue(executor.breaker.is_open)
+            self.assertEqual(executor.breaker.failures, 2)
+
+            # The next trial call goes through and closes the circuit
+            client.chat.completions.create = AsyncMock(return_value=self._mock_completion("ok"))
+            self.assertEqual(executor.run(executor.complete('model', messages)), json.dumps("ok"))
+            self.assertFalse(executor.breaker.is_open)
+
+    def test_circuit_breaker_lets_one_trial_call_through_after_timeout(self):
+        """Test the half-open state allows a single trial call that closes the circuit on success."""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # Only one trial call at a time
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+
+    @patch('ai_signals.tasks.generate_signals_for_candles.retry')
+    @patch('ai_signals.tasks.get_features', return_value={'close': 1})
+    @patch('ai_signals.services.LiaraAIService.generate_signals_batch')
+    @patch('ai_signals.services.LiaraAIService.__init__', return_value=None)
+    def test_batch_task_saves_signals_and_retries_only_failures(self, mock_init, mock_batch, mock_features,
+                                                                mock_retry):
+        """Test the batched task stores each valid signal and retries just the failed candles."""
+        other_symbol = Symbol.objects.create(name='OTHER-USDT')
+        other_candle = Candle.objects.create(symbol=other_symbol, timestamp=self.candle.timestamp,
+                                             open=1, high=1, low=1, close=1, volume=1)
+        mock_batch.return_value = {self.symbol.name: VALID_SIGNAL, other_symbol.name: None}
+        mock_retry.side_effect = Exception("Celery Retry")
+
+        with self.assertRaises(Exception):
+            generate_signals_for_candles([self.candle.id, other_candle.id])
+
+        self.assertEqual(Signal.objects.get().candle, self.candle)
+        self.assertEqual(mock_retry.call_args.kwargs['args'], [[other_candle.id]])
+
     def test_latest_signal_api_cache_miss_and_hit(self):
         """Test the cache-aside logic of the LatestSignalView."""
         url = f'/api/signals/latest/{self.symbol.name}/'
@@ -94,7 +328,7 @@ class ComprehensiveAISignalsTests(TestCase):
         self.assertEqual(response_first.status_code, status.HTTP_200_OK)
 
         # Verify that the cache is now populated
-        self.assertIsNotNone(cache.get(f"signal:{self.symbol.name}"))
+        self.assertIsNotNone(get_cached_latest_signal(self.symbol.name))
 
         # --- Cache Hit ---
         # Modify the DB object to ensure the next response comes from the cache
@@ -103,4 +337,388 @@ class ComprehensiveAISignalsTests(TestCase):
         response_hit = self.client.get(url)
         self.assertEqual(response_hit.status_code, status.HTTP_200_OK)
         # The text should be the OLD text from the cache
-        self.assertEqual(response_hit.data['probability_text'], 'Test')
+        self.assertEqual(response_hit.json()['probability_text'], 'Test')
+
+    # --- Signal Payload Cache Tests ---
+
+    def _create_signal(self, candle, probability_text='Test'):
+        return Signal.objects.create(
+            candle=candle,
+            direction_next_candle='BULLISH', confidence_next_candle=80,
+            direction_3rd_candle='BULLISH', confidence_3rd_candle=80,
+            direction_5th_candle='BULLISH', confidence_5th_candle=80,
+            direction_10th_candle='BULLISH', confidence_10th_candle=80,
+            probability_text=probability_text, risk_text='Test'
+        )
+
+    def test_latest_signal_is_served_pre_rendered_with_conditional_requests(self):
+        """Test the cached signal bytes are served with an ETag, a 304 on revalidation and gzip on request."""
+        user = get_user_model().objects.create_user(email='signals@example.com', password='pw')
+        self.client.force_authenticate(user=user)
+        self._create_signal(self.candle, probability_text='x' * 1000)
+        url = f'/signals/latest/{self.symbol.name.lower()}/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['symbol'], self.symbol.name)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['probability_text'], 'x' * 1000)
+        for accept_encoding in ('gzip;q=0', 'br, gzip; q=0.0', '*;q=0', 'identity'):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertNotIn('Content-Encoding', response)
+            self.assertEqual(response.json()['probability_text'], 'x' * 1000)
+        for accept_encoding in ('br;q=1.0, gzip;q=0.5', 'deflate, *;q=0.1'):
+            self.assertEqual(self.client.get(url, HTTP_ACCEPT_ENCODING=accept_encoding)['Content-Encoding'], 'gzip')
+
+        # A newer signal replaces the payload, so the old ETag no longer matches
+        newer_candle = Candle.objects.create(symbol=self.symbol, timestamp=self.candle.timestamp + timedelta(minutes=15),
+                                             open=1, high=1, low=1, close=1, volume=1)
+        cache_latest_signal(self._create_signal(newer_candle))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertNotIn('body_gzip', get_cached_latest_signal(self.symbol.name))
+
+    def test_latest_signals_for_all_symbols_in_one_query_then_from_cache(self):
+        """Test the bulk endpoint reads missing signals with one query and then serves all of them from the cache."""
+        user = get_user_model().objects.create_user(email='signals@example.com', password='pw')
+        self.client.force_authenticate(user=user)
+        other_symbol = Symbol.objects.create(name='OTHER-USDT')
+        Symbol.objects.create(name='QUIET-USDT')  # no signal yet
+        older_candle = Candle.objects.create(symbol=self.symbol, timestamp=self.candle.timestamp - timedelta(minutes=15),
+                                             open=1, high=1, low=1, close=1, volume=1)
+        other_candle = Candle.objects.create(symbol=other_symbol, timestamp=self.candle.timestamp,
+                                             open=1, high=1, low=1, close=1, volume=1)
+        self._create_signal(older_candle, probability_text='Old')
+        self._create_signal(self.candle, probability_text='New')
+        self._create_signal(other_candle, probability_text='Other')
+        cache_latest_signal(Signal.objects.get(candle=other_candle))
+        get_symbol_map()  # symbols are resolved from the registry, which is built once
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/signals/latest/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(list(data), ['OTHER-USDT', 'TEST-USDT'])
+        self.assertEqual(data['TEST-USDT']['probability_text'], 'New')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/signals/latest/', {'symbols': 'test-usdt,quiet-usdt,unknown'})
+        self.assertEqual(list(response.json()), ['TEST-USDT'])
+
+        response = self.client.get('/signals/latest/', {'symbols': 'test-usdt'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_missing_marker_never_touches_a_cached_payload(self):
+        """Test marking symbols without a signal leaves a payload stored in the meantime, and its TTL, alone."""
+        redis = get_redis_connection('default')
+        cache_latest_signal(self._create_signal(self.candle))
+        cache_missing_signals([self.symbol.name, 'QUIET-USDT'])
+
+        self.assertIsNotNone(get_cached_latest_signal(self.symbol.name))
+        self.assertFalse(redis.hexists(f"signal-payload:{self.symbol.name}", 'missing'))
+        self.assertGreater(redis.ttl(f"signal-payload:{self.symbol.name}"), NO_SIGNAL_TTL)
+        self.assertEqual(get_cached_latest_signals(['QUIET-USDT']), {'QUIET-USDT': None})
+        self.assertLessEqual(redis.ttl('signal-payload:QUIET-USDT'), NO_SIGNAL_TTL)
+
+    def test_an_older_signal_never_replaces_a_newer_cached_one(self):
+        """Test a cache fill that read an older signal and finishes late leaves the newer payload in place."""
+        older = self._create_signal(self.candle, probability_text='Old')
+        newer_candle = Candle.objects.create(symbol=self.symbol, timestamp=self.candle.timestamp + timedelta(minutes=15),
+                                             open=1, high=1, low=1, close=1, volume=1)
+        newer = self._create_signal(newer_candle, probability_text='New')
+
+        newer_payload = cache_latest_signal(newer)
+        cache_latest_signal(older)
+        cached = get_cached_latest_signal(self.symbol.name)
+        self.assertEqual(cached['etag'], newer_payload['etag'])
+        self.assertEqual(json.loads(cached['body'])['probability_text'], 'New')
+        self.assertEqual(set(cached), set(newer_payload))
+
+        newest_candle = Candle.objects.create(symbol=self.symbol, timestamp=newer_candle.timestamp + timedelta(minutes=15),
+                                              open=1, high=1, low=1, close=1, volume=1)
+        cache_latest_signal(self._create_signal(newest_candle, probability_text='Newest'))
+        self.assertEqual(json.loads(get_cached_latest_signal(self.symbol.name)['body'])['probability_text'], 'Newest')
+
+    # --- Backtesting Tests ---
+
+    def test_backtest_scores_each_horizon_against_realised_closes(self):
+        """Test predictions are made from the first candle with enough history and scored per horizon."""
+        symbol = create_rising_series('UP-USDT')
+        timestamps, ohlcv = load_series([symbol])['UP-USDT']
+        features_seen = []
+
+        def always_bullish(features):
+            features_seen.append(features)
+            return VALID_SIGNAL
+
+        report = backtest_series(ResponderPredictor(always_bullish), 'UP-USDT', timestamps, ohlcv)
+
+        # The first prediction is at the 51st candle, the first with enough history for the EMA 50;
+        # the last candles have no realised move on the longer horizons
+        self.assertEqual(report['candles'], 30)
+        self.assertEqual(features_seen[0]['timestamp'], int(timestamps[50]))
+        self.assertEqual(report['horizons']['next_candle'], {
+            'predictions': 29, 'correct': 29, 'directional': 29, 'hits': 29,
+            'confidence_correct': 29 * 70.0, 'confidence_wrong': 0.0})
+        self.assertEqual(report['horizons']['fifth_candle']['correct'], 0)
+        self.assertEqual(report['horizons']['tenth_candle']['predictions'], 20)
+        self.assertEqual(report['horizons']['tenth_candle']['hits'], 0)
+
+    def test_backtest_replays_stored_signals(self):
+        """Test stored signals are scored on their own candles only."""
+        symbol = create_rising_series('UP-USDT')
+        candle = Candle.objects.filter(symbol=symbol).order_by('timestamp')[60]
+        self._create_signal(candle)
+
+        report = run_backtest([symbol], RecordedPredictor.from_signals([symbol]), workers=1)['total']
+
+        self.assertEqual(report['horizons']['next_candle']['predictions'], 1)
+        self.assertEqual(report['horizons']['next_candle']['accuracy'], 1.0)
+        self.assertEqual(report['horizons']['next_candle']['mean_confidence_correct'], 80.0)
+
+    # --- Signal Outcome Tests ---
+
+    def test_outcomes_are_marked_as_horizons_close_and_counted_once(self):
+        """Test each horizon is evaluated once its candle closes, and the counters only grow by new outcomes."""
+        symbol = create_rising_series('RISING-USDT')
+        candles = list(Candle.objects.filter(symbol=symbol).order_by('timestamp'))
+        signal = self._create_signal(candles[60])
+        step = timedelta(minutes=15)
+
+        # By the close of the 3rd candle ahead, the next and 3rd candle horizons are known
+        summary = evaluate_outcomes(now=candles[60].timestamp + 4 * step)
+        self.assertEqual((summary['signals'], summary['outcomes']), (1, 2))
+        signal.refresh_from_db()
+        self.assertEqual((signal.outcome_next_candle, signal.outcome_3rd_candle, signal.outcome_5th_candle),
+                         ('BULLISH', 'BULLISH', None))
+        self.assertEqual(signal.horizons_evaluated, 2)
+        self.assertEqual(evaluate_outcomes(now=candles[60].timestamp + 4 * step)['outcomes'], 0)
+
+        evaluate_outcomes(now=candles[60].timestamp + 11 * step)
+        counters = SignalAccuracy.objects.filter(symbol=symbol)
+        self.assertEqual(sorted(counters.values_list('horizon', 'confidence_bucket', 'predictions', 'correct')), [
+            ('fifth_candle', 80, 1, 1), ('next_candle', 80, 1, 1), ('tenth_candle', 80, 1, 1),
+            ('third_candle', 80, 1, 1),
+        ])
+
+        # Near the end of the series the later candles are missing: they are waited for, then given up
+        late_signal = self._create_signal(candles[78])
+        evaluate_outcomes(now=candles[78].timestamp + 11 * step)
+        late_signal.refresh_from_db()
+        self.assertEqual((late_signal.outcome_next_candle, late_signal.horizons_evaluated), ('BULLISH', 1))
+        summary = evaluate_outcomes(now=candles[78].timestamp + 11 * step + OUTCOME_GRACE)
+        self.assertEqual((summary['outcomes'], summary['missing']), (0, 3))
+        late_signal.refresh_from_db()
+        self.assertEqual((late_signal.outcome_3rd_candle, late_signal.horizons_evaluated), (None, 4))
+        self.assertEqual(counters.get(horizon='next_candle').predictions, 2)
+
+    def test_accuracy_endpoint_reads_the_counters(self):
+        """Test the accuracy of a symbol is served from its counters with one query, and all symbols add up."""
+        user = get_user_model().objects.create_user(email='signals@example.com', password='pw')
+        self.client.force_authenticate(user=user)
+        symbol = create_rising_series('RISING-USDT')
+        candles = list(Candle.objects.filter(symbol=symbol).order_by('timestamp'))
+        self._create_signal(candles[60])
+        Signal.objects.create(
+            candle=candles[61],
+            direction_next_candle='BEARISH', confidence_next_candle=55,
+            direction_3rd_candle='NEUTRAL', confidence_3rd_candle=50,
+            direction_5th_candle='BEARISH', confidence_5th_candle=55,
+            direction_10th_candle='BEARISH', confidence_10th_candle=100,
+            probability_text='Test', risk_text='Test'
+        )
+        evaluate_outcomes(now=candles[-1].timestamp + timedelta(minutes=15))
+        get_symbol_map()
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/signals/accuracy/rising-usdt/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        next_candle = response.json()['horizons']['next_candle']
+        self.assertEqual((next_candle['predictions'], next_candle['correct'], next_candle['accuracy']), (2, 1, 0.5))
+        self.assertEqual(next_candle['buckets']['50-60'], {'predictions': 1, 'correct': 0, 'directional': 1,
+                                                          'hits': 0, 'accuracy': 0.0, 'hit_rate': 0.0})
+        self.assertEqual(next_candle['buckets']['80-90']['accuracy'], 1.0)
+        # A NEUTRAL call is scored for accuracy but is not a directional call
+        third_candle = response.json()['horizons']['third_candle']
+        self.assertEqual((third_candle['directional'], third_candle['hits'], third_candle['hit_rate']), (1, 1, 1.0))
+        self.assertIn('90-100', response.json()['horizons']['tenth_candle']['buckets'])
+
+        self.assertEqual(self.client.get('/signals/accuracy/unknown/').status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get('/signals/accuracy/')
+        self.assertIsNone(response.json()['symbol'])
+        self.assertEqual(response.json()['horizons'], accuracy_stats(symbol.id))
+
+    # --- Local Fallback Model Tests ---
+
+    def test_local_model_makes_the_backtested_indicator_predictions(self):
+        """Test the local model's signals are valid and match the vectorised indicator predictor they are scored by."""
+        symbol = create_rising_series('RISING-USDT')
+        timestamps, ohlcv = load_series([symbol])['RISING-USDT']
+        local = backtest_series(ResponderPredictor(LocalSignalModel().generate_signal_from_features),
+                                'RISING-USDT', timestamps, ohlcv)
+        indicator = backtest_series(IndicatorPredictor(), 'RISING-USDT', timestamps, ohlcv)
+        for horizon, counts in indicator['horizons'].items():
+            self.assertEqual((local['horizons'][horizon]['correct'], local['horizons'][horizon]['directional']),
+                             (counts['correct'], counts['directional']))
+
+        responses = []
+        ResponderPredictor(responses.append).predict('RISING-USDT', timestamps, ohlcv, [timestamps.size - 1])
+        signal_data = LocalSignalModel().generate_signal_from_features(responses[0])
+        self.assertTrue(validate_signal(signal_data))
+        # Every candle closed higher: RSI is overbought, so the short horizons expect a pullback
+        self.assertEqual((signal_data['next_candle']['direction'], signal_data['tenth_candle']['direction']),
+                         ('BEARISH', 'BULLISH'))
+
+    @patch('ai_signals.services.LiaraAIService.generate_signals_batch', side_effect=CircuitOpenError("open"))
+    @patch('ai_signals.services.LiaraAIService.__init__', return_value=None)
+    def test_batch_task_uses_the_local_model_when_the_circuit_is_open(self, mock_init, mock_batch):
+        """Test an open circuit yields local signals at once, and local-tier symbols never reach the LLM."""
+        rising = create_rising_series('RISING-USDT')
+        quiet = create_rising_series('QUIET-USDT')
+        quiet.use_llm_signals = False
+        quiet.save()
+        candle_ids = [Candle.objects.filter(symbol=symbol).latest('timestamp').id for symbol in (rising, quiet)]
+
+        generate_signals_for_candles(candle_ids)
+
+        self.assertEqual(list(mock_batch.call_args.args[0]), ['RISING-USDT'])
+        self.assertEqual(dict(Signal.objects.values_list('symbol__name', 'source')),
+                         {'RISING-USDT': 'local', 'QUIET-USDT': 'local'})
+        self.assertEqual(json.loads(get_cached_latest_signal('RISING-USDT')['body'])['source'], 'local')
+
+    @patch('ai_signals.services.LiaraAIService.generate_signal_from_features')
+    @patch('ai_signals.services.LiaraAIService.__init__', return_value=None)
+    def test_task_uses_the_local_model_on_timeout_and_after_the_last_retry(self, mock_init, mock_generate_signal):
+        """Test a timed-out LLM call, or a last retry without a signal, still produces a signal."""
+        symbol = create_rising_series('RISING-USDT')
+        newest, previous = Candle.objects.filter(symbol=symbol).order_by('-timestamp')[:2]
+
+        mock_generate_signal.side_effect = concurrent.futures.TimeoutError
+        self.assertIn("LLM was unavailable", generate_signal_for_candle(newest.id))
+        self.assertEqual(Signal.objects.get(candle=newest).source, Signal.Source.LOCAL)
+
+        mock_generate_signal.side_effect = None
+        mock_generate_signal.return_value = None
+        generate_signal_for_candle.apply(args=[previous.id], retries=generate_signal_for_candle.max_retries)
+        self.assertEqual(Signal.objects.get(candle=previous).source, Signal.Source.LOCAL)
+
+    @patch('ai_signals.services.LiaraAIService.generate_signal_from_features')
+    @patch('ai_signals.services.LiaraAIService.__init__', return_value=None)
+    def test_task_treats_an_invalid_response_as_a_failure(self, mock_init, mock_generate_signal):
+        """Test an invalid response is retried, then replaced by the local model, and a confidence of 0 is kept."""
+        symbol = create_rising_series('RISING-USDT')
+        newest, previous = Candle.objects.filter(symbol=symbol).order_by('-timestamp')[:2]
+        mock_generate_signal.return_value = {**VALID_SIGNAL, 'risk_text': ''}
+
+        with patch.object(generate_signal_for_candle, 'retry', side_effect=RuntimeError('retried')) as mock_retry:
+            with self.assertRaises(RuntimeError):
+                generate_signal_for_candle(newest.id)
+        mock_retry.assert_called()
+        self.assertFalse(Signal.objects.filter(candle=newest).exists())
+
+        generate_signal_for_candle.apply(args=[newest.id], retries=generate_signal_for_candle.max_retries)
+        self.assertEqual(Signal.objects.get(candle=newest).source, Signal.Source.LOCAL)
+
+        mock_generate_signal.return_value = {**VALID_SIGNAL, 'next_candle': {'direction': 'NEUTRAL', 'confidence': 0}}
+        generate_signal_for_candle(previous.id)
+        signal = Signal.objects.get(candle=previous)
+        self.assertEqual((signal.source, signal.confidence_next_candle), (Signal.Source.LLM, 0))
+
+    @patch('ai_signals.services.LiaraAIService.generate_signals_batch')
+    @patch('ai_signals.services.LiaraAIService.__init__', return_value=None)
+    def test_batch_task_retries_invalid_results(self, mock_init, mock_batch):
+        """Test the batch task retries the candles with an invalid result and saves the valid ones."""
+        candles = {name: Candle.objects.filter(symbol=create_rising_series(name)).latest('timestamp')
+                   for name in ('RISING-USDT', 'ZERO-USDT')}
+        mock_batch.return_value = {
+            'RISING-USDT': {**VALID_SIGNAL, 'tenth_candle': {'direction': 'UP', 'confidence': 50}},
+            'ZERO-USDT': {**VALID_SIGNAL, 'tenth_candle': {'direction': 'NEUTRAL', 'confidence': 0}},
+        }
+
+        with patch.object(generate_signals_for_candles, 'retry', side_effect=RuntimeError('retried')) as mock_retry:
+            with self.assertRaises(RuntimeError):
+                generate_signals_for_candles([candle.id for candle in candles.values()])
+        self.assertEqual(mock_retry.call_args.kwargs['args'], [[candles['RISING-USDT'].id]])
+        self.assertEqual(dict(Signal.objects.values_list('symbol__name', 'source')), {'ZERO-USDT': 'llm'})
+
+        mock_batch.return_value = {'RISING-USDT': None}
+        generate_signals_for_candles.apply(args=[[candles['RISING-USDT'].id]],
+                                           retries=generate_signals_for_candles.max_retries)
+        self.assertEqual(Signal.objects.get(candle=candles['RISING-USDT']).source, Signal.Source.LOCAL)
+
+    def test_executor_cancels_a_call_past_its_timeout(self):
+        """Test a call that overruns its timeout raises and is cancelled instead of running on."""
+        executor = LLMExecutor(base_url='http://llm.invalid', api_key='key')
+        self.addCleanup(executor.close)
+        cancelled = []
+
+        async def slow_call():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            executor.run(slow_call(), timeout=0.05)
+        executor.run(asyncio.sleep(0.05))
+        self.assertEqual(cancelled, [True])
+
+    # --- Query Plan Tests ---
+
+    def test_latest_signal_query_is_a_single_index_seek(self):
+        """Test the latest signal of a symbol is read from the (symbol, -timestamp) index without the candle table."""
+        plan = query_plan(Signal.objects.filter(symbol_id=self.symbol.id).order_by('-timestamp')[:1])
+        self.assertIn('signal_symbol_ts_desc', plan)
+        self.assertNotIn('market_data_candle', plan)
+        self.assertNotRegex(plan, SORT_IN_PLAN)
+
+    def test_signal_copies_symbol_and_timestamp_from_its_candle(self):
+        """Test the denormalised symbol and timestamp are filled in from the candle on save."""
+        signal = self._create_signal(self.candle)
+        self.assertEqual((signal.symbol_id, signal.timestamp), (self.symbol.id, self.candle.timestamp))
+
+    def test_existing_signals_are_backfilled_from_their_candles(self):
+        """Test the data migration copies each signal's symbol and timestamp from its candle."""
+        from django.apps import apps
+        from django.db import connection
+        signal = self._create_signal(self.candle)
+        other = Symbol.objects.create(name='OTHER-USDT')
+        Signal.objects.filter(pk=signal.pk).update(symbol=other, timestamp=self.candle.timestamp - timedelta(days=1))
+
+        copy_candle_fields(apps, connection.schema_editor())
+        signal.refresh_from_db()
+        self.assertEqual((signal.symbol_id, signal.timestamp), (self.symbol.id, self.candle.timestamp))
+
+    def test_pending_outcomes_are_read_from_a_partial_index(self):
+        """Test the evaluator finds due signals through the pending-outcome index, without scanning evaluated ones."""
+        plan = query_plan(due_signals(self.candle.timestamp, timedelta(minutes=15)).order_by('timestamp', 'id'))
+        self.assertIn('signal_pending_outcome', plan)
+
+
+class BacktestProcessPoolTests(TransactionTestCase):
+    """
+    The pooled backtest runs outside a test transaction, as it does from the management command,
+    so a worker that touched the caller's connection would show up here.
+    """
+
+    def test_backtest_on_a_process_pool_matches_a_single_process(self):
+        """Test the process pool produces the same report as an in-process run, per symbol and in total."""
+        symbols = [create_rising_series('UP-USDT'), create_rising_series('UP2-USDT', candles=120)]
+
+        pooled = run_backtest(symbols, IndicatorPredictor(), workers=2)
+        inline = run_backtest(symbols, IndicatorPredictor(), workers=1)
+
+        self.assertEqual(pooled['symbols'], inline['symbols'])
+        self.assertEqual(pooled['total']['candles'], 30 + 70)
+        self.assertEqual(pooled['total']['horizons'], inline['total']['horizons'])
+        # A steady rise is an aligned uptrend, so the long horizons are all called right
+        self.assertEqual(pooled['total']['horizons']['tenth_candle']['accuracy'], 1.0)
@@ -1,6 +1,9 @@
 from django.urls import path
-from .views import LatestSignalView
+from .views import LatestSignalView, LatestSignalsView, SignalAccuracyView
 
 urlpatterns = [
+    path('latest/', LatestSignalsView.as_view(), name='latest-signals'),
     path('latest/<str:symbol_name>/', LatestSignalView.as_view(), name='latest-signal'),
+    path('accuracy/', SignalAccuracyView.as_view(), name='signal-accuracy'),
+    path('accuracy/<str:symbol_name>/', SignalAccuracyView.as_view(), name='symbol-signal-accuracy'),
 ]
\ No newline at end of file
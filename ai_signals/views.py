@@ -1,10 +1,20 @@
-from rest_framework.views import APIView
+import hashlib
+
+from asgiref.sync import sync_to_async
+from adrf.views import APIView
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Signal
-from .serializers import SignalSerializer
-from .redis_client import get_cached_latest_signal, cache_latest_signal
-from market_data.models import Symbol
+from .redis_client import (get_cached_latest_signal, cache_latest_signal, get_cached_latest_signals,
+                           cache_latest_signals, cache_missing_signals)
+from .outcomes import accuracy_stats
+from market_data.symbol_registry import aresolve_symbol, aget_symbol_map
 from accounts.permissions import IsUserVerified
 
 
@@ -12,28 +22,142 @@ class LatestSignalView(APIView):
     """
     Provides the latest AI-generated signal for a given symbol.
     Implements the Cache-Aside pattern for high performance.
+    The view is async, so under ASGI a request waiting on Redis or the database does not hold a thread.
+    Signals are cached pre-rendered with an ETag: a hit returns the stored bytes as they are, and a
+    client sending the current ETag in If-None-Match gets an empty 304 response.
     """
     permission_classes = [IsUserVerified]
 
-    def get(self, request, symbol_name, format=None):
-        print(Symbol.objects.values_list('name', flat=True))
-        if symbol_name not in Symbol.objects.values_list('name', flat=True):
-            Response({'error': 'No symbol found'}, status=status.HTTP_404_NOT_FOUND)
+    async def get(self, request, symbol_name, format=None):
+        # Symbols are resolved from the in-memory symbol registry, without a query
+        symbol = await aresolve_symbol(symbol_name)
+        if symbol is None:
+            return Response({'error': 'No symbol found'}, status=status.HTTP_404_NOT_FOUND)
 
         # Step 1: Try to get the signal from the cache (Redis)
-        cached_signal = get_cached_latest_signal(symbol_name)
-        if cached_signal:
-            return Response(cached_signal, status=status.HTTP_200_OK)
+        payload = await sync_to_async(get_cached_latest_signal)(symbol.name)
+        if payload:
+            return _payload_response(request, payload)
 
         # Step 2: If not in cache (Cache Miss), fetch from the database
         try:
             # Find the latest signal for the given symbol from PostgreSQL
-            latest_signal = Signal.objects.filter(candle__symbol__name=symbol_name).latest('candle__timestamp')
+            latest_signal = await Signal.objects.select_related('symbol').filter(
+                symbol_id=symbol.id).alatest('timestamp')
         except Signal.DoesNotExist:
             return Response({'error': 'No signal found for this symbol.'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Step 3: Serialize the data and cache it for future requests
-        serializer = SignalSerializer(instance=latest_signal)
-        cache_latest_signal(symbol_name=symbol_name, signal_data=serializer.data)
+        # Step 3: Render the signal and cache it for future requests
+        payload = await sync_to_async(cache_latest_signal)(latest_signal)
+        return _payload_response(request, payload)
+
+
+class LatestSignalsView(APIView):
+    """
+    Provides the latest signal of every active symbol, or of the symbols listed in the
+    comma-separated `symbols` query parameter, as one JSON object keyed by symbol name.
+    Symbols without a signal are left out. Cached signals are read in one Redis round trip and the
+    missing ones with one database query, after which they are cached together. The response is
+    assembled from the pre-rendered payloads and carries an ETag covering all of them.
+    """
+    permission_classes = [IsUserVerified]
+
+    async def get(self, request, format=None):
+        symbols = await aget_symbol_map()
+        requested = request.query_params.get('symbols')
+        if requested:
+            names = {name.strip().lower() for name in requested.split(',')}
+            selected = [symbols[name] for name in sorted(names) if name in symbols]
+        else:
+            selected = sorted((symbol for symbol in symbols.values() if symbol.is_active), key=lambda s: s.name)
+
+        payloads = await sync_to_async(get_cached_latest_signals)([symbol.name for symbol in selected])
+        missing = [symbol for symbol in selected if symbol.name not in payloads]
+        if missing:
+            payloads.update(await sync_to_async(_load_latest_signals)(missing))
+
+        ordered = [(symbol.name, payloads[symbol.name]) for symbol in selected if payloads.get(symbol.name)]
+        body = b'{' + b','.join(
+            JSONRenderer().render(name) + b':' + payload['body'] for name, payload in ordered) + b'}'
+        etag = '"' + hashlib.sha1(''.join(payload['etag'] for _, payload in ordered).encode()).hexdigest() + '"'
+        return _payload_response(request, {'body': body, 'etag': etag})
+
+
+class SignalAccuracyView(APIView):
+    """
+    Provides the accuracy of the evaluated signals of a symbol, or of all symbols when none is given,
+    per horizon and per confidence bucket. It is read from the counters the outcome evaluator keeps
+    up to date, never from the signals and candles themselves.
+    """
+    permission_classes = [IsUserVerified]
+
+    async def get(self, request, symbol_name=None, format=None):
+        symbol = None
+        if symbol_name is not None:
+            symbol = await aresolve_symbol(symbol_name)
+            if symbol is None:
+                return Response({'error': 'No symbol found'}, status=status.HTTP_404_NOT_FOUND)
+
+        horizons = await sync_to_async(accuracy_stats)(symbol.id if symbol else None)
+        return Response({'symbol': symbol.name if symbol else None, 'horizons': horizons})
+
+
+def _load_latest_signals(symbols: list):
+    """
+    Fetches the latest signal of each symbol with one query and caches them, remembering the
+    symbols that have none. Returns {symbol name: payload}.
+    """
+    symbol_ids = [symbol.id for symbol in symbols]
+    signals = Signal.objects.select_related('symbol').filter(symbol_id__in=symbol_ids)
+    if connection.vendor == 'postgresql':
+        signals = signals.order_by('symbol_id', '-timestamp').distinct('symbol_id')
+    else:
+        # DISTINCT ON is PostgreSQL only; elsewhere pick each symbol's newest signal with a subquery
+        newest = Signal.objects.filter(symbol_id=OuterRef('symbol_id')).order_by('-timestamp').values('pk')[:1]
+        signals = signals.filter(pk=Subquery(newest))
+    payloads = cache_latest_signals(list(signals))
+    cache_missing_signals([symbol.name for symbol in symbols if symbol.name not in payloads])
+    return payloads
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Whether an Accept-Encoding header accepts gzip: listed with a non-zero q-value, or covered by
+    a non-zero '*' when not listed. A q-value of 0 (or one that does not parse) refuses the coding.
+    """
+    qvalues = {}
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        qvalue = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[name] = qvalue
+    for name in ('gzip', 'x-gzip', '*'):
+        if name in qvalues:
+            return qvalues[name] > 0
+    return False
+
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+def _payload_response(request, payload):
+    """Serves a cached signal payload, honouring If-None-Match and Accept-Encoding."""
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if '*' in etags or payload['etag'] in etags:
+        response = HttpResponseNotModified()
+    elif 'body_gzip' in payload and _accepts_gzip(request.headers.get('Accept-Encoding', '')):
+        response = HttpResponse(payload['body_gzip'], content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(payload['body'], content_type='application/json')
+    response['ETag'] = payload['etag']
+    # Clients may keep the response but must revalidate it, which costs them a 304 until the next signal
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ChatMessage
+from .models import ChatMessage, ChatSummary
 
 
 @admin.register(ChatMessage)
@@ -29,3 +29,15 @@ class ChatMessageAdmin(admin.ModelAdmin):
     def get_short_message(self, obj):
         """Returns a truncated version of the message for the list view."""
         return (obj.message_text[:75] + '...') if len(obj.message_text) > 75 else obj.message_text
+
+
+@admin.register(ChatSummary)
+class ChatSummaryAdmin(admin.ModelAdmin):
+    """Read-only view of the rolling conversation summaries."""
+    list_display = ('user', 'symbol', 'summarised_until', 'updated_at')
+    list_filter = ('symbol',)
+    search_fields = ('user__email', 'symbol__name', 'summary_text')
+    readonly_fields = ('user', 'symbol', 'summary_text', 'summarised_until', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
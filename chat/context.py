@@ -0,0 +1,99 @@
+import logging
+
+from .models import ChatMessage, ChatSummary
+from .services import ChatAIService
+
+logger = logging.getLogger(__name__)
+
+# Most recent turns (a user message and the AI's reply) kept verbatim when older messages are folded
+RECENT_TURNS = 5
+RECENT_MESSAGES = 2 * RECENT_TURNS
+# Unfolded messages let build up beyond the recent window before they are folded, so a summary
+# update is an occasional background call rather than one per reply
+FOLD_THRESHOLD = 10
+# Token budget of the conversation context: the summary plus the unfolded messages
+CONTEXT_TOKEN_BUDGET = 2000
+# Upper bound on the messages folded into the summary by one summarising call
+MAX_MESSAGES_PER_FOLD = 50
+# Unfolded messages sent at most; only reached while folding is failing, until it catches up
+MAX_CONTEXT_MESSAGES = 100
+
+
+def estimate_tokens(text: str):
+    """A rough token count (about four characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def load_chat_context(user, symbol):
+    """
+    Returns (summary_text, messages) for a conversation, oldest message first: the rolling summary
+    and every message after the newest one folded into it, so each message is in one or the other.
+    Folding keeps the unfolded tail short (see `fold_is_due`), so the cost is two small queries
+    however long the conversation is.
+    """
+    summary_text, summarised_until_id = ChatSummary.objects.filter(user=user, symbol=symbol).values_list(
+        'summary_text', 'summarised_until_id').first() or ('', None)
+    messages = ChatMessage.objects.filter(user=user, symbol=symbol)
+    if summarised_until_id:
+        messages = messages.filter(id__gt=summarised_until_id)
+    messages = list(messages.order_by('-created_at', '-id')[:MAX_CONTEXT_MESSAGES])
+    return summary_text, messages[::-1]
+
+
+def _context_tokens(summary_text: str, messages: list):
+    return estimate_tokens(summary_text) + sum(estimate_tokens(message.message_text) for message in messages)
+
+
+def fold_is_due(summary_text: str, messages: list):
+    """
+    Whether the unfolded messages of a context have built up enough to fold: FOLD_THRESHOLD messages
+    beyond the recent window, or more than the token budget.
+    """
+    return (len(messages) >= RECENT_MESSAGES + FOLD_THRESHOLD
+            or _context_tokens(summary_text, messages) > CONTEXT_TOKEN_BUDGET)
+
+
+def _messages_to_keep(summary_text: str, messages: list):
+    """The number of newest messages left unfolded: up to RECENT_MESSAGES, as many as fit the token budget."""
+    budget = CONTEXT_TOKEN_BUDGET - estimate_tokens(summary_text)
+    kept = 0
+    for message in reversed(messages[-RECENT_MESSAGES:]):
+        budget -= estimate_tokens(message.message_text)
+        if kept and budget < 0:
+            break
+        kept += 1
+    return kept
+
+
+def fold_old_messages(user_id: int, symbol_id: int):
+    """
+    Folds every unfolded message except the newest ones that fit the context into the rolling summary.
+    Only the messages after the summary's cursor are sent to the model, together with the previous
+    summary, at most MAX_MESSAGES_PER_FOLD per call; the cursor advances after each call, so a
+    failed call leaves the remaining messages unfolded, and still in the context, for the next run.
+    Returns True if the summary was updated.
+    """
+    summary, _ = ChatSummary.objects.select_related('symbol').get_or_create(user_id=user_id, symbol_id=symbol_id)
+    unfolded = ChatMessage.objects.filter(user_id=user_id, symbol_id=symbol_id)
+    if summary.summarised_until_id:
+        unfolded = unfolded.filter(id__gt=summary.summarised_until_id)
+    unfolded = list(unfolded.order_by('id'))
+    to_fold = unfolded[:len(unfolded) - _messages_to_keep(summary.summary_text, unfolded)]
+    if not to_fold:
+        return False
+
+    service = ChatAIService(symbol_name=summary.symbol.name, history=[])
+    folded = 0
+    for start in range(0, len(to_fold), MAX_MESSAGES_PER_FOLD):
+        chunk = to_fold[start:start + MAX_MESSAGES_PER_FOLD]
+        summary_text = service.summarise(summary.summary_text, chunk)
+        if summary_text is None:
+            break
+        summary.summary_text = summary_text
+        summary.summarised_until = chunk[-1]
+        summary.save(update_fields=['summary_text', 'summarised_until', 'updated_at'])
+        folded += len(chunk)
+
+    if folded:
+        logger.info(f"Folded {folded} messages into the chat summary of user {user_id} on {summary.symbol.name}.")
+    return folded > 0
@@ -0,0 +1,48 @@
+import asyncio
+import statistics
+import time
+
+import httpx
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends concurrent chat messages to a running server and reports latencies. "
+        "The concurrency factor (sum of request latencies / wall time) is close to 1 when "
+        "requests serialise on worker threads and close to --concurrency when they overlap."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the server.")
+        parser.add_argument('--token', required=True, help="JWT access token of a verified user.")
+        parser.add_argument('--symbol', default='BTC-USDT')
+        parser.add_argument('--requests', type=int, default=50, help="Total number of chat messages to send.")
+        parser.add_argument('--concurrency', type=int, default=10, help="Messages in flight at once.")
+        parser.add_argument('--stream', action='store_true', help="Use the SSE streaming endpoint.")
+
+    def handle(self, *args, **options):
+        results = asyncio.run(self._run(options))
+        latencies = sorted(latency for latency, _, _ in results)
+        wall_time = max(end for _, _, end in results) - min(end - latency for latency, _, end in results)
+        failures = sum(1 for _, ok, _ in results if not ok)
+
+        self.stdout.write(f"Requests: {len(results)} ({failures} failed), concurrency {options['concurrency']}")
+        self.stdout.write(f"Wall time: {wall_time:.2f}s, throughput: {len(results) / wall_time:.2f} req/s")
+        self.stdout.write(f"Latency p50: {statistics.median(latencies):.2f}s, "
+                          f"p95: {latencies[int(0.95 * (len(latencies) - 1))]:.2f}s, max: {latencies[-1]:.2f}s")
+        self.stdout.write(self.style.SUCCESS(f"Concurrency factor: {sum(latencies) / wall_time:.2f}"))
+
+    async def _run(self, options):
+        path = f"/chat/conversation/{options['symbol']}/" + ('stream/' if options['stream'] else '')
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        async with httpx.AsyncClient(base_url=options['url'], timeout=120,
+                                     headers={'Authorization': f"Bearer {options['token']}"}) as client:
+            async def send(i):
+                async with semaphore:
+                    started_at = time.monotonic()
+                    response = await client.post(path, json={'message': f"Load test message {i}"})
+                    ended_at = time.monotonic()
+                    return ended_at - started_at, response.status_code < 400, ended_at
+
+            return await asyncio.gather(*(send(i) for i in range(options['requests'])))
@@ -30,3 +30,28 @@ class ChatMessage(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # A user's conversation about a symbol, newest first
+            models.Index(fields=['user', 'symbol', '-created_at'], name='chatmessage_history_idx'),
+        ]
+
+
+class ChatSummary(models.Model):
+    """
+    The rolling summary of the older part of a conversation between a user and the AI
+    about a symbol. Messages drop out of the verbatim context window into this summary,
+    which is updated incrementally (see chat.context).
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chat_summaries')
+    symbol = models.ForeignKey(Symbol, on_delete=models.CASCADE, related_name='chat_summaries')
+    summary_text = models.TextField(blank=True)
+    # The newest message folded into the summary
+    summarised_until = models.ForeignKey(ChatMessage, on_delete=models.SET_NULL, null=True, blank=True,
+                                         related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Chat summary of {self.user.email} on {self.symbol.name}"
+
+    class Meta:
+        unique_together = ('user', 'symbol')
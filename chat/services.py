@@ -1,55 +1,168 @@
-import json
+import asyncio
 import os
-from openai import OpenAI, OpenAIError
+import weakref
+from functools import cached_property
+from openai import OpenAI, AsyncOpenAI, OpenAIError
 import logging
+from asgiref.sync import sync_to_async
+
+from ai_signals.response_cache import LLMResponseCache, prompt_version, request_digest
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a helpful and expert trading assistant AI. "
+    "The user is currently viewing the chart for the symbol '{symbol_name}'. "
+    "Your knowledge is up to date. Answer the user's questions concisely and directly "
+    "based on general market knowledge, technical analysis principles, and the context of the conversation. "
+    "Do not provide financial advice. Be friendly and professional."
+)
+CHAT_PROMPT_VERSION = prompt_version(CHAT_SYSTEM_PROMPT)
+CHAT_SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and a trading assistant "
+    "about the symbol '{symbol_name}'. Update the summary below with the new messages. Keep the "
+    "user's goals, questions, stated positions and any conclusions; drop small talk. "
+    "Reply with the updated summary only, in at most 150 words."
+)
+CHAT_ERROR_MESSAGE = "Sorry, I'm having trouble connecting to my brain right now. Please try again later."
+
+# One async client (and connection pool) per event loop, shared by all requests served on it
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client(base_url: str, api_key: str):
+    """Returns the AsyncOpenAI client of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncOpenAI(base_url=base_url, api_key=api_key)
+    return client
 
 
 class ChatAIService:
     """
-    Handles conversations with the AI about a specific symbol,
-    using the existing chat history as context.
+    Handles conversations with the AI about a specific symbol, using the recent messages
+    and the rolling summary of the older ones (see chat.context) as context.
     """
 
-    def __init__(self, symbol_name: str, history: list):
+    def __init__(self, symbol_name: str, history: list, summary: str = ''):
         api_key = os.environ.get('LIARA_API_KEY')
         base_url = os.environ.get('LIARA_BASE_URL')
 
         if not api_key or not base_url:
             raise ValueError("LIARA_API_KEY and LIARA_BASE_URL must be set.")
 
-        self.client = OpenAI(base_url=base_url, api_key=api_key)
+        self._client_options = {'base_url': base_url, 'api_key': api_key}
         self.model = "openai/gpt-4o-mini"
         self.symbol_name = symbol_name
         self.history = history
+        self.summary = summary
+        self.response_cache = LLMResponseCache()
+
+    @cached_property
+    def client(self):
+        """
+        The synchronous client, for `get_ai_response` and `summarise`. It is created on first use, since
+        async views and streams use the shared async client and should not build a connection pool.
+        """
+        return OpenAI(**self._client_options)
 
     def get_ai_response(self, user_message: str):
         """
         Gets a response from the AI based on the user's message and chat history.
+        The same message in the same conversation is answered from the response cache.
         """
-        system_prompt = self._build_system_prompt()
-        messages = self._build_message_history(system_prompt, user_message)
+        messages, digest = self._prepare_request(user_message)
+        cached = self.response_cache.get(digest)
+        if cached is not None:
+            return cached
 
         try:
             completion = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages
             )
-            return completion.choices[0].message.content
+            response = completion.choices[0].message.content
+            self.response_cache.set(digest, response)
+            return response
         except OpenAIError as e:
             logging.error(f"An error occurred with the Chat AI API: {e}")
-            return "Sorry, I'm having trouble connecting to my brain right now. Please try again later."
+            return CHAT_ERROR_MESSAGE
 
-    def _build_system_prompt(self):
-        return (
-            f"You are a helpful and expert trading assistant AI. "
-            f"The user is currently viewing the chart for the symbol '{self.symbol_name}'. "
-            f"Your knowledge is up to date. Answer the user's questions concisely and directly "
-            f"based on general market knowledge, technical analysis principles, and the context of the conversation. "
-            f"Do not provide financial advice. Be friendly and professional."
+    async def aget_ai_response(self, user_message: str):
+        """Async version of `get_ai_response`, for async views."""
+        messages, digest = self._prepare_request(user_message)
+        cached = await sync_to_async(self.response_cache.get)(digest)
+        if cached is not None:
+            return cached
+
+        try:
+            completion = await get_async_client(**self._client_options).chat.completions.create(
+                model=self.model,
+                messages=messages
+            )
+            response = completion.choices[0].message.content
+            await sync_to_async(self.response_cache.set)(digest, response)
+            return response
+        except OpenAIError as e:
+            logging.error(f"An error occurred with the Chat AI API: {e}")
+            return CHAT_ERROR_MESSAGE
+
+    async def stream_ai_response(self, user_message: str):
+        """
+        Yields the AI's response in chunks as the model generates them, using the streaming API.
+        A cached response is yielded as a single chunk; on an API error the error message is yielded instead.
+        """
+        messages, digest = self._prepare_request(user_message)
+        cached = await sync_to_async(self.response_cache.get)(digest)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        try:
+            stream = await get_async_client(**self._client_options).chat.completions.create(
+                model=self.model, messages=messages, stream=True)
+            async for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    chunks.append(text)
+                    yield text
+        except OpenAIError as e:
+            logging.error(f"An error occurred with the Chat AI API while streaming: {e}")
+            yield CHAT_ERROR_MESSAGE
+            return
+        await sync_to_async(self.response_cache.set)(digest, ''.join(chunks))
+
+    def summarise(self, previous_summary: str, messages: list):
+        """Returns the summary updated with the given messages, or None on an API error."""
+        transcript = "\n".join(
+            f"{'User' if message.owner == 'USER' else 'Assistant'}: {message.message_text}" for message in messages
         )
+        try:
+            completion = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": CHAT_SUMMARY_PROMPT.format(symbol_name=self.symbol_name)},
+                    {"role": "user", "content": f"Summary so far:\n{previous_summary or '(empty)'}\n\n"
+                                                f"New messages:\n{transcript}"},
+                ]
+            )
+            return completion.choices[0].message.content
+        except OpenAIError as e:
+            logging.error(f"An error occurred while summarising a chat: {e}")
+            return None
+
+    def _prepare_request(self, user_message: str):
+        """Returns the messages sent to the model and the digest the response is cached under."""
+        messages = self._build_message_history(self._build_system_prompt(), user_message)
+        return messages, request_digest(self.model, CHAT_PROMPT_VERSION, [self.symbol_name, messages[1:]])
+
+    def _build_system_prompt(self):
+        return CHAT_SYSTEM_PROMPT.format(symbol_name=self.symbol_name)
 
     def _build_message_history(self, system_prompt: str, user_message: str):
         messages = [{"role": "system", "content": system_prompt}]
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
 
         # Add past messages to the history
         for message in self.history:
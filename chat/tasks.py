@@ -0,0 +1,12 @@
+from celery import shared_task
+from .context import fold_old_messages
+
+
+@shared_task
+def update_chat_summary(user_id: int, symbol_id: int):
+    """
+    Folds the messages that have left the recent context window into the conversation's
+    rolling summary, outside the request that produced them.
+    """
+    updated = fold_old_messages(user_id, symbol_id)
+    return f"Chat summary of user {user_id} on symbol {symbol_id} {'updated' if updated else 'unchanged'}."
@@ -1,10 +1,20 @@
-from django.test import TestCase
+from django.test import TestCase, AsyncClient
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 from rest_framework import status
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock, AsyncMock
+from asgiref.sync import async_to_sync
+from rest_framework_simplejwt.tokens import AccessToken
+import asyncio
+import time
+from django.core.cache import cache
 from market_data.models import Symbol
-from .models import ChatMessage
+from market_data.symbol_registry import invalidate_symbol_registry
+from market_data.tests import query_plan, SORT_IN_PLAN
+from .models import ChatMessage, ChatSummary
+from .context import (load_chat_context, fold_old_messages, fold_is_due, RECENT_MESSAGES, FOLD_THRESHOLD,
+                      MAX_MESSAGES_PER_FOLD)
+from .services import ChatAIService
 
 User = get_user_model()
 
@@ -17,6 +27,10 @@ class ComprehensiveChatTests(TestCase):
         self.symbol = Symbol.objects.create(name='CHAT-COIN', is_active=True)
         # Authenticate the client for all tests in this class
         self.client.force_authenticate(user=self.user)
+        # LLM responses are cached in Redis, so clear it to keep tests isolated
+        cache.clear()
+        # Symbol changes reach the registry on commit, which a test case never reaches
+        invalidate_symbol_registry()
 
     def test_get_empty_chat_history(self):
         """Test retrieving a chat history when no messages exist."""
@@ -25,7 +39,7 @@ class ComprehensiveChatTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 0)
 
-    @patch('chat.services.ChatAIService.get_ai_response')
+    @patch('chat.services.ChatAIService.aget_ai_response')
     def test_post_message_and_get_history(self, mock_get_ai_response):
         """Test the full conversation flow: POSTing a message and then GETting the history."""
         # --- Step 1: POST a new message ---
@@ -66,3 +80,177 @@ class ComprehensiveChatTests(TestCase):
 
         post_response = unauthenticated_client.post(url, {'message': 'test'}, format='json')
         self.assertEqual(post_response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # --- Async View Tests ---
+
+    @patch.dict('os.environ', {'LIARA_API_KEY': 'key', 'LIARA_BASE_URL': 'http://llm.invalid'})
+    @patch('chat.views.update_chat_summary.delay')
+    @patch('chat.services.ChatAIService.aget_ai_response')
+    async def test_concurrent_chat_requests_overlap(self, mock_aget_ai_response, mock_update_summary):
+        """Test that chat requests waiting on the LLM run concurrently instead of one after another."""
+        async def slow_response(user_message):
+            await asyncio.sleep(0.3)
+            return "Answer."
+        mock_aget_ai_response.side_effect = slow_response
+        client = AsyncClient()
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        url = f'/chat/conversation/{self.symbol.name}/'
+
+        started_at = time.monotonic()
+        responses = await asyncio.gather(*(client.post(url, {'message': f"Question {i}"}, headers=headers,
+                                                       content_type='application/json') for i in range(5)))
+        elapsed = time.monotonic() - started_at
+
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_201_CREATED] * 5)
+        self.assertLess(elapsed, 5 * 0.3)
+        self.assertEqual(await ChatMessage.objects.filter(owner='AI').acount(), 5)
+
+    # --- Query Plan Tests ---
+
+    def test_recent_messages_query_uses_the_history_index(self):
+        """Test a conversation's newest messages are found through the (user, symbol, -created_at) index."""
+        plan = query_plan(ChatMessage.objects.filter(user=self.user, symbol=self.symbol).order_by('-created_at')[:20])
+        self.assertIn('chatmessage_history_idx', plan)
+        self.assertNotRegex(plan, SORT_IN_PLAN)
+
+    # --- Context Window Tests ---
+
+    def _create_messages(self, count):
+        for i in range(count):
+            ChatMessage.objects.create(user=self.user, symbol=self.symbol, message_text=f"Message {i}",
+                                       owner='USER' if i % 2 == 0 else 'AI')
+
+    def test_chat_context_reads_a_constant_amount(self):
+        """Test only the unfolded messages and the summary are loaded, however long the conversation."""
+        self._create_messages(40)
+        ChatSummary.objects.create(user=self.user, symbol=self.symbol, summary_text="Earlier summary.",
+                                   summarised_until=ChatMessage.objects.get(message_text="Message 29"))
+
+        with self.assertNumQueries(2):
+            summary, history = load_chat_context(self.user, self.symbol)
+
+        self.assertEqual(summary, "Earlier summary.")
+        self.assertEqual([m.message_text for m in history], [f"Message {i}" for i in range(30, 40)])
+
+    @patch.dict('os.environ', {'LIARA_API_KEY': 'key', 'LIARA_BASE_URL': 'http://llm.invalid'})
+    @patch('chat.services.ChatAIService.summarise')
+    def test_old_messages_are_folded_into_summary_incrementally(self, mock_summarise):
+        """Test messages leaving the recent window are summarised once, on top of the previous summary."""
+        mock_summarise.side_effect = ["First summary.", "Second summary."]
+        self._create_messages(RECENT_MESSAGES + 4)
+
+        self.assertTrue(fold_old_messages(self.user.id, self.symbol.id))
+        self.assertEqual([m.message_text for m in mock_summarise.call_args.args[1]],
+                         [f"Message {i}" for i in range(4)])
+        self.assertFalse(fold_old_messages(self.user.id, self.symbol.id))  # Nothing new to fold
+
+        self._create_messages(2)
+        self.assertTrue(fold_old_messages(self.user.id, self.symbol.id))
+        self.assertEqual(mock_summarise.call_args.args[0], "First summary.")
+        self.assertEqual(len(mock_summarise.call_args.args[1]), 2)
+        self.assertEqual(ChatSummary.objects.get().summary_text, "Second summary.")
+
+    @patch.dict('os.environ', {'LIARA_API_KEY': 'key', 'LIARA_BASE_URL': 'http://llm.invalid'})
+    @patch('chat.services.ChatAIService.summarise')
+    def test_every_message_is_in_the_summary_or_the_context(self, mock_summarise):
+        """Test messages stay in the context until folded, and folding covers whatever the budget leaves out."""
+        mock_summarise.side_effect = lambda previous, messages: f"{previous} +{len(messages)}"
+        self._create_messages(RECENT_MESSAGES + 3)
+        summary, history = load_chat_context(self.user, self.symbol)
+        self.assertEqual(len(history), RECENT_MESSAGES + 3)
+        self.assertFalse(fold_is_due(summary, history))
+
+        # Long messages exceed the token budget: only the newest that fit are kept, the rest are folded
+        for i in range(4):
+            ChatMessage.objects.create(user=self.user, symbol=self.symbol, message_text='x' * 3000, owner='USER')
+        summary, history = load_chat_context(self.user, self.symbol)
+        self.assertTrue(fold_is_due(summary, history))
+        self.assertTrue(fold_old_messages(self.user.id, self.symbol.id))
+        summary, history = load_chat_context(self.user, self.symbol)
+        self.assertEqual(len(history), 2)
+        self.assertEqual(ChatSummary.objects.get().summarised_until.id + 1, history[0].id)
+
+        # A backlog larger than one summarising call is folded in several, and a failed call loses nothing
+        self._create_messages(MAX_MESSAGES_PER_FOLD + FOLD_THRESHOLD)
+        mock_summarise.side_effect = ["Folded.", None]
+        self.assertTrue(fold_old_messages(self.user.id, self.symbol.id))
+        summary, history = load_chat_context(self.user, self.symbol)
+        self.assertEqual(summary, "Folded.")
+        # The two long messages went into the first call; the two messages of the failed one are still sent
+        self.assertEqual(len(history), 2 + RECENT_MESSAGES)
+        self.assertEqual(ChatSummary.objects.get().summarised_until.id + 1, history[0].id)
+
+    @patch.dict('os.environ', {'LIARA_API_KEY': 'key', 'LIARA_BASE_URL': 'http://llm.invalid'})
+    def test_summary_is_sent_before_recent_messages(self):
+        """Test the model sees the summary, then the recent messages, then the new message once."""
+        self._create_messages(2)
+        summary, history = load_chat_context(self.user, self.symbol)
+        service = ChatAIService(symbol_name=self.symbol.name, history=history, summary="Earlier summary.")
+
+        messages = service._build_message_history("System prompt", "New question")
+
+        self.assertEqual(messages[1], {"role": "system",
+                                       "content": "Summary of the earlier conversation: Earlier summary."})
+        self.assertEqual([m['content'] for m in messages[2:]], ["Message 0", "Message 1", "New question"])
+
+    # --- Streaming Tests ---
+
+    @patch.dict('os.environ', {'LIARA_API_KEY': 'key', 'LIARA_BASE_URL': 'http://llm.invalid'})
+    @patch('chat.views.update_chat_summary.delay')
+    @patch('chat.services.ChatAIService.stream_ai_response')
+    def test_stream_message_sends_tokens_and_saves_response(self, mock_stream_ai_response, mock_update_summary):
+        """Test the SSE endpoint sends each chunk as it arrives and saves the full response at the end."""
+        async def fake_stream(user_message):
+            for text in ("The trend ", "is up."):
+                yield text
+        mock_stream_ai_response.side_effect = fake_stream
+        # Enough unfolded messages for this exchange to make a fold due
+        self._create_messages(RECENT_MESSAGES + FOLD_THRESHOLD - 2)
+        url = f'/chat/conversation/{self.symbol.name}/stream/'
+
+        response = self.client.post(url, {'message': 'What is the trend?'}, format='json')
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        async def read_stream():
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        body = async_to_sync(read_stream)()
+        events = [event for event in body.split('\n\n') if event]
+        self.assertEqual(events[0], 'event: token\ndata: {"text": "The trend "}')
+        self.assertEqual(events[1], 'event: token\ndata: {"text": "is up."}')
+        self.assertTrue(events[2].startswith('event: done'))
+        self.assertEqual(ChatMessage.objects.filter(owner='AI').latest('id').message_text, "The trend is up.")
+        mock_update_summary.assert_called_once_with(self.user.id, self.symbol.id)
+
+    @patch.dict('os.environ', {'LIARA_API_KEY': 'key', 'LIARA_BASE_URL': 'http://llm.invalid'})
+    @patch('chat.services.OpenAI')
+    def test_sync_client_is_only_created_for_sync_calls(self, MockOpenAI):
+        """Test building the service, as every async request does, creates no synchronous client."""
+        service = ChatAIService(symbol_name=self.symbol.name, history=[])
+        MockOpenAI.assert_not_called()
+
+        MockOpenAI.return_value.chat.completions.create.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content="Summary."))])
+        self.assertEqual(service.summarise('', []), "Summary.")
+        self.assertEqual(service.summarise('', []), "Summary.")
+        MockOpenAI.assert_called_once_with(base_url='http://llm.invalid', api_key='key')
+
+    @patch.dict('os.environ', {'LIARA_API_KEY': 'key', 'LIARA_BASE_URL': 'http://llm.invalid'})
+    @patch('chat.services.AsyncOpenAI')
+    def test_stream_ai_response_yields_deltas_and_caches_result(self, MockAsyncOpenAI):
+        """Test the service yields streamed deltas and answers a repeated message from the cache."""
+        async def fake_stream():
+            for text in ("Hello", None, " there"):
+                yield MagicMock(choices=[MagicMock(delta=MagicMock(content=text))])
+        client = MockAsyncOpenAI.return_value
+        client.chat.completions.create = AsyncMock(return_value=fake_stream())
+        client.close = AsyncMock()
+        service = ChatAIService(symbol_name=self.symbol.name, history=[])
+
+        async def collect():
+            return [text async for text in service.stream_ai_response("Hi")]
+
+        self.assertEqual(async_to_sync(collect)(), ["Hello", " there"])
+        self.assertEqual(async_to_sync(collect)(), ["Hello there"])
+        client.chat.completions.create.assert_awaited_once()
+
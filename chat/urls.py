@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import ChatConversationView
+from .views import ChatConversationView, ChatStreamView
 
 urlpatterns = [
     path('conversation/<str:symbol_name>/', ChatConversationView.as_view(), name='chat-conversation'),
+    path('conversation/<str:symbol_name>/stream/', ChatStreamView.as_view(), name='chat-conversation-stream'),
 ]
\ No newline at end of file
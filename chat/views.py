@@ -1,10 +1,17 @@
-from rest_framework.views import APIView
+import json
+
+from asgiref.sync import sync_to_async
+from adrf.views import APIView
+from django.http import StreamingHttpResponse
 from rest_framework.response import Response
 from rest_framework import status
-from .models import ChatMessage, Symbol
+from .models import ChatMessage
 from .serializers import ChatMessageSerializer, UserMessageSerializer
 from .services import ChatAIService
+from .context import load_chat_context, fold_is_due
+from .tasks import update_chat_summary
 from accounts.permissions import IsUserVerified
+from market_data.symbol_registry import aresolve_symbol
 
 
 class ChatConversationView(APIView):
@@ -12,24 +19,25 @@ class ChatConversationView(APIView):
     Handles the entire chat conversation for a specific symbol.
     GET: Retrieves the chat history.
     POST: Submits a new message and gets an AI response.
+    The handlers are async, so under ASGI a request waiting on the LLM does not hold a thread.
     """
     permission_classes = [IsUserVerified]
 
-    def get(self, request, symbol_name, format=None):
+    async def get(self, request, symbol_name, format=None):
         """Returns the last 20 messages for the user and symbol."""
-        try:
-            symbol = Symbol.objects.get(name__iexact=symbol_name)
-            messages = ChatMessage.objects.filter(
-                user=request.user,
-                symbol=symbol
-            ).order_by('-created_at')[:20]  # Get the last 20 messages
-
-            serializer = ChatMessageSerializer(reversed(messages), many=True)
-            return Response(serializer.data)
-        except Symbol.DoesNotExist:
+        symbol = await aresolve_symbol(symbol_name)
+        if symbol is None:
             return Response({"error": "Symbol not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    def post(self, request, symbol_name, format=None):
+        messages = [message async for message in ChatMessage.objects.filter(
+            user=request.user,
+            symbol_id=symbol.id
+        ).order_by('-created_at')[:20]]  # Get the last 20 messages
+
+        serializer = ChatMessageSerializer(reversed(messages), many=True)
+        return Response(serializer.data)
+
+    async def post(self, request, symbol_name, format=None):
         """Receives a user message, gets an AI response, and saves both."""
         serializer = UserMessageSerializer(data=request.data)
         if not serializer.is_valid():
@@ -37,37 +45,98 @@ class ChatConversationView(APIView):
 
         user_message_text = serializer.validated_data.get('message')
 
-        try:
-            symbol = Symbol.objects.get(name__iexact=symbol_name)
-        except Symbol.DoesNotExist:
+        symbol = await aresolve_symbol(symbol_name)
+        if symbol is None:
             return Response({"error": "Symbol not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        # 1. Save the user's message
-        ChatMessage.objects.create(
+        # 1. Get the bounded context for the AI: the rolling summary and the recent messages
+        summary, history = await sync_to_async(load_chat_context)(request.user, symbol.id)
+
+        # 2. Save the user's message
+        user_message = await ChatMessage.objects.acreate(
             user=request.user,
-            symbol=symbol,
+            symbol_id=symbol.id,
             message_text=user_message_text,
             owner=ChatMessage.MessageOwner.USER
         )
 
-        # 2. Get history to provide context to the AI
-        history = ChatMessage.objects.filter(
-            user=request.user,
-            symbol=symbol
-        ).order_by('created_at')
-
         # 3. Get AI response
-        service = ChatAIService(symbol_name=symbol.name, history=list(history))
-        ai_response_text = service.get_ai_response(user_message_text)
+        service = ChatAIService(symbol_name=symbol.name, history=history, summary=summary)
+        ai_response_text = await service.aget_ai_response(user_message_text)
 
         # 4. Save the AI's response
-        ai_message = ChatMessage.objects.create(
+        ai_message = await ChatMessage.objects.acreate(
             user=request.user,
-            symbol=symbol,
+            symbol_id=symbol.id,
             message_text=ai_response_text,
             owner=ChatMessage.MessageOwner.AI
         )
 
+        # Once enough older messages have built up, they are folded into the summary in the background
+        if fold_is_due(summary, [*history, user_message, ai_message]):
+            await sync_to_async(update_chat_summary.delay)(request.user.id, symbol.id)
+
         # 5. Return the AI's response to the client
         response_serializer = ChatMessageSerializer(ai_message)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+
+class ChatStreamView(APIView):
+    """
+    Streams the AI response to a new message as Server-Sent Events.
+    Each chunk of text is sent as a `token` event as soon as the model produces it; when the
+    stream ends the full response is saved as a ChatMessage and sent as a `done` event.
+    The stream is an async iterator, so under ASGI an open stream does not hold a worker thread.
+    """
+    permission_classes = [IsUserVerified]
+
+    async def post(self, request, symbol_name, format=None):
+        serializer = UserMessageSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user_message_text = serializer.validated_data.get('message')
+
+        symbol = await aresolve_symbol(symbol_name)
+        if symbol is None:
+            return Response({"error": "Symbol not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        summary, history = await sync_to_async(load_chat_context)(request.user, symbol.id)
+        user_message = await ChatMessage.objects.acreate(
+            user=request.user,
+            symbol_id=symbol.id,
+            message_text=user_message_text,
+            owner=ChatMessage.MessageOwner.USER
+        )
+        service = ChatAIService(symbol_name=symbol.name, history=history, summary=summary)
+
+        response = StreamingHttpResponse(
+            self._stream_events(service, request.user, symbol, user_message_text,
+                                (summary, [*history, user_message])),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Stop reverse proxies from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def _stream_events(self, service, user, symbol, user_message_text, context):
+        chunks = []
+        async for text in service.stream_ai_response(user_message_text):
+            chunks.append(text)
+            yield _sse_event('token', {'text': text})
+
+        ai_message = await ChatMessage.objects.acreate(
+            user=user,
+            symbol_id=symbol.id,
+            message_text=''.join(chunks),
+            owner=ChatMessage.MessageOwner.AI
+        )
+        summary, messages = context
+        if fold_is_due(summary, [*messages, ai_message]):
+            await sync_to_async(update_chat_summary.delay)(user.id, symbol.id)
+        yield _sse_event('done', ChatMessageSerializer(ai_message).data)
+
+
+def _sse_event(event: str, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
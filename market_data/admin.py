@@ -1,5 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 from .models import Symbol, Candle
+from .symbol_registry import invalidate_symbol_registry
+from .candle_buffer import invalidate_candle_buffers_on_commit
 
 
 @admin.register(Symbol)
@@ -8,10 +11,25 @@ class SymbolAdmin(admin.ModelAdmin):
     Admin interface for managing trading symbols.
     Admins can add new symbols and activate/deactivate them for data fetching.
     """
-    list_display = ('name', 'is_active', 'created_at')
-    list_filter = ('is_active',)
+    list_display = ('name', 'is_active', 'use_llm_signals', 'last_candle_at', 'created_at')
+    list_filter = ('is_active', 'use_llm_signals')
     search_fields = ('name',)
     ordering = ('name',)
+    actions = ('activate_symbols', 'deactivate_symbols')
+
+    @admin.action(description="Activate selected symbols")
+    def activate_symbols(self, request, queryset):
+        self._set_active(request, queryset, True)
+
+    @admin.action(description="Deactivate selected symbols")
+    def deactivate_symbols(self, request, queryset):
+        self._set_active(request, queryset, False)
+
+    def _set_active(self, request, queryset, is_active):
+        # A queryset update sends no model signals, so the symbol registry is invalidated here, once committed
+        updated = queryset.update(is_active=is_active)
+        transaction.on_commit(invalidate_symbol_registry)
+        self.message_user(request, f"{'Activated' if is_active else 'Deactivated'} {updated} symbols.")
 
 
 @admin.register(Candle)
@@ -21,8 +39,8 @@ class CandleAdmin(admin.ModelAdmin):
     This interface is strictly read-only to ensure data integrity,
     as candle data should only be populated by the automated fetching tasks.
     """
-    list_display = ('symbol', 'timestamp', 'open', 'high', 'low', 'close', 'volume')
-    list_filter = ('symbol',)
+    list_display = ('symbol', 'interval', 'timestamp', 'open', 'high', 'low', 'close', 'volume')
+    list_filter = ('interval', 'symbol')
     search_fields = ('symbol__name',)
     date_hierarchy = 'timestamp'  # Allows for quick date-based navigation
     ordering = ('-timestamp',)
@@ -39,3 +57,13 @@ class CandleAdmin(admin.ModelAdmin):
         """Allow deletion for maintenance, but it's generally not recommended."""
         # You can change this to False if you want to prevent any deletion.
         return True
+
+    def delete_model(self, request, obj):
+        # Deletes send no buffer invalidation of their own, so the affected buffer is dropped here
+        super().delete_model(request, obj)
+        invalidate_candle_buffers_on_commit([(obj.symbol_id, obj.interval)])
+
+    def delete_queryset(self, request, queryset):
+        pairs = list(queryset.order_by().values_list('symbol_id', 'interval').distinct())
+        super().delete_queryset(request, queryset)
+        invalidate_candle_buffers_on_commit(pairs)
@@ -0,0 +1,108 @@
+import operator
+from datetime import datetime, timezone
+from functools import reduce
+
+import numpy as np
+from django.db.models import Min, Q
+
+from .models import Candle
+from .services import INTERVAL_SECONDS
+
+BASE_INTERVAL = Candle.Interval.FIFTEEN_MINUTES
+DERIVED_INTERVALS = [Candle.Interval.ONE_HOUR, Candle.Interval.FOUR_HOURS, Candle.Interval.ONE_DAY]
+
+OHLCV_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+# Derived values are rounded to the 8 decimal places the exchange quotes
+PRICE_DECIMALS = 8
+
+
+def rollup(timestamps, opens, highs, lows, closes, volumes, interval_seconds: int):
+    """
+    Aggregates an ascending series of candles into buckets of `interval_seconds`, aligned to UTC.
+    All inputs are NumPy arrays of equal length; `timestamps` holds UNIX seconds.
+    Returns a dict of arrays with one entry per bucket: the bucket start time, OHLCV and
+    the number of base candles that went into it.
+    """
+    buckets = timestamps - timestamps % interval_seconds
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(timestamps)] - 1
+    return {
+        'timestamp': buckets[starts],
+        'open': opens[starts],
+        'high': np.maximum.reduceat(highs, starts),
+        'low': np.minimum.reduceat(lows, starts),
+        'close': closes[ends],
+        'volume': np.add.reduceat(volumes, starts),
+        'count': ends - starts + 1,
+    }
+
+
+def update_rollups(since_by_symbol: dict):
+    """
+    Recomputes the higher-interval candles affected by newly stored base candles.
+    `since_by_symbol` maps a symbol id to the start time of its oldest new base candle.
+    Only the buckets from that point on are rebuilt; the still-open bucket of each interval
+    is stored too and is updated again as its remaining base candles close.
+    Returns the derived Candle instances that were written.
+    """
+    if not since_by_symbol:
+        return []
+
+    # Every affected bucket starts at or after the start of the day of the oldest new candle.
+    day = INTERVAL_SECONDS[Candle.Interval.ONE_DAY]
+    load_from = {
+        symbol_id: int(since.timestamp()) - int(since.timestamp()) % day
+        for symbol_id, since in since_by_symbol.items()
+    }
+    # Each symbol is read from its own start; symbols sharing a start share one condition
+    symbols_by_start = {}
+    for symbol_id, start in load_from.items():
+        symbols_by_start.setdefault(start, []).append(symbol_id)
+    since_condition = reduce(operator.or_, (
+        Q(symbol_id__in=symbol_ids, timestamp__gte=datetime.fromtimestamp(start, tz=timezone.utc))
+        for start, symbol_ids in symbols_by_start.items()
+    ))
+    rows = Candle.objects.filter(since_condition, interval=BASE_INTERVAL).order_by(
+        'symbol_id', 'timestamp').values_list('symbol_id', 'timestamp', *OHLCV_FIELDS)
+
+    series = {}
+    for symbol_id, timestamp, *ohlcv in rows:
+        series.setdefault(symbol_id, []).append((int(timestamp.timestamp()), *ohlcv))
+
+    derived = []
+    for symbol_id, candles in series.items():
+        columns = np.array(candles, dtype=np.float64).T
+        timestamps = columns[0].astype(np.int64)
+        since = int(since_by_symbol[symbol_id].timestamp())
+        for interval in DERIVED_INTERVALS:
+            interval_seconds = INTERVAL_SECONDS[interval]
+            bars = rollup(timestamps, *columns[1:], interval_seconds)
+            for i in np.flatnonzero(bars['timestamp'] >= since - since % interval_seconds):
+                derived.append(Candle(
+                    symbol_id=symbol_id,
+                    interval=interval,
+                    timestamp=datetime.fromtimestamp(int(bars['timestamp'][i]), tz=timezone.utc),
+                    **{field: round(float(bars[field][i]), PRICE_DECIMALS) for field in OHLCV_FIELDS},
+                ))
+
+    Candle.objects.bulk_create(
+        derived, batch_size=1000, update_conflicts=True,
+        unique_fields=['symbol', 'interval', 'timestamp'], update_fields=OHLCV_FIELDS,
+    )
+    return derived
+
+
+def rebuild_rollups(symbol_ids: list = None):
+    """
+    Rebuilds the derived candles from the stored base candles, e.g. after enabling a new interval.
+    Rebuilding starts at the first full day of base data, since older buckets may have been pruned.
+    """
+    base = Candle.objects.filter(interval=BASE_INTERVAL)
+    if symbol_ids is not None:
+        base = base.filter(symbol_id__in=symbol_ids)
+    day = INTERVAL_SECONDS[Candle.Interval.ONE_DAY]
+    since_by_symbol = {}
+    for row in base.values('symbol_id').annotate(oldest=Min('timestamp')):
+        oldest = int(row['oldest'].timestamp())
+        since_by_symbol[row['symbol_id']] = datetime.fromtimestamp(oldest + (-oldest) % day, tz=timezone.utc)
+    return len(update_rollups(since_by_symbol))
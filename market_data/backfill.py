@@ -0,0 +1,241 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from itertools import islice
+
+import numpy as np
+from django.db import connection, transaction
+
+from .models import Symbol, Candle
+from .aggregation import BASE_INTERVAL, update_rollups
+from .candle_buffer import OHLCV_FIELDS, invalidate_candle_buffer
+from .ingestion import last_closed_candle_start, page_windows
+from .partitioning import is_partitioned, create_partitions
+from .services import AsyncKucoinClient, INTERVAL_SECONDS, parse_kline_data
+
+logger = logging.getLogger(__name__)
+
+# Pages fetched and loaded together; each chunk is committed on its own, so an interrupted backfill keeps its progress
+BACKFILL_CHUNK_PAGES = 20
+# Rows written per statement where COPY is not available
+FALLBACK_BATCH_SIZE = 1000
+
+COPY_FIELDS = ('symbol', 'interval', 'timestamp', *OHLCV_FIELDS)
+
+
+class RecordedKlineClient:
+    """
+    Serves the k-line pages recorded by a backfill run with `record_to`, in place of AsyncKucoinClient,
+    so a backfill can be replayed offline. A page that was not recorded counts as a failed request.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    async def get_kline_data(self, symbol: str, interval: str = '15min', start_at: int = None, end_at: int = None):
+        try:
+            with open(_page_path(self.directory, symbol, interval, start_at, end_at)) as page:
+                return parse_kline_data(json.load(page)['data'])
+        except FileNotFoundError:
+            logger.error(f"No recorded page for {symbol} {interval} {start_at}-{end_at}.")
+            return None
+
+
+def _page_path(directory: str, symbol_name: str, interval: str, start_at: int, end_at: int):
+    return os.path.join(directory, f"{symbol_name}_{interval}_{start_at}_{end_at}.json")
+
+
+def record_page(directory: str, symbol_name: str, interval: str, window: tuple, page: list):
+    """Writes a parsed page back out in KuCoin's response format: rows of strings, newest first."""
+    rows = [
+        [str(int(data['timestamp'].timestamp())), *(repr(float(data[field])) for field in
+                                                     ('open', 'close', 'high', 'low', 'volume')), '0']
+        for data in sorted(page, key=lambda data: data['timestamp'], reverse=True)
+    ]
+    os.makedirs(directory, exist_ok=True)
+    with open(_page_path(directory, symbol_name, interval, *window), 'w') as file:
+        json.dump({'code': '200000', 'data': rows}, file)
+
+
+def missing_windows(symbol: Symbol, interval: str, start: int, last: int):
+    """
+    Returns the pages of [start, last] that still lack candles, so a backfill that was interrupted,
+    or is run again, only requests the part it does not have yet.
+    """
+    step = INTERVAL_SECONDS[interval]
+    stored = np.array(sorted(
+        int(timestamp.timestamp()) for timestamp in Candle.objects.filter(
+            symbol=symbol, interval=interval,
+            timestamp__range=(datetime.fromtimestamp(start, tz=timezone.utc), datetime.fromtimestamp(last, tz=timezone.utc)),
+        ).values_list('timestamp', flat=True)
+    ), dtype=np.int64)
+    windows = page_windows(start, last, step)
+    counts = np.searchsorted(stored, [end_at for _, end_at in windows]) - np.searchsorted(
+        stored, [start_at for start_at, _ in windows])
+    return [window for window, count in zip(windows, counts) if count < (window[1] - window[0]) // step]
+
+
+def candle_rows(symbol: Symbol, interval: str, pages, last_closed: int):
+    """
+    Yields the rows of the fetched pages as tuples in COPY_FIELDS order, one page at a time.
+    Candles that are still forming, and repeats across pages, are left out.
+    """
+    seen = set()
+    for page in pages:
+        for data in page:
+            timestamp = data['timestamp'].replace(tzinfo=timezone.utc)
+            ts = int(timestamp.timestamp())
+            if ts > last_closed or ts in seen:
+                continue
+            seen.add(ts)
+            yield (symbol.id, interval, timestamp, *(float(data[field]) for field in OHLCV_FIELDS))
+
+
+class _CopyStream(io.TextIOBase):
+    """A file-like object rendering rows in COPY's text format as the driver reads them."""
+
+    def __init__(self, rows):
+        self._lines = ('\t'.join(value.isoformat() if isinstance(value, datetime) else str(value) for value in row)
+                       + '\n' for row in rows)
+        self._buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size is None or size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def copy_candles(rows):
+    """
+    Upserts candle rows (tuples in COPY_FIELDS order) and returns the number of rows written.
+    On PostgreSQL the rows are streamed with COPY FROM STDIN into a temporary staging table and
+    merged into the candles with one INSERT ... ON CONFLICT DO UPDATE, so no model instances are
+    built. Elsewhere they are written in batches with bulk_create.
+    """
+    if connection.vendor != 'postgresql':
+        written = 0
+        rows = iter(rows)
+        while batch := list(islice(rows, FALLBACK_BATCH_SIZE)):
+            Candle.objects.bulk_create(
+                [Candle(symbol_id=row[0], **dict(zip(COPY_FIELDS[1:], row[1:]))) for row in batch],
+                update_conflicts=True, unique_fields=['symbol', 'interval', 'timestamp'], update_fields=OHLCV_FIELDS,
+            )
+            written += len(batch)
+        return written
+
+    quote = connection.ops.quote_name
+    fields = [Candle._meta.get_field(name) for name in COPY_FIELDS]
+    columns = ', '.join(quote(field.column) for field in fields)
+    staging = quote('candle_staging')
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Inside a caller's transaction this atomic block is only a savepoint, and the table of an earlier
+        # call is still there until the outer commit drops it, so it is reused and emptied
+        cursor.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} "
+                       f"({', '.join(f'{quote(field.column)} {field.db_type(connection)}' for field in fields)}) "
+                       f"ON COMMIT DROP")
+        cursor.execute(f"TRUNCATE {staging}")
+        copy_sql = f"COPY {staging} ({columns}) FROM STDIN"
+        if hasattr(cursor.cursor, 'copy_expert'):
+            cursor.cursor.copy_expert(copy_sql, _CopyStream(rows))
+        else:
+            # psycopg 3
+            with cursor.cursor.copy(copy_sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+        key = ', '.join(quote(field.column) for field in fields[:3])
+        cursor.execute(
+            f"INSERT INTO {quote(Candle._meta.db_table)} ({columns}) "
+            f"SELECT DISTINCT ON ({key}) {columns} FROM {staging} "
+            f"ON CONFLICT ({key}) DO UPDATE SET "
+            + ', '.join(f"{quote(field)} = EXCLUDED.{quote(field)}" for field in OHLCV_FIELDS))
+        return cursor.rowcount
+
+
+async def _fetch_pages(client, symbol_name: str, interval: str, windows: list):
+    """Fetches the pages of several windows concurrently. Returns them in window order, or None if any failed."""
+    pages = await asyncio.gather(*(
+        client.get_kline_data(symbol_name, interval, start_at, end_at) for start_at, end_at in windows
+    ))
+    return None if any(page is None for page in pages) else pages
+
+
+async def _fetch_chunk(symbol_name: str, interval: str, windows: list, base_url: str = None, replay_from: str = None):
+    client = RecordedKlineClient(replay_from) if replay_from else AsyncKucoinClient(base_url=base_url)
+    async with client:
+        return await _fetch_pages(client, symbol_name, interval, windows)
+
+
+def backfill_symbol(symbol: Symbol, days: int, now: datetime = None, base_url: str = None,
+                    replay_from: str = None, record_to: str = None):
+    """
+    Loads up to `days` days of 15-minute history of a symbol, up to its last closed candle.
+    Only the pages that are not fully stored yet are requested, BACKFILL_CHUNK_PAGES at a time and
+    concurrently under the client's rate limit; each chunk is streamed into the database with
+    `copy_candles` and committed, so a backfill stopped half way resumes where it left off.
+    Afterwards the higher intervals are rolled up again for the loaded range and the symbol's
+    candle buffers are dropped, since they may now have older history behind them.
+    `replay_from` reads the pages from a directory recorded with `record_to` instead of the API.
+    Returns a summary dict with the number of pages fetched, rows written and whether a page failed.
+    """
+    started_at = time.monotonic()
+    interval = BASE_INTERVAL
+    step = INTERVAL_SECONDS[interval]
+    now = now or datetime.now(timezone.utc)
+    last_closed = last_closed_candle_start(interval, now)
+    start = last_closed - (days * 86400 // step - 1) * step
+
+    windows = missing_windows(symbol, interval, start, last_closed)
+    summary = {'pages': 0, 'rows': 0, 'failed': False}
+    loaded_from = None
+    for offset in range(0, len(windows), BACKFILL_CHUNK_PAGES):
+        chunk = windows[offset:offset + BACKFILL_CHUNK_PAGES]
+        pages = asyncio.run(_fetch_chunk(symbol.name, interval, chunk, base_url, replay_from))
+        if pages is None:
+            logger.warning(f"Backfill of {symbol.name} stopped at a failed page; it resumes from there next run.")
+            summary['failed'] = True
+            break
+        if record_to:
+            for window, page in zip(chunk, pages):
+                record_page(record_to, symbol.name, interval, window, page)
+        if is_partitioned():
+            create_partitions(datetime.fromtimestamp(chunk[0][0], tz=timezone.utc),
+                              datetime.fromtimestamp(chunk[-1][1], tz=timezone.utc))
+        summary['rows'] += copy_candles(candle_rows(symbol, interval, pages, last_closed))
+        summary['pages'] += len(chunk)
+        if loaded_from is None:
+            loaded_from = chunk[0][0]
+
+    if loaded_from is not None:
+        newest = Candle.objects.filter(symbol=symbol, interval=interval).order_by('-timestamp').values_list(
+            'timestamp', flat=True).first()
+        with transaction.atomic():
+            update_rollups({symbol.id: datetime.fromtimestamp(loaded_from, tz=timezone.utc)})
+            if newest and (symbol.last_candle_at is None or newest > symbol.last_candle_at):
+                symbol.last_candle_at = newest
+                symbol.save(update_fields=['last_candle_at'])
+        for buffer_interval in Candle.Interval.values:
+            invalidate_candle_buffer(symbol.name, buffer_interval)
+
+    summary['duration'] = round(time.monotonic() - started_at, 3)
+    logger.info(f"Backfilled {summary['rows']} candles of {symbol.name} from {summary['pages']} pages "
+                f"in {summary['duration']}s.")
+    return summary
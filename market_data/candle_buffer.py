@@ -0,0 +1,277 @@
+import struct
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import partial
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Symbol, Candle
+from .symbol_registry import get_symbol_map
+
+# Number of most recent candles held per symbol and interval
+BUFFER_CAPACITY = 1000
+# Number of buffers mirrored in each process before the least recently used one is dropped
+LOCAL_MIRROR_SIZE = 256
+
+OHLCV_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(len(OHLCV_FIELDS))
+
+_HEADER = struct.Struct('<II')  # capacity, size
+
+
+class CandleRingBuffer:
+    """
+    A fixed-capacity ring buffer of the most recent candles of one symbol and interval.
+    Timestamps (UNIX seconds) are kept in an int64 array and OHLCV in a (5, n) float64 array,
+    one contiguous row per field. Every candle is written twice, at `i` and `i + capacity`,
+    so the newest `n` candles are always one contiguous slice and reads never copy.
+    """
+
+    def __init__(self, capacity: int = BUFFER_CAPACITY):
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0  # Next write position in the first half
+        self._timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self._ohlcv = np.zeros((len(OHLCV_FIELDS), 2 * capacity), dtype=np.float64)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def last_timestamp(self):
+        return int(self._timestamps[self.head + self.capacity - 1]) if self.size else None
+
+    def append(self, timestamps, ohlcv):
+        """
+        Appends candles given as an ascending int64 array of timestamps and a (5, n) OHLCV array.
+        A candle with the same timestamp as the newest one replaces it (the still-open bucket of a
+        rolled-up interval); candles older than the newest one are ignored.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        ohlcv = np.asarray(ohlcv, dtype=np.float64)
+        if self.size:
+            last = self.last_timestamp
+            keep = timestamps >= last
+            timestamps, ohlcv = timestamps[keep], ohlcv[:, keep]
+            if timestamps.size and timestamps[0] == last:
+                self.head = (self.head - 1) % self.capacity
+                self.size -= 1
+        timestamps, ohlcv = timestamps[-self.capacity:], ohlcv[:, -self.capacity:]
+        if not timestamps.size:
+            return
+
+        positions = (self.head + np.arange(timestamps.size)) % self.capacity
+        for offset in (0, self.capacity):
+            self._timestamps[positions + offset] = timestamps
+            self._ohlcv[:, positions + offset] = ohlcv
+        self.head = (self.head + timestamps.size) % self.capacity
+        self.size = min(self.capacity, self.size + timestamps.size)
+
+    def latest(self, n: int = None):
+        """Returns zero-copy views (timestamps, ohlcv) of the newest `n` candles, oldest first."""
+        n = self.size if n is None else min(n, self.size)
+        end = self.head + self.capacity
+        return self._timestamps[end - n:end], self._ohlcv[:, end - n:end]
+
+    def window(self, until: int, n: int):
+        """Returns zero-copy views of the newest `n` candles starting at or before `until`."""
+        timestamps, ohlcv = self.latest()
+        end = int(np.searchsorted(timestamps, until, side='right'))
+        start = max(0, end - n)
+        return timestamps[start:end], ohlcv[:, start:end]
+
+    def to_bytes(self):
+        timestamps, ohlcv = self.latest()
+        return _HEADER.pack(self.capacity, self.size) + timestamps.tobytes() + np.ascontiguousarray(ohlcv).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        capacity, size = _HEADER.unpack_from(data)
+        buffer = cls(capacity)
+        offset = _HEADER.size
+        timestamps = np.frombuffer(data, dtype=np.int64, count=size, offset=offset)
+        offset += timestamps.nbytes
+        ohlcv = np.frombuffer(data, dtype=np.float64, count=len(OHLCV_FIELDS) * size, offset=offset)
+        buffer.append(timestamps, ohlcv.reshape(len(OHLCV_FIELDS), size))
+        return buffer
+
+
+def _buffer_key(symbol_name: str, interval: str):
+    return f"candles:{symbol_name}:{interval}"
+
+
+def _version_key(symbol_name: str, interval: str):
+    return f"candles:{symbol_name}:{interval}:version"
+
+
+_local_buffers = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _remember(key, version, buffer):
+    with _local_lock:
+        _local_buffers[key] = (version, buffer)
+        _local_buffers.move_to_end(key)
+        while len(_local_buffers) > LOCAL_MIRROR_SIZE:
+            _local_buffers.popitem(last=False)
+
+
+def load_buffer_from_db(symbol_name: str, interval: str, capacity: int = BUFFER_CAPACITY):
+    """Builds a buffer from the newest stored candles with a single query."""
+    rows = Candle.objects.filter(symbol__name=symbol_name, interval=interval).order_by(
+        '-timestamp').values_list('timestamp', *OHLCV_FIELDS)[:capacity]
+    buffer = CandleRingBuffer(capacity)
+    if rows:
+        rows = rows[::-1]
+        buffer.append(
+            np.array([int(row[0].timestamp()) for row in rows], dtype=np.int64),
+            np.array([row[1:] for row in rows], dtype=np.float64).T,
+        )
+    return buffer
+
+
+def get_candle_buffer(symbol_name: str, interval: str = Candle.Interval.FIFTEEN_MINUTES):
+    """
+    Returns the candle buffer of a symbol and interval.
+    The process-local mirror is used while its version matches the one in Redis, so a hot read
+    costs one small cache lookup and no database work. On a miss the buffer is loaded from
+    Redis, or built from the database and published to Redis.
+    """
+    key = _buffer_key(symbol_name, interval)
+    version = cache.get(_version_key(symbol_name, interval))
+    local = _local_buffers.get(key)
+    if local is not None and version is not None and local[0] == version:
+        return local[1]
+
+    data = cache.get(key) if version is not None else None
+    if data is not None:
+        buffer = CandleRingBuffer.from_bytes(data)
+    else:
+        buffer = load_buffer_from_db(symbol_name, interval)
+        if not len(buffer):
+            return buffer
+        version = _publish({key: buffer}, [_version_key(symbol_name, interval)])[0]
+    _remember(key, version, buffer)
+    return buffer
+
+
+def read_candles(symbol_name: str, interval: str, since: int = None, until: int = None, limit: int = BUFFER_CAPACITY):
+    """
+    Returns (timestamps, ohlcv, has_more) for the newest `limit` candles with since <= timestamp <= until
+    (UNIX seconds, either bound optional), oldest first, and whether older candles match as well.
+    The candle buffer answers whenever it holds the whole page; only pages reaching further back
+    than the buffer are read from the database, with a keyset query on (symbol, interval, timestamp).
+    """
+    buffer = get_candle_buffer(symbol_name, interval)
+    timestamps, ohlcv = buffer.window(until, limit + 1) if until is not None else buffer.latest(limit + 1)
+    if since is not None:
+        start = int(np.searchsorted(timestamps, since, side='left'))
+        timestamps, ohlcv = timestamps[start:], ohlcv[:, start:]
+    if timestamps.size > limit:
+        return timestamps[1:], ohlcv[:, 1:], True
+
+    oldest_buffered = buffer.latest()[0][:1]
+    covers_since = since is not None and oldest_buffered.size and oldest_buffered[0] <= since
+    # A buffer that is not full was loaded with every stored candle
+    if covers_since or len(buffer) < buffer.capacity:
+        return timestamps, ohlcv, False
+
+    candles = Candle.objects.filter(symbol__name=symbol_name, interval=interval)
+    if since is not None:
+        candles = candles.filter(timestamp__gte=datetime.fromtimestamp(since, tz=timezone.utc))
+    if until is not None:
+        candles = candles.filter(timestamp__lte=datetime.fromtimestamp(until, tz=timezone.utc))
+    rows = list(candles.order_by('-timestamp').values_list('timestamp', *OHLCV_FIELDS)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit][::-1]
+    return (
+        np.array([int(row[0].timestamp()) for row in rows], dtype=np.int64),
+        np.array([row[1:] for row in rows], dtype=np.float64).reshape(-1, len(OHLCV_FIELDS)).T,
+        has_more,
+    )
+
+
+def _publish(buffers: dict, version_keys: list):
+    """Writes buffers to Redis and bumps their versions. Returns the new versions."""
+    versions = [datetime.now(timezone.utc).timestamp() + i * 1e-6 for i in range(len(buffers))]
+    cache.set_many({key: buffer.to_bytes() for key, buffer in buffers.items()}, timeout=None)
+    cache.set_many(dict(zip(version_keys, versions)), timeout=None)
+    return versions
+
+
+def append_candles(grouped: dict):
+    """
+    Appends freshly stored candles to the buffers that already exist in Redis.
+    `grouped` maps (symbol_name, interval) to a list of Candle instances in ascending time order.
+    Buffers that do not exist yet are left alone; they are built from the database on first read.
+    Returns the (symbol_name, interval) pairs whose buffers were updated.
+    """
+    keys = {_buffer_key(*group): group for group in grouped}
+    existing = cache.get_many(list(keys))
+    updated = {}
+    for key, data in existing.items():
+        buffer = CandleRingBuffer.from_bytes(data)
+        group = grouped[keys[key]]
+        buffer.append(
+            np.array([int(candle.timestamp.timestamp()) for candle in group], dtype=np.int64),
+            np.array([[getattr(candle, field) for field in OHLCV_FIELDS] for candle in group], dtype=np.float64).T,
+        )
+        updated[key] = buffer
+    if updated:
+        versions = _publish(updated, [_version_key(*keys[key]) for key in updated])
+        for (key, buffer), version in zip(updated.items(), versions):
+            _remember(key, version, buffer)
+    return [keys[key] for key in updated]
+
+
+def invalidate_candle_buffers(pairs):
+    """Drops the buffers of (symbol name, interval) pairs in one round trip."""
+    cache.delete_many([key for pair in pairs for key in (_buffer_key(*pair), _version_key(*pair))])
+
+
+def invalidate_candle_buffer(symbol_name: str, interval: str):
+    """Drops a buffer after candles were written outside the ingestion path, e.g. from the admin."""
+    invalidate_candle_buffers([(symbol_name, interval)])
+
+
+def _invalidate_by_symbol_id(pairs):
+    names = {symbol.id: symbol.name for symbol in get_symbol_map().values()}
+    unknown = {symbol_id for symbol_id, _ in pairs} - names.keys()
+    if unknown:
+        # Symbols created since the registry was last checked
+        names.update(Symbol.objects.filter(id__in=unknown).values_list('id', 'name'))
+    invalidate_candle_buffers([(names[symbol_id], interval) for symbol_id, interval in pairs if symbol_id in names])
+
+
+# The (run_on_commit list, pending pairs) of the transaction open on this thread's connection
+_pending = threading.local()
+
+
+def invalidate_candle_buffers_on_commit(pairs):
+    """
+    Drops the buffers of (symbol id, interval) pairs once the current transaction commits; a process
+    rebuilding a buffer before the commit would read the old rows. Pairs queued during one transaction
+    are collected and dropped together by a single callback, however many rows were written.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        _invalidate_by_symbol_id(set(pairs))
+        return
+    # Django replaces the callback list when a transaction (or a savepoint holding callbacks) ends,
+    # so a different list means this transaction has no batch queued yet
+    hooks, pending = getattr(_pending, 'batch', (None, None))
+    if hooks is not connection.run_on_commit:
+        pending = set()
+        transaction.on_commit(partial(_invalidate_pending, pending))
+        _pending.batch = (connection.run_on_commit, pending)
+    pending.update(pairs)
+
+
+def _invalidate_pending(pending):
+    # Pairs queued after this point need a callback of their own
+    if getattr(_pending, 'batch', (None, None))[1] is pending:
+        del _pending.batch
+    _invalidate_by_symbol_id(pending)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import logging
+import weakref
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .candle_buffer import OHLCV_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Events are published on "market-events:<symbol>:<type>", e.g. market-events:BTC-USDT:signal
+EVENT_CHANNEL_PREFIX = 'market-events'
+# Events buffered per connected client before the oldest ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+# Seconds the hub waits before resubscribing after losing Redis, doubled per failed attempt up to the maximum
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 30.0
+
+CANDLE_EVENT = 'candle'
+SIGNAL_EVENT = 'signal'
+
+
+def _channel(symbol_name: str, event_type: str):
+    return f"{EVENT_CHANNEL_PREFIX}:{symbol_name}:{event_type}"
+
+
+def candle_event(candle):
+    """The event data of a candle, in the same shape as the candle list API."""
+    return {
+        'interval': candle.interval,
+        'timestamp': candle.timestamp.isoformat().replace('+00:00', 'Z'),
+        **{field: float(getattr(candle, field)) for field in OHLCV_FIELDS},
+    }
+
+
+def publish_events(events):
+    """
+    Publishes (symbol_name, event_type, data) events in one round trip.
+    `data` is JSON: either already rendered (bytes or str) or a value that is rendered here.
+    """
+    pipeline = get_redis_connection('default').pipeline(transaction=False)
+    for symbol_name, event_type, data in events:
+        if not isinstance(data, (bytes, str)):
+            data = json.dumps(data, default=str)
+        pipeline.publish(_channel(symbol_name, event_type), data)
+    pipeline.execute()
+
+
+def publish_event(symbol_name: str, event_type: str, data):
+    publish_events([(symbol_name, event_type, data)])
+
+
+class Subscription:
+    """
+    The events of some symbols (or of all symbols) for one connected client.
+    Events wait in a bounded queue; when a slow client lets it fill up, the oldest events are
+    dropped and counted, so one slow client never holds back the others or grows memory.
+    """
+
+    def __init__(self, symbols=None, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.symbols = set(symbols) if symbols else None
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def wants(self, symbol_name: str):
+        return self.symbols is None or symbol_name in self.symbols
+
+    def put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float = None):
+        """Returns the next (symbol, event_type, data) event, or None if none arrived within `timeout`."""
+        if not self.queue.empty():
+            return self.queue.get_nowait()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def take_dropped(self):
+        """Returns the number of events dropped since the last call."""
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class EventHub:
+    """
+    Fans the published events out to the clients connected to this process.
+    The hub holds a single Redis pattern subscription, however many clients are connected, and
+    hands each event to the subscriptions that want its symbol. The event data is passed on as
+    published, without being parsed.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.subscriptions = set()
+        self._reader = None
+
+    def subscribe(self, symbols=None):
+        subscription = Subscription(symbols)
+        self.subscriptions.add(subscription)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.get_running_loop().create_task(self._read())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    def dispatch(self, channel: str, data):
+        _, symbol_name, event_type = channel.split(':', 2)
+        for subscription in list(self.subscriptions):
+            if subscription.wants(symbol_name):
+                subscription.put((symbol_name, event_type, data))
+
+    async def _read(self):
+        """
+        Reads the pattern subscription while there are subscribers. A lost Redis connection is
+        resubscribed with exponential backoff; the events published in the meantime are missed.
+        """
+        delay = RECONNECT_DELAY
+        while self.subscriptions:
+            pubsub = self.connection.pubsub()
+            try:
+                await pubsub.psubscribe(f"{EVENT_CHANNEL_PREFIX}:*")
+                delay = RECONNECT_DELAY
+                while self.subscriptions:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        channel = message['channel']
+                        self.dispatch(channel.decode() if isinstance(channel, bytes) else channel, message['data'])
+            except Exception as e:
+                logger.error(f"The event hub lost its Redis subscription, resubscribing in {delay}s: {e}")
+            finally:
+                # The next subscriber starts a new reader
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            if self.subscriptions:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_event_hub():
+    """Returns the event hub of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = EventHub(aioredis.Redis.from_url(settings.CACHES['default']['LOCATION']))
+    return hub
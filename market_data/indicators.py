@@ -0,0 +1,204 @@
+import numpy as np
+from django.core.cache import cache
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .candle_buffer import get_candle_buffer, OPEN, HIGH, LOW, CLOSE, VOLUME
+from .models import Candle
+
+EMA_SPANS = (9, 21, 50)
+RSI_PERIOD = 14
+# Candles on each side of a swing high/low used for support and resistance
+PIVOT_WINDOW = 3
+# Number of recent EMA 9/21 spreads kept to detect a fresh crossover
+CROSSOVER_LOOKBACK = 5
+MIN_CANDLES = max(EMA_SPANS) + 1
+
+# The closed-form EMA divides by (1 - alpha) ** k; blocks keep that factor small enough to stay exact.
+_EMA_BLOCK = 64
+
+
+def ema(values, span: int = None, alpha: float = None, seed: float = None):
+    """
+    Vectorised exponential moving average.
+    Within each block y[j] = d[j] * (prev + alpha * cumsum(x / d)[j]) with d[j] = (1 - alpha) ** (j + 1),
+    which equals the usual recursion y[j] = alpha * x[j] + (1 - alpha) * y[j - 1].
+    Without a seed the series starts at the first value.
+    """
+    alpha = 2 / (span + 1) if alpha is None else alpha
+    values = np.asarray(values, dtype=np.float64)
+    out = np.empty_like(values)
+    if not values.size:
+        return out
+    prev = values[0] if seed is None else seed
+    for start in range(0, values.size, _EMA_BLOCK):
+        block = values[start:start + _EMA_BLOCK]
+        decay = (1 - alpha) ** np.arange(1, block.size + 1)
+        out[start:start + block.size] = decay * (prev + alpha * np.cumsum(block / decay))
+        prev = out[start + block.size - 1]
+    return out
+
+
+def _rsi_value(avg_gain: float, avg_loss: float):
+    if avg_loss == 0:
+        return 100.0
+    return 100 - 100 / (1 + avg_gain / avg_loss)
+
+
+def advance_state(state: dict, timestamps, closes):
+    """
+    Brings the running EMA/RSI state up to the newest candle.
+    With a previous state only the candles after its timestamp are processed, so updating a
+    symbol as each candle closes costs O(new candles). Without one, the state is built from
+    the whole series, seeding RSI with Wilder's simple average over the first period.
+    """
+    if state is not None:
+        new = timestamps > state['timestamp']
+        new_closes = closes[new]
+        if not new_closes.size:
+            return state
+        deltas = np.diff(np.r_[state['close'], new_closes])
+        emas = {span: ema(new_closes, span, seed=state['ema'][span]) for span in EMA_SPANS}
+        avg_gain = ema(np.clip(deltas, 0, None), alpha=1 / RSI_PERIOD, seed=state['avg_gain'])[-1]
+        avg_loss = ema(np.clip(-deltas, 0, None), alpha=1 / RSI_PERIOD, seed=state['avg_loss'])[-1]
+        spreads = np.r_[state['spreads'], emas[9] - emas[21]]
+    else:
+        deltas = np.diff(closes)
+        gains, losses = np.clip(deltas, 0, None), np.clip(-deltas, 0, None)
+        emas = {span: ema(closes, span) for span in EMA_SPANS}
+        avg_gain = ema(gains[RSI_PERIOD:], alpha=1 / RSI_PERIOD, seed=gains[:RSI_PERIOD].mean())
+        avg_loss = ema(losses[RSI_PERIOD:], alpha=1 / RSI_PERIOD, seed=losses[:RSI_PERIOD].mean())
+        avg_gain = avg_gain[-1] if avg_gain.size else gains[:RSI_PERIOD].mean()
+        avg_loss = avg_loss[-1] if avg_loss.size else losses[:RSI_PERIOD].mean()
+        spreads = emas[9] - emas[21]
+
+    return {
+        'timestamp': int(timestamps[-1]),
+        'close': float(closes[-1]),
+        'ema': {span: float(series[-1]) for span, series in emas.items()},
+        'avg_gain': float(avg_gain),
+        'avg_loss': float(avg_loss),
+        'spreads': [float(spread) for spread in spreads[-CROSSOVER_LOOKBACK:]],
+    }
+
+
+def support_resistance(highs, lows, close: float):
+    """
+    Finds the nearest swing low below and swing high above the close.
+    A swing high/low is a candle whose high/low is the extreme of the PIVOT_WINDOW candles on each side.
+    Falls back to the range of the series when there is no swing level on one side.
+    """
+    size = 2 * PIVOT_WINDOW + 1
+    swing_highs = highs[PIVOT_WINDOW:-PIVOT_WINDOW][
+        sliding_window_view(highs, size).max(axis=1) == highs[PIVOT_WINDOW:-PIVOT_WINDOW]]
+    swing_lows = lows[PIVOT_WINDOW:-PIVOT_WINDOW][
+        sliding_window_view(lows, size).min(axis=1) == lows[PIVOT_WINDOW:-PIVOT_WINDOW]]
+    above = swing_highs[swing_highs > close]
+    below = swing_lows[swing_lows < close]
+    resistance = above.min() if above.size else highs.max()
+    support = below.max() if below.size else lows.min()
+    return float(support), float(resistance)
+
+
+def candlestick_patterns(ohlcv, lookback: int = 3):
+    """Detects common candlestick patterns over the last `lookback` candles, newest first."""
+    opens, highs, lows, closes = ohlcv[OPEN], ohlcv[HIGH], ohlcv[LOW], ohlcv[CLOSE]
+    body = np.abs(closes - opens)
+    candle_range = np.maximum(highs - lows, 1e-12)
+    upper_shadow = highs - np.maximum(opens, closes)
+    lower_shadow = np.minimum(opens, closes) - lows
+    bullish, bearish = closes > opens, closes < opens
+    engulfs = np.r_[False, (np.maximum(opens, closes)[1:] >= np.maximum(opens, closes)[:-1])
+                    & (np.minimum(opens, closes)[1:] <= np.minimum(opens, closes)[:-1])]
+    previous_bullish, previous_bearish = np.r_[False, bullish[:-1]], np.r_[False, bearish[:-1]]
+
+    patterns = {
+        'doji': body <= 0.1 * candle_range,
+        'hammer': (lower_shadow >= 2 * body) & (upper_shadow <= body) & (body > 0.1 * candle_range),
+        'shooting_star': (upper_shadow >= 2 * body) & (lower_shadow <= body) & (body > 0.1 * candle_range),
+        'bullish_engulfing': bullish & previous_bearish & engulfs,
+        'bearish_engulfing': bearish & previous_bullish & engulfs,
+    }
+    found = []
+    for candles_ago in range(min(lookback, closes.size)):
+        index = closes.size - 1 - candles_ago
+        found.extend(f"{name} ({candles_ago} candles ago)" if candles_ago else name
+                     for name, mask in patterns.items() if mask[index])
+    return found
+
+
+def _round(value: float):
+    return float(f"{value:.6g}")
+
+
+def summarise(state: dict, timestamps, ohlcv, interval: str):
+    """Builds the compact feature summary sent to the signal model."""
+    closes, volumes = ohlcv[CLOSE], ohlcv[VOLUME]
+    close = closes[-1]
+    emas = state['ema']
+    rsi = _rsi_value(state['avg_gain'], state['avg_loss'])
+    support, resistance = support_resistance(ohlcv[HIGH], ohlcv[LOW], close)
+    spreads = np.sign(state['spreads'])
+    crossed = np.flatnonzero(spreads[1:] != spreads[:-1])
+
+    if emas[9] > emas[21] > emas[50]:
+        trend = 'BULLISH'
+    elif emas[9] < emas[21] < emas[50]:
+        trend = 'BEARISH'
+    else:
+        trend = 'MIXED'
+
+    return {
+        'interval': interval,
+        'timestamp': int(timestamps[-1]),
+        'candles': int(closes.size),
+        'close': _round(close),
+        'change_pct': {
+            str(n): _round((close / closes[-1 - n] - 1) * 100) for n in (1, 4, 16, 96) if closes.size > n
+        },
+        'ema': {str(span): _round(value) for span, value in emas.items()},
+        'ema_trend': trend,
+        'ema_9_21_crossover': (
+            ('BULLISH' if spreads[-1] > 0 else 'BEARISH') + f" ({len(spreads) - 2 - crossed[-1]} candles ago)"
+            if crossed.size else None
+        ),
+        'rsi_14': round(rsi, 1),
+        'rsi_state': 'OVERBOUGHT' if rsi >= 70 else 'OVERSOLD' if rsi <= 30 else 'NEUTRAL',
+        'support': _round(support),
+        'resistance': _round(resistance),
+        'volume_ratio_20': _round(volumes[-1] / max(volumes[-20:].mean(), 1e-12)),
+        'volatility_pct_20': _round(np.std(np.diff(closes[-21:]) / closes[-21:-1]) * 100),
+        'patterns': candlestick_patterns(ohlcv),
+        'recent_closes': [_round(value) for value in closes[-10:]],
+    }
+
+
+def _features_key(symbol_name: str, interval: str):
+    return f"indicators:{symbol_name}:{interval}"
+
+
+def get_features(symbol_name: str, interval: str = Candle.Interval.FIFTEEN_MINUTES, until: int = None):
+    """
+    Returns the indicator feature summary of a symbol at its newest candle (or the newest one
+    starting at or before the UNIX time `until`), or None if there is not enough history.
+    The running EMA/RSI state and the summary of the newest candle are cached per symbol,
+    so each new candle only advances the state instead of recomputing the series.
+    """
+    buffer = get_candle_buffer(symbol_name, interval)
+    timestamps, ohlcv = buffer.latest() if until is None else buffer.window(until, buffer.capacity)
+    if timestamps.size < MIN_CANDLES:
+        return None
+
+    key = _features_key(symbol_name, interval)
+    cached = cache.get(key)
+    last_timestamp = int(timestamps[-1])
+    if cached and cached['features']['timestamp'] == last_timestamp:
+        return cached['features']
+
+    state = None
+    if cached and timestamps[0] <= cached['state']['timestamp'] < last_timestamp:
+        state = cached['state']
+    state = advance_state(state, timestamps, ohlcv[CLOSE])
+    features = summarise(state, timestamps, ohlcv, interval)
+    if cached is None or last_timestamp > cached['state']['timestamp']:
+        cache.set(key, {'state': state, 'features': features}, timeout=86400)
+    return features
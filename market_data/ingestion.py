@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Symbol, Candle
+from .aggregation import BASE_INTERVAL, update_rollups
+from .candle_buffer import append_candles
+from .indicators import get_features
+from .events import publish_events, candle_event, CANDLE_EVENT
+from .services import AsyncKucoinClient, INTERVAL_SECONDS, MAX_CANDLES_PER_REQUEST
+
+logger = logging.getLogger(__name__)
+
+# Number of candles requested for a symbol that has never been ingested before.
+INITIAL_LOOKBACK_CANDLES = 100
+# Upper bound on how far back a gap is backfilled in a single cycle.
+MAX_BACKFILL_CANDLES = 3000
+
+
+def last_closed_candle_start(interval: str, now: datetime):
+    """Returns the UNIX start time of the most recent fully closed candle."""
+    step = INTERVAL_SECONDS[interval]
+    now_ts = int(now.timestamp())
+    return now_ts - now_ts % step - step
+
+
+def plan_fetch_windows(symbol: Symbol, interval: str, now: datetime):
+    """
+    Works out which (start_at, end_at) pages must be requested to bring a symbol up to date.
+    Only the closed candles after the symbol's high-water mark are requested; a gap longer
+    than one API page is split into several pages. Returns an empty list when nothing is missing.
+    """
+    step = INTERVAL_SECONDS[interval]
+    last_closed = last_closed_candle_start(interval, now)
+
+    if symbol.last_candle_at is None:
+        start = last_closed - (INITIAL_LOOKBACK_CANDLES - 1) * step
+    else:
+        start = int(symbol.last_candle_at.timestamp()) + step
+    start = max(start, last_closed - (MAX_BACKFILL_CANDLES - 1) * step)
+
+    if start > last_closed:
+        return []
+
+    missing = (last_closed - start) // step + 1
+    if symbol.last_candle_at is not None and missing > 1:
+        logger.info(f"Detected a gap of {missing} candles for {symbol.name}; backfilling.")
+
+    return page_windows(start, last_closed, step)
+
+
+def page_windows(start: int, last: int, step: int):
+    """Splits the candles starting in [start, last] into (start_at, end_at) pages of at most one API response."""
+    page_span = MAX_CANDLES_PER_REQUEST * step
+    return [
+        (page_start, min(page_start + page_span, last + step))
+        for page_start in range(start, last + 1, page_span)
+    ]
+
+
+def closed_candles(candles_data: list, interval: str, now: datetime):
+    """
+    Drops the candle that is still forming (and any duplicates across pages).
+    A stored candle is never updated afterwards, so only closed candles may be kept.
+    """
+    last_closed = last_closed_candle_start(interval, now)
+    unique_candles = {data['timestamp'].replace(tzinfo=timezone.utc): data for data in candles_data}
+    return [data for ts, data in unique_candles.items() if ts.timestamp() <= last_closed]
+
+
+def initialise_high_water_marks(symbols: list):
+    """Seeds `last_candle_at` from already stored candles for symbols that have none yet."""
+    pending = {symbol.id: symbol for symbol in symbols if symbol.last_candle_at is None}
+    if not pending:
+        return
+    latest = Candle.objects.filter(symbol_id__in=pending, interval=BASE_INTERVAL).values(
+        'symbol_id').annotate(latest=Max('timestamp'))
+    for row in latest:
+        pending[row['symbol_id']].last_candle_at = row['latest']
+    Symbol.objects.bulk_update([pending[row['symbol_id']] for row in latest], ['last_candle_at'])
+
+
+def build_candles(symbol: Symbol, candles_data: list):
+    """Builds unsaved 15-minute Candle instances for a symbol from parsed API data."""
+    return [
+        Candle(
+            symbol=symbol,
+            interval=BASE_INTERVAL,
+            timestamp=data['timestamp'].replace(tzinfo=timezone.utc),
+            open=data['open'],
+            close=data['close'],
+            high=data['high'],
+            low=data['low'],
+            volume=data['volume']
+        ) for data in candles_data
+    ]
+
+
+def store_candles(candles_by_symbol: dict):
+    """
+    Writes the 15-minute candles of many symbols in a single transaction, ignoring duplicates.
+    In the same transaction it advances each symbol's high-water mark and rolls the new
+    candles up into the higher intervals; afterwards the in-memory candle buffers are updated
+    and the indicators of the 15-minute candles are advanced, and the newest candles are published.
+    `candles_by_symbol` maps Symbol instances to lists of parsed candle dicts.
+    Returns the number of candle rows sent to the database.
+    """
+    candles_to_create = []
+    advanced_symbols = []
+    since_by_symbol = {}
+    for symbol, candles_data in candles_by_symbol.items():
+        candles = build_candles(symbol, candles_data)
+        if not candles:
+            continue
+        candles_to_create.extend(candles)
+        since_by_symbol[symbol.id] = min(candle.timestamp for candle in candles)
+        newest = max(candle.timestamp for candle in candles)
+        if symbol.last_candle_at is None or newest > symbol.last_candle_at:
+            symbol.last_candle_at = newest
+            advanced_symbols.append(symbol)
+
+    with transaction.atomic():
+        Candle.objects.bulk_create(candles_to_create, ignore_conflicts=True, batch_size=1000)
+        Symbol.objects.bulk_update(advanced_symbols, ['last_candle_at'])
+        derived_candles = update_rollups(since_by_symbol)
+
+    symbol_names = {symbol.id: symbol.name for symbol in candles_by_symbol}
+    grouped = {}
+    for candle in sorted(candles_to_create + derived_candles, key=lambda c: c.timestamp):
+        grouped.setdefault((symbol_names[candle.symbol_id], candle.interval), []).append(candle)
+    for symbol_name, interval in append_candles(grouped):
+        if interval == BASE_INTERVAL:
+            get_features(symbol_name, interval)
+
+    # Connected clients are pushed the newest candle of each symbol and interval
+    publish_events([
+        (symbol_name, CANDLE_EVENT, candle_event(candles[-1]))
+        for (symbol_name, interval), candles in grouped.items()
+    ])
+    return len(candles_to_create)
+
+
+def fetch_symbol_candles(client, symbol: Symbol, interval: str, now: datetime):
+    """
+    Fetches the missing closed candles of one symbol with a synchronous client.
+    Returns the parsed candles, or None if any page failed.
+    """
+    candles_data = []
+    for start_at, end_at in plan_fetch_windows(symbol, interval, now):
+        page = client.get_kline_data(symbol.name, interval=interval, start_at=start_at, end_at=end_at)
+        if page is None:
+            return None
+        candles_data.extend(page)
+    return closed_candles(candles_data, interval, now)
+
+
+async def fetch_candles_concurrently(symbol_names: list, interval: str = '15min', base_url: str = None,
+                                     windows: dict = None):
+    """Fetches candles for all symbols over one pooled, rate-limited async client."""
+    async with AsyncKucoinClient(base_url=base_url) as client:
+        return await client.get_kline_data_many(symbol_names, interval, windows=windows)
+
+
+def ingest_symbols(symbols: list, base_url: str = None):
+    """
+    Fetches the missing 15-minute candles of the given symbols concurrently and stores them in bulk.
+    Symbols that are already up to date are not requested at all.
+    Returns a summary dict with the number of symbols fetched, skipped, failed and rows written.
+    """
+    started_at = time.monotonic()
+    now = datetime.now(timezone.utc)
+    interval = BASE_INTERVAL
+    initialise_high_water_marks(symbols)
+
+    symbols_by_name = {symbol.name: symbol for symbol in symbols}
+    windows = {symbol.name: plan_fetch_windows(symbol, interval, now) for symbol in symbols}
+    names_to_fetch = [name for name, symbol_windows in windows.items() if symbol_windows]
+
+    results = {}
+    if names_to_fetch:
+        results = asyncio.run(fetch_candles_concurrently(names_to_fetch, interval, base_url, windows))
+
+    candles_by_symbol = {
+        symbols_by_name[name]: closed_candles(candles_data, interval, now)
+        for name, candles_data in results.items() if candles_data
+    }
+    failed = [name for name, candles_data in results.items() if candles_data is None]
+    if failed:
+        logger.warning(f"Failed to fetch candles for {len(failed)} symbols: {', '.join(failed)}")
+
+    rows = store_candles(candles_by_symbol)
+    summary = {
+        'symbols': len(candles_by_symbol),
+        'skipped': len(symbols) - len(names_to_fetch),
+        'failed': len(failed),
+        'rows': rows,
+        'duration': round(time.monotonic() - started_at, 3),
+    }
+    logger.info(f"Ingested {rows} candle rows for {summary['symbols']} symbols in {summary['duration']}s.")
+    return summary
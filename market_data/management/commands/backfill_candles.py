@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from market_data.backfill import backfill_symbol
+from market_data.models import Symbol
+from market_data.tasks import backfill_symbol_history
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads the 15-minute candle history of symbols, page by page over time windows, streaming "
+        "the rows into the database with COPY. Pages that are already stored are skipped, so an "
+        "interrupted backfill is resumed by running it again. With --queue, one Celery task per "
+        "symbol is queued instead, and the symbols are loaded in parallel by the workers. "
+        "The hourly prune keeps only the newest 100 candles per symbol and interval unless the "
+        "symbol's retention_policy is raised (e.g. {\"15min\": 9000} for 90 days), so raise it "
+        "first or the backfilled history is deleted again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('symbols', nargs='*', help="Symbol names; all active symbols if omitted.")
+        parser.add_argument('--days', type=int, default=90, help="Days of history to load.")
+        parser.add_argument('--queue', action='store_true', help="Queue a backfill task per symbol.")
+        parser.add_argument('--record', metavar='DIR', help="Write every fetched page to DIR for later replays.")
+        parser.add_argument('--replay', metavar='DIR', help="Read the pages from DIR instead of the API.")
+        parser.add_argument('--base-url', help="Fetch from this KuCoin-compatible base URL.")
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1.")
+        if options['queue'] and (options['record'] or options['replay'] or options['base_url']):
+            raise CommandError("--record, --replay and --base-url apply to inline backfills only.")
+        symbols = Symbol.objects.filter(name__in=options['symbols']) if options['symbols'] else \
+            Symbol.objects.filter(is_active=True)
+        missing = set(options['symbols']) - {symbol.name for symbol in symbols}
+        if missing:
+            raise CommandError(f"Unknown symbols: {', '.join(sorted(missing))}")
+
+        for symbol in symbols:
+            if options['queue']:
+                backfill_symbol_history.delay(symbol.name, options['days'])
+                self.stdout.write(f"Queued the backfill of {symbol.name}.")
+                continue
+            summary = backfill_symbol(symbol, options['days'], base_url=options['base_url'],
+                                      replay_from=options['replay'], record_to=options['record'])
+            message = (f"{symbol.name}: {summary['rows']} candles from {summary['pages']} pages "
+                       f"in {summary['duration']}s")
+            if summary['failed']:
+                self.stdout.write(self.style.WARNING(f"{message}; stopped at a failed page, run again to resume."))
+            else:
+                self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,83 @@
+import json
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import DecimalField
+from django.db.models.functions import Cast
+
+from market_data.candle_buffer import OHLCV_FIELDS
+from market_data.models import Symbol, Candle
+
+BENCHMARK_SYMBOL = 'BENCHMARK-USDT'
+# The NUMERIC columns candles were stored in before they became double precision
+DECIMAL_COLUMNS = {'open': (18, 8), 'high': (18, 8), 'low': (18, 8), 'close': (18, 8), 'volume': (24, 8)}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures candle storage against the configured database: bulk insert rate, and the time to "
+        "read and serialise the newest candle windows as floats and as the Decimals that NUMERIC "
+        "columns produce. On PostgreSQL it also compares the average row size of both layouts. "
+        "Everything runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help="Number of candles to insert.")
+        parser.add_argument('--windows', default='100,1000', help="Comma-separated window sizes to read.")
+        parser.add_argument('--repeat', type=int, default=20, help="Reads per window size.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            symbol = Symbol.objects.create(name=BENCHMARK_SYMBOL, is_active=False)
+            self._benchmark_insert(symbol, options['rows'])
+            for window in (int(size) for size in options['windows'].split(',')):
+                self._benchmark_read(symbol, window, options['repeat'])
+            if connection.vendor == 'postgresql':
+                self._report_row_size(symbol)
+            transaction.set_rollback(True)
+
+    def _benchmark_insert(self, symbol, rows):
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        candles = [
+            Candle(symbol=symbol, timestamp=start + timedelta(minutes=15 * i),
+                   open=100 + i % 7, high=110.5 + i % 7, low=95.25 + i % 7, close=105.125 + i % 7, volume=1000.5 + i)
+            for i in range(rows)
+        ]
+        started_at = time.perf_counter()
+        Candle.objects.bulk_create(candles, batch_size=1000)
+        duration = time.perf_counter() - started_at
+        self.stdout.write(f"Bulk insert: {rows} candles in {duration:.2f}s ({rows / duration:,.0f} rows/s)")
+
+    def _benchmark_read(self, symbol, window, repeat):
+        candles = Candle.objects.filter(symbol=symbol, interval=Candle.Interval.FIFTEEN_MINUTES).order_by('-timestamp')
+        as_decimals = candles.annotate(**{
+            f"{field}_decimal": Cast(field, DecimalField(max_digits=digits, decimal_places=places))
+            for field, (digits, places) in DECIMAL_COLUMNS.items()
+        })
+        layouts = {
+            'float': candles.values_list('timestamp', *OHLCV_FIELDS),
+            'decimal': as_decimals.values_list('timestamp', *(f"{field}_decimal" for field in OHLCV_FIELDS)),
+        }
+        for layout, queryset in layouts.items():
+            timings = []
+            for _ in range(repeat):
+                started_at = time.perf_counter()
+                json.dumps(list(queryset[:window]), default=str)
+                timings.append(time.perf_counter() - started_at)
+            self.stdout.write(f"Read and serialise {window} candles as {layout}: "
+                              f"median {statistics.median(timings) * 1000:.2f}ms")
+
+    def _report_row_size(self, symbol):
+        table = connection.ops.quote_name(Candle._meta.db_table)
+        numeric = ', '.join(f"c.{connection.ops.quote_name(field)}::numeric({digits}, {places})"
+                            for field, (digits, places) in DECIMAL_COLUMNS.items())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT avg(pg_column_size(c.*)), "
+                f"avg(pg_column_size(ROW(c.id, c.symbol_id, c.interval, c.timestamp, {numeric}))) "
+                f"FROM {table} c WHERE c.symbol_id = %s", [symbol.id])
+            float_size, numeric_size = cursor.fetchone()
+        self.stdout.write(f"Average row size: {float_size:.1f} bytes as float, {numeric_size:.1f} bytes as numeric")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from market_data.partitioning import (PARTITIONS_AHEAD, is_partitioned, partition_candle_table,
+                                      create_future_partitions, list_partitions)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the candle partitions for the coming months. With --convert, first turns the candle "
+        "table into a PostgreSQL table partitioned by month, copying the existing candles; the table "
+        "is locked while they are copied. Once partitioned, retention drops whole partitions instead "
+        "of deleting rows, and a daily task keeps future partitions ready. The conversion drops the "
+        "foreign keys to the candles (Signal.candle) without a migration; see the README before "
+        "migrating that field afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help="Convert the candle table into a partitioned table if it is not one yet.")
+        parser.add_argument('--months-ahead', type=int, default=PARTITIONS_AHEAD,
+                            help="Number of months after the current one to create partitions for.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Candle partitioning requires PostgreSQL.")
+
+        if not is_partitioned():
+            if not options['convert']:
+                raise CommandError("The candle table is not partitioned; run with --convert to convert it.")
+            created = partition_candle_table(options['months_ahead'])
+            self.stdout.write(self.style.SUCCESS(f"Converted the candle table into {len(created)} partitions."))
+        else:
+            created = create_future_partitions(options['months_ahead'])
+            self.stdout.write(self.style.SUCCESS(f"Created {len(created)} candle partitions."))
+
+        for name, lower, upper in list_partitions():
+            self.stdout.write(f"{name}: {lower:%Y-%m-%d} to {upper:%Y-%m-%d}")
@@ -1,33 +1,71 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 
+# One day of 15-minute candles, the most any roll-up interval needs at once
+MIN_BASE_CANDLES_TO_KEEP = 96
+
 
 class Symbol(models.Model):
     name = models.CharField(max_length=20, unique=True,
                             help_text="The symbol name as provided by the API (e.g., BTC-USDT)")
     is_active = models.BooleanField(default=True, help_text="Enable/disable data fetching for this symbol")
+    use_llm_signals = models.BooleanField(default=True,
+                                          help_text="Generate signals with the LLM; when off, the local model "
+                                                    "generates them")
+    last_candle_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                          help_text="Start time of the newest stored candle (ingestion high-water mark)")
+    retention_policy = models.JSONField(default=dict, blank=True,
+                                        help_text='Number of candles to keep per interval, e.g. {"15min": 500}. '
+                                                  'Intervals not listed use the default.')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def clean(self):
+        if not isinstance(self.retention_policy, dict) or not all(
+                interval in Candle.Interval.values and isinstance(keep, int) and keep > 0
+                for interval, keep in self.retention_policy.items()):
+            raise ValidationError({'retention_policy': "Must map interval names to positive integers."})
+        # Higher timeframes are rolled up from the base candles, so a full day of them must be kept.
+        base_to_keep = self.retention_policy.get(Candle.Interval.FIFTEEN_MINUTES, MIN_BASE_CANDLES_TO_KEEP)
+        if base_to_keep < MIN_BASE_CANDLES_TO_KEEP:
+            raise ValidationError(
+                {'retention_policy': f"At least {MIN_BASE_CANDLES_TO_KEEP} 15min candles must be kept."})
+
     class Meta:
         verbose_name_plural = "Symbols"
 
 
 class Candle(models.Model):
+    """
+    An OHLCV candle of a symbol. 15-minute candles are fetched from the exchange;
+    the higher intervals are rolled up from them (see market_data.aggregation).
+    """
+
+    class Interval(models.TextChoices):
+        FIFTEEN_MINUTES = '15min', '15 minutes'
+        ONE_HOUR = '1hour', '1 hour'
+        FOUR_HOURS = '4hour', '4 hours'
+        ONE_DAY = '1day', '1 day'
+
     symbol = models.ForeignKey(Symbol, on_delete=models.CASCADE, related_name='candles')
+    interval = models.CharField(max_length=10, choices=Interval.choices, default=Interval.FIFTEEN_MINUTES)
     timestamp = models.DateTimeField(help_text="The start time of the candle")
-    open = models.DecimalField(max_digits=18, decimal_places=8)
-    high = models.DecimalField(max_digits=18, decimal_places=8)
-    low = models.DecimalField(max_digits=18, decimal_places=8)
-    close = models.DecimalField(max_digits=18, decimal_places=8)
-    volume = models.DecimalField(max_digits=24, decimal_places=8)
+    # OHLCV is stored as double precision, 8 bytes a value and read without building Decimals.
+    # Every price the exchange quotes (at most 15 significant digits) round-trips exactly:
+    # Decimal(repr(value)) gives back the quoted string.
+    open = models.FloatField()
+    high = models.FloatField()
+    low = models.FloatField()
+    close = models.FloatField()
+    volume = models.FloatField()
 
     def __str__(self):
-        return f"{self.symbol.name} @ {self.timestamp}"
+        return f"{self.symbol.name} {self.interval} @ {self.timestamp}"
 
     class Meta:
-        # Ensure that there is only one candle per symbol for a given timestamp
-        unique_together = ('symbol', 'timestamp')
+        # Ensure that there is only one candle per symbol and interval for a given timestamp
+        unique_together = ('symbol', 'interval', 'timestamp')
         ordering = ['-timestamp']
@@ -0,0 +1,179 @@
+import logging
+import re
+from datetime import datetime, timezone
+
+from django.db import connection, models, transaction
+
+from .models import Candle
+
+logger = logging.getLogger(__name__)
+
+# Months of future partitions kept ready, so inserts never find a month without one
+PARTITIONS_AHEAD = 3
+
+_BOUNDS = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def _quote(name: str):
+    return connection.ops.quote_name(name)
+
+
+def _month_start(moment: datetime):
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def _next_month(month: datetime):
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def partition_ranges(start: datetime, end: datetime):
+    """
+    Returns the monthly partitions covering [start, end] as (name, lower, upper) tuples.
+    Partitions are named after the table and their month, e.g. market_data_candle_p2025_01.
+    """
+    ranges = []
+    month = _month_start(start)
+    while month <= end:
+        upper = _next_month(month)
+        ranges.append((f"{Candle._meta.db_table}_p{month:%Y_%m}", month, upper))
+        month = upper
+    return ranges
+
+
+def is_partitioned():
+    """Whether the candle table is a partitioned PostgreSQL table."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+                       [Candle._meta.db_table])
+        return cursor.fetchone()[0]
+
+
+def list_partitions():
+    """Returns the candle partitions as (name, lower, upper) tuples, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)",
+            [Candle._meta.db_table])
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        match = _BOUNDS.search(bound)
+        if match:
+            lower, upper = (datetime.fromisoformat(value).astimezone(timezone.utc) for value in match.groups())
+            partitions.append((name, lower, upper))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partitions(start: datetime, end: datetime):
+    """Creates the missing monthly partitions covering [start, end]. Returns the names of the new ones."""
+    existing = {name for name, _, _ in list_partitions()}
+    created = []
+    with connection.cursor() as cursor:
+        for name, lower, upper in partition_ranges(start, end):
+            if name in existing:
+                continue
+            # DDL takes no bind parameters; the bounds are generated here, never user input
+            cursor.execute(f"CREATE TABLE {_quote(name)} PARTITION OF {_quote(Candle._meta.db_table)} "
+                           f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')")
+            created.append(name)
+    if created:
+        logger.info(f"Created candle partitions {', '.join(created)}.")
+    return created
+
+
+def create_future_partitions(months_ahead: int = PARTITIONS_AHEAD, since: datetime = None, now: datetime = None):
+    """Makes sure every month from `since` (default: the current one) to `months_ahead` months ahead has a partition."""
+    now = now or datetime.now(timezone.utc)
+    month = _month_start(now)
+    for _ in range(months_ahead):
+        month = _next_month(month)
+    return create_partitions(min(since or now, now), month)
+
+
+def drop_partitions_before(cutoff: datetime):
+    """
+    Drops every partition holding only candles older than `cutoff`.
+    Rows that cascade from candles (e.g. signals) are deleted first, in the same transaction,
+    since rows in other tables cannot reference a partitioned table.
+    Returns {partition name: number of candles dropped with it}.
+    """
+    dropped = {}
+    with transaction.atomic():
+        for name, lower, upper in list_partitions():
+            if upper > cutoff:
+                break
+            for relation in Candle._meta.related_objects:
+                if relation.on_delete is models.CASCADE:
+                    relation.related_model._base_manager.filter(**{
+                        f"{relation.field.name}__timestamp__gte": lower,
+                        f"{relation.field.name}__timestamp__lt": upper,
+                    }).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT count(*) FROM {_quote(name)}")
+                dropped[name] = cursor.fetchone()[0]
+                cursor.execute(f"DROP TABLE {_quote(name)}")
+    if dropped:
+        logger.info(f"Dropped candle partitions {', '.join(dropped)}.")
+    return dropped
+
+
+def partition_candle_table(months_ahead: int = PARTITIONS_AHEAD):
+    """
+    Converts the candle table into a table partitioned by month on `timestamp`, in one transaction.
+    The rows are copied into the new partitions and the old table is dropped. A partitioned table's
+    keys must contain the partition column, so the primary key becomes (id, timestamp), and foreign
+    keys from other tables to the candles are dropped; deleting a candle still cascades through the ORM.
+    The migration state is not told: it still has Signal.candle's foreign key constraint, so a later
+    migration altering that field has to leave the database alone (see the README).
+    The table is locked for the duration of the copy.
+    Returns the names of the created partitions.
+    """
+    table = Candle._meta.db_table
+    old_table = f"{table}_unpartitioned"
+    columns = [field.column for field in Candle._meta.local_concrete_fields]
+    column_list = ', '.join(_quote(column) for column in columns)
+    symbol_field = Candle._meta.get_field('symbol')
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {_quote(table)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint WHERE contype = 'f' AND confrelid = %s::regclass",
+            [table])
+        for referencing_table, constraint in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {referencing_table} DROP CONSTRAINT {_quote(constraint)}")
+        cursor.execute(f"ALTER TABLE {_quote(table)} RENAME TO {_quote(old_table)}")
+
+        cursor.execute(
+            f"CREATE TABLE {_quote(table)} (LIKE {_quote(old_table)} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE ({_quote('timestamp')})")
+        cursor.execute(f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(f'{table}_partitioned_pkey')} "
+                       f"PRIMARY KEY ({_quote('id')}, {_quote('timestamp')})")
+        cursor.execute(f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(f'{table}_partitioned_uniq')} "
+                       f"UNIQUE ({_quote('symbol_id')}, {_quote('interval')}, {_quote('timestamp')})")
+        cursor.execute(
+            f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(f'{table}_partitioned_symbol_fk')} "
+            f"FOREIGN KEY ({_quote(symbol_field.column)}) REFERENCES "
+            f"{_quote(symbol_field.related_model._meta.db_table)} ({_quote('id')}) DEFERRABLE INITIALLY DEFERRED")
+
+        # The id sequence belonged to the old table; the new one continues where it stopped. The table is
+        # altered before the copy: its deferred foreign key leaves trigger events pending until the commit,
+        # and PostgreSQL refuses to alter a table that has them
+        sequence = f"{table}_partitioned_id_seq"
+        cursor.execute(f"CREATE SEQUENCE {_quote(sequence)} AS bigint OWNED BY {_quote(table)}.{_quote('id')}")
+        cursor.execute(f"ALTER TABLE {_quote(table)} ALTER COLUMN {_quote('id')} "
+                       f"SET DEFAULT nextval('{sequence}'::regclass)")
+
+        cursor.execute(f"SELECT min({_quote('timestamp')}) FROM {_quote(old_table)}")
+        oldest = cursor.fetchone()[0]
+        created = create_future_partitions(months_ahead, since=oldest)
+        cursor.execute(f"INSERT INTO {_quote(table)} ({column_list}) SELECT {column_list} FROM {_quote(old_table)}")
+        copied = cursor.rowcount
+        cursor.execute(f"DROP TABLE {_quote(old_table)}")
+        cursor.execute(f"SELECT setval(%s, coalesce(max({_quote('id')}), 0) + 1, false) FROM {_quote(table)}",
+                       [sequence])
+
+    logger.info(f"Partitioned {table}: copied {copied} candles into {len(created)} partitions.")
+    return created
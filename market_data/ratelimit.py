@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+
+class AsyncTokenBucket:
+    """
+    A token-bucket rate limiter for asyncio code.
+    The bucket starts full, holds at most `capacity` tokens and refills at a constant
+    rate so that `capacity` tokens become available again every `period` seconds.
+    """
+
+    def __init__(self, capacity: float, period: float):
+        if capacity <= 0 or period <= 0:
+            raise ValueError("capacity and period must be positive.")
+        self.capacity = capacity
+        self.rate = capacity / period
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, tokens: float = 1):
+        """Waits until `tokens` are available and consumes them."""
+        if tokens > self.capacity:
+            raise ValueError("Cannot acquire more tokens than the bucket capacity.")
+        # The lock keeps waiters in FIFO order, so a large request cannot be starved.
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
@@ -0,0 +1,101 @@
+import logging
+import time
+
+from django.db import connection, models, transaction
+from django.db.models import Case, F, IntegerField, Min, Value, When, Window
+from django.db.models.functions import RowNumber
+
+from .models import Symbol, Candle
+from .partitioning import is_partitioned, drop_partitions_before
+from .candle_buffer import invalidate_candle_buffers, invalidate_candle_buffers_on_commit
+from .symbol_registry import get_symbol_map
+
+logger = logging.getLogger(__name__)
+
+# Number of candles kept per symbol and interval unless the symbol's retention policy says otherwise
+CANDLES_TO_KEEP_PER_SYMBOL = 100
+
+
+def _candles_to_keep_expression():
+    """Builds a CASE expression resolving each candle row to its symbol's limit for its interval."""
+    overrides = [
+        When(symbol_id=symbol_id, interval=interval, then=Value(keep))
+        for symbol_id, policy in Symbol.objects.exclude(retention_policy={}).values_list('id', 'retention_policy')
+        for interval, keep in policy.items()
+    ]
+    if not overrides:
+        return Value(CANDLES_TO_KEEP_PER_SYMBOL)
+    return Case(*overrides, default=Value(CANDLES_TO_KEEP_PER_SYMBOL), output_field=IntegerField())
+
+
+def expired_candle_ids():
+    """
+    Returns a subquery selecting the ids of every candle beyond its retention limit.
+    Candles are ranked newest first within each symbol and interval by a window function,
+    so all symbols are handled by one set-based query.
+    """
+    return Candle.objects.annotate(
+        row_number=Window(RowNumber(), partition_by=[F('symbol_id'), F('interval')], order_by=F('timestamp').desc()),
+        keep=_candles_to_keep_expression(),
+    ).filter(row_number__gt=F('keep')).order_by().values('id')
+
+
+def retention_cutoff():
+    """
+    Returns the start time of the oldest candle that an active symbol's retention policy still keeps,
+    or None if there is none. The same window ranking as expired_candle_ids() picks the kept candles
+    of every active symbol and interval, so the cutoff is one query whatever the number of symbols.
+    Inactive symbols do not hold old data back.
+    """
+    return Candle.objects.filter(symbol__is_active=True).annotate(
+        row_number=Window(RowNumber(), partition_by=[F('symbol_id'), F('interval')], order_by=F('timestamp').desc()),
+        keep=_candles_to_keep_expression(),
+    ).filter(row_number__lte=F('keep')).aggregate(cutoff=Min('timestamp'))['cutoff']
+
+
+def prune_candles():
+    """
+    Deletes every candle beyond its symbol's retention limit in a single DELETE statement.
+    Rows that cascade from candles (e.g. signals) are removed first, in the same transaction.
+    When the candle table is partitioned (see market_data.partitioning), nothing is deleted row by
+    row: whole partitions are dropped once every candle in them is beyond the retention limits.
+    The candle buffers of the pruned symbols and intervals are dropped afterwards, so they never
+    serve candles that are no longer stored.
+    Returns a dict with the number of candles deleted and the time taken in seconds.
+    """
+    started_at = time.monotonic()
+    if is_partitioned():
+        cutoff = retention_cutoff()
+        dropped = drop_partitions_before(cutoff) if cutoff else {}
+        if dropped:
+            # Any buffer may reach back into a dropped month
+            invalidate_candle_buffers([(symbol.name, interval) for symbol in get_symbol_map().values()
+                                       for interval in Candle.Interval.values])
+        duration = round(time.monotonic() - started_at, 3)
+        logger.info(f"Dropped {len(dropped)} expired candle partitions in {duration}s.")
+        return {'deleted': sum(dropped.values()), 'partitions': list(dropped), 'duration': duration}
+
+    expired_ids = expired_candle_ids()
+    sql, params = expired_ids.query.sql_with_params()
+
+    with transaction.atomic():
+        for relation in Candle._meta.related_objects:
+            if relation.on_delete is models.CASCADE:
+                relation.related_model._base_manager.filter(**{f"{relation.field.name}__in": expired_ids}).delete()
+        table = connection.ops.quote_name(Candle._meta.db_table)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Returns one row per pruned symbol and interval rather than one per deleted candle
+                cursor.execute(f"WITH deleted AS (DELETE FROM {table} WHERE id IN ({sql}) "
+                               f"RETURNING symbol_id, interval) "
+                               f"SELECT symbol_id, interval, count(*) FROM deleted GROUP BY symbol_id, interval", params)
+                pruned = cursor.fetchall()
+            else:
+                cursor.execute(f"DELETE FROM {table} WHERE id IN ({sql}) RETURNING symbol_id, interval", params)
+                pruned = [(*pair, 1) for pair in cursor.fetchall()]
+        deleted = sum(count for _, _, count in pruned)
+        invalidate_candle_buffers_on_commit({(symbol_id, interval) for symbol_id, interval, _ in pruned})
+
+    duration = round(time.monotonic() - started_at, 3)
+    logger.info(f"Pruned {deleted} expired candles in {duration}s.")
+    return {'deleted': deleted, 'duration': duration}
@@ -1,6 +1,44 @@
+import asyncio
+import logging
 import requests
-from datetime import datetime
-from decimal import Decimal
+import httpx
+from datetime import datetime, timezone
+
+from .ratelimit import AsyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+# KuCoin's public REST quota: 2000 weight units per 30 seconds per IP.
+# Docs: https://www.kucoin.com/docs/basic-info/request-rate-limit/rest-api
+KUCOIN_PUBLIC_QUOTA = 2000
+KUCOIN_QUOTA_PERIOD = 30
+KLINE_REQUEST_WEIGHT = 3
+# KuCoin returns at most this many candles per k-line request.
+MAX_CANDLES_PER_REQUEST = 1500
+
+INTERVAL_SECONDS = {
+    '15min': 15 * 60,
+    '1hour': 60 * 60,
+    '4hour': 4 * 60 * 60,
+    '1day': 24 * 60 * 60,
+}
+
+
+def parse_kline_data(data: list):
+    """
+    Converts KuCoin's raw k-line rows into candle dicts.
+    Each row is [time, open, close, high, low, volume, turnover], all as strings.
+    """
+    return [
+        {
+            'timestamp': datetime.fromtimestamp(int(item[0]), tz=timezone.utc),
+            'open': float(item[1]),
+            'close': float(item[2]),
+            'high': float(item[3]),
+            'low': float(item[4]),
+            'volume': float(item[5]),
+        } for item in data
+    ]
 
 
 class KucoinClient:
@@ -9,29 +47,108 @@ class KucoinClient:
     """
     BASE_URL = "https://api.kucoin.com"
 
-    def get_kline_data(self, symbol: str, interval: str = '15min'):
+    def get_kline_data(self, symbol: str, interval: str = '15min', start_at: int = None, end_at: int = None):
         """
         Fetches K-line (candle) data for a given symbol.
+        `start_at` and `end_at` are optional UNIX timestamps (seconds) limiting the time range.
         Docs: https://docs.kucoin.com/#get-klines
         """
-        endpoint = f"/api/v1/market/candles?type={interval}min&symbol={symbol}"
+        endpoint = f"/api/v1/market/candles?type={interval}&symbol={symbol}"
+        if start_at is not None:
+            endpoint += f"&startAt={start_at}"
+        if end_at is not None:
+            endpoint += f"&endAt={end_at}"
 
         try:
             response = requests.get(f"{self.BASE_URL}{endpoint}")
             response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-            data = response.json().get('data', [])
-
-            parsed_data = []
-            for item in data:
-                parsed_data.append({
-                    'timestamp': datetime.fromtimestamp(int(item[0])),
-                    'open': Decimal(item[1]),
-                    'close': Decimal(item[2]),
-                    'high': Decimal(item[3]),
-                    'low': Decimal(item[4]),
-                    'volume': Decimal(item[5]),
-                })
-            return parsed_data
+            return parse_kline_data(response.json().get('data', []))
         except requests.exceptions.RequestException as e:
             print(f"Error fetching data for {symbol}: {e}")
             return None
+
+
+class AsyncKucoinClient:
+    """
+    An asyncio client for fetching candles of many symbols concurrently.
+    All requests share one pooled HTTP connection pool and one token bucket sized
+    to KuCoin's public rate limit, so the whole batch stays within the quota.
+    Use it as an async context manager so the connection pool is closed afterwards.
+    """
+    BASE_URL = KucoinClient.BASE_URL
+
+    def __init__(self, base_url: str = None, max_concurrency: int = 20, timeout: float = 10.0,
+                 rate_limiter: AsyncTokenBucket = None, max_retries: int = 2):
+        self.base_url = base_url or self.BASE_URL
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or AsyncTokenBucket(KUCOIN_PUBLIC_QUOTA, KUCOIN_QUOTA_PERIOD)
+        # The semaphore keeps queued requests out of the pool, so they never hit a pool timeout.
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def get_kline_data(self, symbol: str, interval: str = '15min', start_at: int = None, end_at: int = None):
+        """
+        Fetches K-line (candle) data for a given symbol, optionally limited to a time range.
+        Returns the parsed candles, or None if the request failed.
+        """
+        params = {'type': interval, 'symbol': symbol}
+        if start_at is not None:
+            params['startAt'] = start_at
+        if end_at is not None:
+            params['endAt'] = end_at
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.rate_limiter.acquire(KLINE_REQUEST_WEIGHT)
+                try:
+                    response = await self._client.get('/api/v1/market/candles', params=params)
+                    if response.status_code == 429 and attempt < self.max_retries:
+                        # The quota is shared with anything else on this IP; back off and retry.
+                        await asyncio.sleep(2 ** attempt)
+                        continue
+                    response.raise_for_status()
+                    return parse_kline_data(response.json().get('data', []))
+                except (httpx.HTTPError, ValueError) as e:
+                    logger.error(f"Error fetching data for {symbol}: {e}")
+                    return None
+        return None
+
+    async def get_kline_pages(self, symbol: str, interval: str, windows: list):
+        """
+        Fetches several (start_at, end_at) windows of one symbol concurrently.
+        Returns all candles merged, or None if any page failed, so callers never
+        store a range with a hole in the middle.
+        """
+        pages = await asyncio.gather(*(
+            self.get_kline_data(symbol, interval, start_at, end_at) for start_at, end_at in windows
+        ))
+        if any(page is None for page in pages):
+            return None
+        return [candle for page in pages for candle in page]
+
+    async def get_kline_data_many(self, symbols: list, interval: str = '15min', windows: dict = None):
+        """
+        Fetches candles for all given symbols concurrently.
+        `windows` optionally maps a symbol name to a list of (start_at, end_at) pages to fetch;
+        symbols without an entry get KuCoin's default (most recent) window.
+        Returns a dict mapping each symbol name to its parsed candles (or None on failure).
+        """
+        windows = windows or {}
+        results = await asyncio.gather(*(
+            self.get_kline_pages(symbol, interval, windows[symbol]) if symbol in windows
+            else self.get_kline_data(symbol, interval)
+            for symbol in symbols
+        ))
+        return dict(zip(symbols, results))
@@ -0,0 +1,39 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Symbol, Candle
+from .candle_buffer import invalidate_candle_buffers, invalidate_candle_buffers_on_commit
+from .symbol_registry import invalidate_symbol_registry
+
+
+@receiver(post_save, sender=Candle)
+def invalidate_buffer_on_candle_save(sender, instance, **kwargs):
+    """
+    Candles saved one by one bypass the ingestion path, so the buffer is rebuilt once the transaction commits.
+    Deletes are not hooked: a post_delete receiver would make every bulk delete load its candles one by one,
+    so the delete paths (retention, the admin, deleting a symbol) drop the buffers themselves.
+    """
+    invalidate_candle_buffers_on_commit([(instance.symbol_id, instance.interval)])
+
+
+@receiver([post_save, post_delete], sender=Symbol)
+def invalidate_registry_on_symbol_change(sender, instance, update_fields=None, **kwargs):
+    """
+    Symbols added, renamed, (de)activated or deleted must be seen by every process.
+    The invalidation waits for the commit, or a process reloading the registry in between would cache
+    the old rows under the new version.
+    """
+    # The ingestion high-water mark is not part of the registry
+    if update_fields is not None and set(update_fields) <= {'last_candle_at', 'updated_at'}:
+        return
+    transaction.on_commit(invalidate_symbol_registry)
+
+
+@receiver(post_delete, sender=Symbol)
+def invalidate_buffers_on_symbol_delete(sender, instance, **kwargs):
+    """A deleted symbol's candles go with it, so its buffers are dropped once that commits."""
+    pairs = [(instance.name, interval) for interval in Candle.Interval.values]
+    transaction.on_commit(partial(invalidate_candle_buffers, pairs))
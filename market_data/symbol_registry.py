@@ -0,0 +1,110 @@
+import logging
+import time
+import uuid
+from typing import NamedTuple
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from .models import Symbol
+
+logger = logging.getLogger(__name__)
+
+# How long a process trusts its local copy before checking the shared version stamp
+LOCAL_CHECK_INTERVAL = 5
+# The shared copy is rebuilt at least this often, in case a change bypassed the invalidation
+REGISTRY_TTL = 86400
+
+_DATA_KEY = 'symbol-registry:data'
+_VERSION_KEY = 'symbol-registry:version'
+
+
+class SymbolRef(NamedTuple):
+    id: int
+    name: str
+    is_active: bool
+
+
+# (version, {lowercased name: SymbolRef}, monotonic time of the last version check),
+# replaced as a whole so concurrent readers always see a consistent entry
+_local = (None, None, 0.0)
+
+
+def _load_from_db():
+    return {name.lower(): (symbol_id, name, is_active)
+            for symbol_id, name, is_active in Symbol.objects.values_list('id', 'name', 'is_active')}
+
+
+def _refresh(version):
+    """Brings the local copy up to `version`, rebuilding the shared copy from the database if it is stale."""
+    global _local
+    if version is None:
+        # Stamp a new version; `add` keeps the stamp of a process that got there first
+        cache.add(_VERSION_KEY, uuid.uuid4().hex, timeout=REGISTRY_TTL)
+        version = cache.get(_VERSION_KEY)
+
+    entry = cache.get(_DATA_KEY)
+    if entry is None or entry['version'] != version:
+        entry = {'version': version, 'symbols': _load_from_db()}
+        cache.set(_DATA_KEY, entry, timeout=REGISTRY_TTL)
+        logger.info(f"Rebuilt the symbol registry with {len(entry['symbols'])} symbols.")
+
+    symbols = {key: SymbolRef(*value) for key, value in entry['symbols'].items()}
+    _local = (version, symbols, time.monotonic())
+    return symbols
+
+
+def _current_symbols():
+    """Returns the local copy if it was checked recently, otherwise None."""
+    version, symbols, checked_at = _local
+    if symbols is not None and time.monotonic() - checked_at < LOCAL_CHECK_INTERVAL:
+        return symbols
+    return None
+
+
+def _confirm(version):
+    """Returns the local copy if it is still at `version`, marking it as checked."""
+    global _local
+    local_version, symbols, _ = _local
+    if symbols is not None and version is not None and version == local_version:
+        _local = (local_version, symbols, time.monotonic())
+        return symbols
+    return None
+
+
+def get_symbol_map():
+    """
+    Returns every symbol as {lowercased name: SymbolRef}.
+    The map is held in process memory and shared through the cache: a process checks the shared
+    version stamp at most every LOCAL_CHECK_INTERVAL seconds and reads the database only when the
+    symbols have changed, so resolving a symbol normally costs no query and no round trip.
+    """
+    symbols = _current_symbols()
+    if symbols is not None:
+        return symbols
+    version = cache.get(_VERSION_KEY)
+    return _confirm(version) or _refresh(version)
+
+
+async def aget_symbol_map():
+    symbols = _current_symbols()
+    if symbols is not None:
+        return symbols
+    version = await cache.aget(_VERSION_KEY)
+    return _confirm(version) or await sync_to_async(_refresh)(version)
+
+
+def resolve_symbol(name: str):
+    """Returns the SymbolRef of a symbol by case-insensitive name, or None if there is no such symbol."""
+    return get_symbol_map().get(name.lower())
+
+
+async def aresolve_symbol(name: str):
+    return (await aget_symbol_map()).get(name.lower())
+
+
+def invalidate_symbol_registry():
+    """Discards the registry in every process; it is rebuilt from the database on the next lookup."""
+    global _local
+    cache.set(_VERSION_KEY, uuid.uuid4().hex, timeout=REGISTRY_TTL)
+    _local = (None, None, 0.0)
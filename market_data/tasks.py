@@ -1,69 +1,98 @@
 from celery import shared_task
-from .models import Symbol, Candle
+from ai_signals.dispatch import dispatch_signal_jobs
+from ai_signals.tasks import evaluate_signal_outcomes
+from .models import Symbol
 from .services import KucoinClient
+from .ingestion import store_candles, ingest_symbols, initialise_high_water_marks, fetch_symbol_candles
+from .retention import prune_candles
+from .partitioning import is_partitioned, create_future_partitions
+from .backfill import backfill_symbol
+from .aggregation import BASE_INTERVAL
 from datetime import datetime, timezone
 
-# Define the number of candles to keep per symbol as a constant
-CANDLES_TO_KEEP_PER_SYMBOL = 100
-
 
 @shared_task
 def fetch_and_store_candles(symbol_name: str):
     """
-    Fetches latest candles, stores new ones, and prunes old ones to a fixed limit.
+    Fetches the candles missing since the symbol's last stored candle and stores them.
+    Old candles are pruned separately by `prune_expired_candles`.
     """
-    client = KucoinClient()
-    candles_data = client.get_kline_data(symbol_name, interval='15min')
-
-    if not candles_data:
-        return f"No data received from API for {symbol_name}"
-
     try:
         symbol = Symbol.objects.get(name=symbol_name)
     except Symbol.DoesNotExist:
         return f"Symbol {symbol_name} not found in the database."
 
+    initialise_high_water_marks([symbol])
+    client = KucoinClient()
+    candles_data = fetch_symbol_candles(client, symbol, BASE_INTERVAL, datetime.now(timezone.utc))
+
+    if not candles_data:
+        return f"No new data received from API for {symbol_name}"
+
     # Bulk insert new candles, ignoring duplicates
-    candles_to_create = [
-        Candle(
-            symbol=symbol,
-            timestamp=data['timestamp'].replace(tzinfo=timezone.utc),
-            open=data['open'],
-            close=data['close'],
-            high=data['high'],
-            low=data['low'],
-            volume=data['volume']
-        ) for data in candles_data
-    ]
-    created_candles = Candle.objects.bulk_create(candles_to_create, ignore_conflicts=True)
-
-    # Prune old candles
-    # Get the primary keys of the newest N candles for this symbol
-    latest_candle_ids = Candle.objects.filter(symbol=symbol).order_by('-timestamp')[
-                        :CANDLES_TO_KEEP_PER_SYMBOL].values_list('id', flat=True)
-
-    # Delete all candles for this symbol that are NOT in the list of the newest ones
-    # This is a highly efficient way to prune the dataset.
-    Candle.objects.filter(symbol=symbol).exclude(id__in=list(latest_candle_ids)).delete()
-
-    # todo: This logic will be activated when the 'ai_signals' app is ready.
-    # if created_candles:
-    #     for candle in created_candles:
-    #         generate_signal_for_candle.delay(candle.id)
-
-    return f"Processed {symbol_name}. Added {len(created_candles)} new candles. Total candles kept at/below {CANDLES_TO_KEEP_PER_SYMBOL}."
+    rows = store_candles({symbol: candles_data})
+
+    # Only the latest closed candle gets a signal, however many candles were stored
+    dispatch_signal_jobs([symbol])
+
+    return f"Processed {symbol_name}. Stored {rows} candles."
 
 
 @shared_task
 def schedule_all_active_symbols_fetching():
     """
-    A periodic task that finds all active symbols and triggers individual fetching tasks
-    with a small delay between each to avoid API rate limiting.
+    A periodic task that fetches new candles for all active symbols in one batch.
+    Only the range after each symbol's last stored candle is requested. Requests run
+    concurrently under a shared rate limiter, and all results are written in a single
+    bulk transaction. Afterwards the newly closed candle of each symbol is queued for a signal,
+    and the outcomes of earlier signals whose horizons have now closed are evaluated.
+    """
+    active_symbols = list(Symbol.objects.filter(is_active=True))
+    if not active_symbols:
+        return "No active symbols to fetch."
+
+    summary = ingest_symbols(active_symbols)
+    signal_jobs = dispatch_signal_jobs(active_symbols)
+    evaluate_signal_outcomes.delay()
+
+    return (f"Fetched {summary['symbols']} of {len(active_symbols)} active symbols "
+            f"({summary['skipped']} up to date, {summary['failed']} failed), "
+            f"stored {summary['rows']} candles in {summary['duration']}s, "
+            f"queued {signal_jobs} candles for signals.")
+
+
+@shared_task
+def prune_expired_candles():
+    """
+    A periodic task that enforces the candle retention policies of all symbols at once.
+    """
+    result = prune_candles()
+    return f"Pruned {result['deleted']} expired candles in {result['duration']}s."
+
+
+@shared_task
+def create_candle_partitions():
+    """
+    A periodic task that keeps the next months' candle partitions ready when the candle table is partitioned.
+    """
+    if not is_partitioned():
+        return "The candle table is not partitioned."
+    created = create_future_partitions()
+    return f"Created {len(created)} candle partitions."
+
+
+@shared_task
+def backfill_symbol_history(symbol_name: str, days: int):
+    """
+    Loads `days` days of a symbol's 15-minute history. One task is queued per symbol, so the
+    symbols of a large backfill are fetched and loaded in parallel across the workers.
     """
-    active_symbols = Symbol.objects.filter(is_active=True)
-    # Stagger the tasks to prevent a "thundering herd" problem
-    for i, symbol in enumerate(active_symbols):
-        # The 'countdown' argument adds a delay in seconds before the task executes.
-        fetch_and_store_candles.apply_async(args=[symbol.name], countdown=i * 2)  # 2-second delay between each task
+    try:
+        symbol = Symbol.objects.get(name=symbol_name)
+    except Symbol.DoesNotExist:
+        return f"Symbol {symbol_name} not found in the database."
 
-    return f"Triggered fetching for {active_symbols.count()} active symbols with staggering."
\ No newline at end of file
+    summary = backfill_symbol(symbol, days)
+    status = "stopped at a failed page" if summary['failed'] else "complete"
+    return (f"Backfilled {summary['rows']} candles of {symbol_name} from {summary['pages']} pages "
+            f"in {summary['duration']}s ({status}).")
@@ -1,14 +1,42 @@
 from dj_rest_auth.tests.mixins import APIClient
-from django.test import TestCase
+from django.core.cache import cache
+from django.contrib.admin.sites import AdminSite
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from unittest import skipUnless
 from unittest.mock import patch, MagicMock
 
+from redis.exceptions import ConnectionError as RedisConnectionError
 from rest_framework import status
 
 from .models import Symbol, Candle
-from .tasks import fetch_and_store_candles, schedule_all_active_symbols_fetching, CANDLES_TO_KEEP_PER_SYMBOL
-from .services import KucoinClient
+from .tasks import fetch_and_store_candles, schedule_all_active_symbols_fetching, prune_expired_candles
+from .retention import prune_candles, retention_cutoff, CANDLES_TO_KEEP_PER_SYMBOL
+from .backfill import backfill_symbol, copy_candles
+from .partitioning import partition_ranges, partition_candle_table, list_partitions
+from .aggregation import rollup, update_rollups
+from .candle_buffer import CandleRingBuffer, get_candle_buffer, read_candles, load_buffer_from_db, CLOSE
+from .indicators import ema, advance_state, support_resistance, candlestick_patterns, get_features, EMA_SPANS
+from .services import KucoinClient, AsyncKucoinClient, parse_kline_data
+from .symbol_registry import resolve_symbol, invalidate_symbol_registry
+from .events import EventHub, Subscription, publish_events, CANDLE_EVENT, SIGNAL_EVENT
+from .admin import SymbolAdmin
+from .ingestion import ingest_symbols, plan_fetch_windows, last_closed_candle_start, INITIAL_LOOKBACK_CANDLES
 from datetime import datetime, timezone, timedelta
 from decimal import Decimal
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import asyncio
+import copy
+import json
+import shutil
+import tempfile
+import numpy as np
+import threading
 import requests
 
 # This is sample data that our Mock API will return
@@ -20,12 +48,120 @@ MOCK_API_RESPONSE = [
 ]
 
 
+def query_plan(queryset):
+    """
+    Returns the database's plan for a queryset. Sequential scans are disabled on PostgreSQL,
+    whose planner would otherwise scan the tiny test tables instead of using an index.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+    return queryset.explain()
+
+
+# Plan fragments that mean a query sorts its rows instead of reading them in index order
+SORT_IN_PLAN = r'TEMP B-TREE FOR ORDER BY|\bSort\b'
+
+
+class StubKucoinHandler(BaseHTTPRequestHandler):
+    """
+    Serves k-line responses like KuCoin: one 15-minute candle per step in [startAt, endAt),
+    newest first, or two canned candles when no range is given.
+    Symbols starting with 'BAD' get a 500 error.
+    """
+    requests_seen = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        symbol = query['symbol'][0]
+        self.requests_seen.append(query)
+        if symbol.startswith('BAD'):
+            self.send_response(500)
+            self.end_headers()
+            return
+        if 'startAt' in query:
+            start_at, end_at = int(query['startAt'][0]), int(query['endAt'][0])
+            rows = [[str(ts), "100", "105", "110", "95", "1000", "0"] for ts in range(start_at, end_at, 900)]
+            rows = rows[-1500:][::-1]
+        else:
+            rows = [
+                ["1735726500", "100", "105", "110", "95", "1000", "0"],
+                ["1735725600", "90", "100", "102", "88", "800", "0"],
+            ]
+        body = json.dumps({'code': '200000', 'data': rows}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubRedis:
+    """
+    Stands in for the Redis pub/sub of the event hub: messages published through `pipeline()` reach
+    the pattern subscriptions opened with `pubsub()`, and `drop_connection()` makes the open ones fail
+    like a lost connection. Only the calls the hub and `publish_events` make are implemented.
+    """
+
+    def __init__(self):
+        self.pubsubs = []
+
+    def pubsub(self):
+        pubsub = StubPubSub()
+        self.pubsubs.append(pubsub)
+        return pubsub
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def publish(self, channel, data):
+        for pubsub in self.pubsubs:
+            if pubsub.subscribed and not pubsub.closed:
+                pubsub.messages.put_nowait({'type': 'pmessage', 'channel': channel.encode(),
+                                            'data': data.encode() if isinstance(data, str) else data})
+
+    def execute(self):
+        pass
+
+    def drop_connection(self):
+        for pubsub in self.pubsubs:
+            pubsub.messages.put_nowait(RedisConnectionError('Connection closed by server.'))
+
+
+class StubPubSub:
+    def __init__(self):
+        self.messages = asyncio.Queue()
+        self.subscribed = self.closed = False
+
+    async def psubscribe(self, pattern):
+        self.subscribed = True
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=None):
+        try:
+            message = await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+    async def aclose(self):
+        self.closed = True
+
+
 class ComprehensiveMarketDataTests(TestCase):
 
     def setUp(self):
         self.symbol_active = Symbol.objects.create(name='BTC-USDT', is_active=True)
         self.symbol_inactive = Symbol.objects.create(name='ETH-USDT', is_active=False)
         self.client = APIClient()
+        # Candle buffers live in the cache, so clear it to keep tests isolated
+        cache.clear()
+        # Symbol changes reach the registry on commit, which a test case never reaches
+        invalidate_symbol_registry()
 
     # --- Service Layer Tests (KucoinClient) ---
 
@@ -58,18 +194,18 @@ class ComprehensiveMarketDataTests(TestCase):
 
     @patch('market_data.tasks.KucoinClient')
     def test_task_full_logic_with_pruning(self, MockKucoinClient):
-        """A comprehensive test for the main task's logic: fetch, store, and prune."""
+        """A comprehensive test for the fetch task and the separate pruning job: fetch, store, and prune."""
         # Configure the mock client instance
         mock_client_instance = MockKucoinClient.return_value
         mock_client_instance.get_kline_data.return_value = MOCK_API_RESPONSE
 
         # --- Part 1: Initial fetch ---
         fetch_and_store_candles(self.symbol_active.name)
-        self.assertEqual(Candle.objects.count(), 2)
+        self.assertEqual(Candle.objects.filter(interval='15min').count(), 2)
 
         # --- Part 2: Running again should not create duplicates ---
         fetch_and_store_candles(self.symbol_active.name)
-        self.assertEqual(Candle.objects.count(), 2)  # Count should remain the same
+        self.assertEqual(Candle.objects.filter(interval='15min').count(), 2)  # Count should remain the same
 
         # --- Part 3: Test pruning logic ---
         # Create more candles than the limit
@@ -79,22 +215,630 @@ class ComprehensiveMarketDataTests(TestCase):
                 timestamp=datetime(2024, 1, 1, 0, 0, 0, tzinfo=timezone.utc).replace(microsecond=i),
                 open=1, high=1, low=1, close=1, volume=1
             )
-        # Total candles = 2 + 300 = 302
-        self.assertEqual(Candle.objects.count(), CANDLES_TO_KEEP_PER_SYMBOL + 2)
+        # Total 15-minute candles = 2 + 100 = 102
+        self.assertEqual(Candle.objects.filter(interval='15min').count(), CANDLES_TO_KEEP_PER_SYMBOL + 2)
 
-        # Run the task again. It should add no new candles but prune 2 old ones.
-        fetch_and_store_candles(self.symbol_active.name)
-        self.assertEqual(Candle.objects.filter(symbol=self.symbol_active).count(), CANDLES_TO_KEEP_PER_SYMBOL)
+        # Run the pruning job. It should prune the 2 oldest ones.
+        prune_expired_candles()
+        self.assertEqual(Candle.objects.filter(interval='15min', symbol=self.symbol_active).count(),
+                         CANDLES_TO_KEEP_PER_SYMBOL)
 
-    @patch('market_data.tasks.fetch_and_store_candles.apply_async')
-    def test_scheduler_task(self, mock_apply_async):
-        """Test that the scheduler task correctly triggers jobs for active symbols only."""
+    @patch('market_data.tasks.evaluate_signal_outcomes')
+    @patch('market_data.tasks.ingest_symbols')
+    def test_scheduler_task(self, mock_ingest_symbols, mock_evaluate_outcomes):
+        """Test that the scheduler task ingests all active symbols in a single batch."""
+        mock_ingest_symbols.return_value = {'symbols': 1, 'skipped': 0, 'failed': 0, 'rows': 2, 'duration': 0.1}
         schedule_all_active_symbols_fetching()
 
-        # Assert that the task was called only once (for the active symbol)
-        mock_apply_async.assert_called_once()
-        # Assert it was called with the correct symbol name
-        self.assertEqual(mock_apply_async.call_args.kwargs['args'][0], self.symbol_active.name)
+        # Assert that the batch was run only once, with the active symbol only
+        mock_ingest_symbols.assert_called_once()
+        self.assertEqual(mock_ingest_symbols.call_args.args[0], [self.symbol_active])
+        # Signal outcomes are evaluated once the new candles are stored
+        mock_evaluate_outcomes.delay.assert_called_once()
+
+    def test_prune_candles_applies_per_symbol_policies(self):
+        """Test that one pruning run enforces each symbol's own retention limit."""
+        self.symbol_inactive.retention_policy = {'15min': 3}
+        self.symbol_inactive.save()
+        start_time = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        with self.captureOnCommitCallbacks(execute=True):
+            for symbol in (self.symbol_active, self.symbol_inactive):
+                for i in range(CANDLES_TO_KEEP_PER_SYMBOL + 5):
+                    Candle.objects.create(symbol=symbol, timestamp=start_time + timedelta(minutes=15 * i),
+                                          open=1, high=1, low=1, close=1, volume=1)
+
+        buffer = get_candle_buffer(self.symbol_active.name)
+        self.assertEqual(len(buffer), CANDLES_TO_KEEP_PER_SYMBOL + 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = prune_candles()
+
+        # The buffers are rebuilt from the candles that are left
+        self.assertEqual(len(get_candle_buffer(self.symbol_active.name)), CANDLES_TO_KEEP_PER_SYMBOL)
+        self.assertEqual(result['deleted'], 5 + CANDLES_TO_KEEP_PER_SYMBOL + 2)
+        self.assertEqual(Candle.objects.filter(symbol=self.symbol_active).count(), CANDLES_TO_KEEP_PER_SYMBOL)
+        kept = Candle.objects.filter(symbol=self.symbol_inactive).order_by('timestamp')
+        self.assertEqual(kept.count(), 3)
+        # The newest candles are the ones that survive
+        self.assertEqual(kept.first().timestamp, start_time + timedelta(minutes=15 * (CANDLES_TO_KEEP_PER_SYMBOL + 2)))
+
+    # --- Multi-Interval Roll-up Tests ---
+
+    def test_rollup_aggregates_ohlcv(self):
+        """Test the vectorised roll-up of 15-minute candles into hourly buckets."""
+        timestamps = np.arange(0, 8 * 900, 900, dtype=np.int64) + 3600  # 8 candles = 2 full hours
+        opens = np.arange(8, dtype=np.float64)
+        highs = opens + 10
+        lows = opens - 10
+        closes = opens + 0.5
+        volumes = np.ones(8)
+
+        bars = rollup(timestamps, opens, highs, lows, closes, volumes, 3600)
+
+        np.testing.assert_array_equal(bars['timestamp'], [3600, 7200])
+        np.testing.assert_array_equal(bars['open'], [0, 4])
+        np.testing.assert_array_equal(bars['high'], [13, 17])
+        np.testing.assert_array_equal(bars['low'], [-10, -6])
+        np.testing.assert_array_equal(bars['close'], [3.5, 7.5])
+        np.testing.assert_array_equal(bars['volume'], [4, 4])
+        np.testing.assert_array_equal(bars['count'], [4, 4])
+
+    def test_update_rollups_reads_each_symbol_from_its_own_start(self):
+        """Test one symbol's old start does not make the roll-up read another symbol's older history."""
+        start_time = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for symbol in (self.symbol_active, self.symbol_inactive):
+            for i in range(3 * 96):  # Three days of 15-minute candles
+                Candle.objects.create(symbol=symbol, timestamp=start_time + timedelta(minutes=15 * i),
+                                      open=1, high=1, low=1, close=1, volume=1)
+
+        with CaptureQueriesContext(connection) as queries:
+            derived = update_rollups({self.symbol_active.id: start_time,
+                                      self.symbol_inactive.id: start_time + timedelta(days=2, hours=5)})
+
+        # The base rows come from one query and the later symbol's rows start at its own day
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM ({queries.captured_queries[0]['sql']}) AS base")
+            self.assertEqual(cursor.fetchone()[0], 3 * 96 + 96)
+        days = {(c.symbol_id, c.timestamp) for c in derived if c.interval == '1day'}
+        self.assertEqual(days, {(self.symbol_active.id, start_time + timedelta(days=d)) for d in range(3)}
+                         | {(self.symbol_inactive.id, start_time + timedelta(days=2))})
+
+    @patch('market_data.tasks.KucoinClient')
+    def test_ingestion_rolls_up_higher_intervals(self, MockKucoinClient):
+        """Test that storing 15-minute candles keeps the 1h/4h/1d candles up to date incrementally."""
+        MockKucoinClient.return_value.get_kline_data.return_value = MOCK_API_RESPONSE
+        fetch_and_store_candles(self.symbol_active.name)
+
+        hourly = Candle.objects.get(symbol=self.symbol_active, interval='1hour')
+        self.assertEqual(hourly.timestamp, datetime(2025, 1, 1, 10, 0, tzinfo=timezone.utc))
+        self.assertEqual((hourly.open, hourly.high, hourly.low, hourly.close), (90, 110, 88, 105))
+        self.assertEqual(hourly.volume, 1800)
+
+        # A later candle in the same hour updates the open bucket instead of adding one
+        MockKucoinClient.return_value.get_kline_data.return_value = [
+            {'timestamp': datetime(2025, 1, 1, 10, 30), 'open': '105', 'close': '120', 'high': '125',
+             'low': '101', 'volume': '200'},
+        ]
+        fetch_and_store_candles(self.symbol_active.name)
+        hourly.refresh_from_db()
+        self.assertEqual((hourly.open, hourly.high, hourly.low, hourly.close), (90, 125, 88, 120))
+        self.assertEqual(Candle.objects.filter(symbol=self.symbol_active, interval='1day').count(), 1)
+
+    # --- Candle Buffer Tests ---
+
+    def test_ring_buffer_wraps_and_returns_contiguous_views(self):
+        """Test the ring buffer keeps the newest candles as zero-copy, oldest-first slices."""
+        buffer = CandleRingBuffer(capacity=4)
+        timestamps = np.arange(6, dtype=np.int64) * 900
+        ohlcv = np.vstack([np.arange(6, dtype=np.float64)] * 5)
+        buffer.append(timestamps[:3], ohlcv[:, :3])
+        buffer.append(timestamps[3:], ohlcv[:, 3:])
+
+        latest_ts, latest_ohlcv = buffer.latest(3)
+        np.testing.assert_array_equal(latest_ts, [2700, 3600, 4500])
+        np.testing.assert_array_equal(latest_ohlcv[CLOSE], [3, 4, 5])
+        self.assertIsNotNone(latest_ts.base)  # A view into the buffer, not a copy
+        window_ts, _ = buffer.window(until=3600, n=10)
+        np.testing.assert_array_equal(window_ts, [1800, 2700, 3600])
+
+        # Re-sending the newest candle replaces it instead of appending a duplicate
+        buffer.append(np.array([4500]), np.full((5, 1), 9.0))
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual(buffer.latest(1)[1][CLOSE][0], 9.0)
+
+        restored = CandleRingBuffer.from_bytes(buffer.to_bytes())
+        np.testing.assert_array_equal(restored.latest()[0], buffer.latest()[0])
+        np.testing.assert_array_equal(restored.latest()[1], buffer.latest()[1])
+
+    @patch('market_data.tasks.KucoinClient')
+    def test_candle_buffer_is_shared_and_kept_current_by_ingestion(self, MockKucoinClient):
+        """Test hot buffer reads cost no queries and ingestion appends to an existing buffer."""
+        MockKucoinClient.return_value.get_kline_data.return_value = MOCK_API_RESPONSE
+        fetch_and_store_candles(self.symbol_active.name)
+
+        buffer = get_candle_buffer(self.symbol_active.name)
+        get_candle_buffer(self.symbol_active.name, '1hour')
+        self.assertEqual(len(buffer), 2)
+        with self.assertNumQueries(0):
+            self.assertIs(get_candle_buffer(self.symbol_active.name), buffer)
+
+        MockKucoinClient.return_value.get_kline_data.return_value = [
+            {'timestamp': datetime(2025, 1, 1, 10, 30), 'open': '105', 'close': '120', 'high': '125',
+             'low': '101', 'volume': '200'},
+        ]
+        fetch_and_store_candles(self.symbol_active.name)
+        with self.assertNumQueries(0):
+            buffer = get_candle_buffer(self.symbol_active.name)
+            hourly = get_candle_buffer(self.symbol_active.name, '1hour')
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.latest(1)[1][CLOSE][0], 120.0)
+        self.assertEqual(hourly.latest(1)[1][CLOSE][0], 120.0)
+
+    def test_candle_writes_outside_ingestion_drop_the_buffer_once_committed(self):
+        """Test saved candles queue one buffer invalidation per transaction, and deletes drop buffers explicitly."""
+        buffer_keys = [f"candles:{self.symbol_active.name}:15min", f"candles:{self.symbol_inactive.name}:15min"]
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for symbol in (self.symbol_active, self.symbol_inactive):
+            with self.captureOnCommitCallbacks(execute=True):
+                Candle.objects.create(symbol=symbol, timestamp=start, open=1, high=1, low=1, close=1, volume=1)
+            get_candle_buffer(symbol.name)
+        self.assertEqual(len(cache.get_many(buffer_keys)), 2)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertNumQueries(3):  # no symbol is loaded to name the buffer
+                for i in range(1, 4):
+                    Candle.objects.create(symbol_id=self.symbol_active.id, timestamp=start + timedelta(minutes=15 * i),
+                                          open=1, high=1, low=1, close=1, volume=1)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(len(cache.get_many(buffer_keys)), 2)  # nothing is dropped before the commit
+        callbacks[0]()
+        self.assertEqual(list(cache.get_many(buffer_keys)), [buffer_keys[1]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.symbol_inactive.delete()
+        self.assertEqual(cache.get_many(buffer_keys), {})
+
+    # --- Indicator Tests ---
+
+    def test_indicators_match_reference_and_advance_incrementally(self):
+        """Test the vectorised EMA/RSI against the plain recursion and incremental against full updates."""
+        closes = 100 + np.cumsum(np.random.default_rng(7).normal(0, 1, 300))
+        timestamps = np.arange(300, dtype=np.int64) * 900
+
+        expected = [closes[0]]
+        for value in closes[1:]:
+            expected.append(0.2 * value + 0.8 * expected[-1])
+        np.testing.assert_allclose(ema(closes, 9), expected, rtol=1e-10)
+
+        deltas = np.diff(closes)
+        avg_gain, avg_loss = np.clip(deltas[:14], 0, None).mean(), np.clip(-deltas[:14], 0, None).mean()
+        for delta in deltas[14:]:
+            avg_gain = (avg_gain * 13 + max(delta, 0)) / 14
+            avg_loss = (avg_loss * 13 + max(-delta, 0)) / 14
+        full = advance_state(None, timestamps, closes)
+        self.assertAlmostEqual(full['avg_gain'], avg_gain)
+        self.assertAlmostEqual(full['avg_loss'], avg_loss)
+
+        partial = advance_state(None, timestamps[:250], closes[:250])
+        incremental = advance_state(partial, timestamps, closes)
+        self.assertEqual(incremental['timestamp'], full['timestamp'])
+        for span in EMA_SPANS:
+            self.assertAlmostEqual(incremental['ema'][span], full['ema'][span])
+        self.assertAlmostEqual(incremental['avg_gain'], full['avg_gain'])
+        np.testing.assert_allclose(incremental['spreads'], full['spreads'])
+
+    def test_support_resistance_and_patterns(self):
+        """Test swing levels around the close and candlestick pattern detection."""
+        highs = np.array([10, 11, 12, 15, 12, 11, 10, 9, 8, 9, 10, 11, 12], dtype=np.float64)
+        lows = highs - 2
+        self.assertEqual(support_resistance(highs, lows, close=11.0), (6.0, 15.0))
+
+        # A bearish candle followed by a bullish one whose body engulfs it
+        ohlcv = np.array([[10, 8.9], [10.2, 11.2], [8.8, 8.7], [9, 11], [1, 1]], dtype=np.float64)
+        self.assertIn('bullish_engulfing', candlestick_patterns(ohlcv))
+
+    @patch('market_data.tasks.KucoinClient')
+    def test_features_are_cached_and_advanced_on_ingestion(self, MockKucoinClient):
+        """Test ingestion keeps the cached indicator summary current for symbols with a buffer."""
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        MockKucoinClient.return_value.get_kline_data.return_value = [
+            {'timestamp': (start + timedelta(minutes=15 * i)).replace(tzinfo=None), 'open': str(100 + i),
+             'close': str(101 + i), 'high': str(102 + i), 'low': str(99 + i), 'volume': '10'}
+            for i in range(60)
+        ]
+        fetch_and_store_candles(self.symbol_active.name)
+        self.assertIsNone(get_features(self.symbol_active.name, until=int(start.timestamp())))
+
+        features = get_features(self.symbol_active.name)
+        self.assertEqual(features['close'], 160.0)
+        self.assertEqual(features['ema_trend'], 'BULLISH')
+        self.assertEqual(features['rsi_14'], 100.0)
+        self.assertLess(len(json.dumps(features)), 1000)
+
+        MockKucoinClient.return_value.get_kline_data.return_value = [
+            {'timestamp': (start + timedelta(minutes=15 * 60)).replace(tzinfo=None), 'open': '160',
+             'close': '150', 'high': '161', 'low': '149', 'volume': '30'},
+        ]
+        fetch_and_store_candles(self.symbol_active.name)
+        with self.assertNumQueries(0):
+            features = get_features(self.symbol_active.name)
+        self.assertEqual(features['close'], 150.0)
+        self.assertLess(features['rsi_14'], 100.0)
+
+    # --- Batched Ingestion Tests (against a local stub server) ---
+
+    def _start_stub_server(self):
+        StubKucoinHandler.requests_seen = []
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubKucoinHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    def test_async_client_fetches_many_symbols(self):
+        """Test the async client fetches symbols concurrently and isolates failures."""
+        base_url = self._start_stub_server()
+
+        async def fetch():
+            async with AsyncKucoinClient(base_url=base_url) as client:
+                return await client.get_kline_data_many(['BTC-USDT', 'ETH-USDT', 'BAD-USDT'])
+
+        results = asyncio.run(fetch())
+        self.assertEqual(len(results['BTC-USDT']), 2)
+        self.assertEqual(results['ETH-USDT'][0]['close'], Decimal('105'))
+        self.assertEqual(results['BTC-USDT'][0]['timestamp'], datetime(2025, 1, 1, 10, 15, tzinfo=timezone.utc))
+        self.assertIsNone(results['BAD-USDT'])
+
+    def test_ingest_symbols_stores_all_results_in_bulk(self):
+        """Test the ingestion engine writes the candles of every fetched symbol."""
+        base_url = self._start_stub_server()
+        symbol_bad = Symbol.objects.create(name='BAD-USDT', is_active=True)
+
+        summary = ingest_symbols([self.symbol_active, self.symbol_inactive, symbol_bad], base_url=base_url)
+
+        self.assertEqual(summary['symbols'], 2)
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(Candle.objects.filter(interval='15min', symbol=self.symbol_active).count(), INITIAL_LOOKBACK_CANDLES)
+        self.assertEqual(Candle.objects.filter(interval='15min', symbol=self.symbol_inactive).count(), INITIAL_LOOKBACK_CANDLES)
+        self.assertEqual(Candle.objects.filter(symbol=symbol_bad).count(), 0)
+
+        # A failed symbol keeps no high-water mark, so it is retried in full next cycle
+        symbol_bad.refresh_from_db()
+        self.assertIsNone(symbol_bad.last_candle_at)
+
+    # --- Incremental Fetching Tests ---
+
+    def test_plan_fetch_windows(self):
+        """Test that only the range after the high-water mark is requested, paginated for long gaps."""
+        now = datetime(2025, 6, 1, 12, 7, tzinfo=timezone.utc)
+        last_closed = last_closed_candle_start('15min', now)
+        self.assertEqual(datetime.fromtimestamp(last_closed, tz=timezone.utc), datetime(2025, 6, 1, 11, 45, tzinfo=timezone.utc))
+
+        # Up to date: nothing to request
+        self.symbol_active.last_candle_at = datetime(2025, 6, 1, 11, 45, tzinfo=timezone.utc)
+        self.assertEqual(plan_fetch_windows(self.symbol_active, '15min', now), [])
+
+        # One candle missing: a single window starting right after the high-water mark
+        self.symbol_active.last_candle_at = datetime(2025, 6, 1, 11, 30, tzinfo=timezone.utc)
+        self.assertEqual(plan_fetch_windows(self.symbol_active, '15min', now), [(last_closed, last_closed + 900)])
+
+        # A 2000-candle gap is split into pages of at most 1500 candles
+        self.symbol_active.last_candle_at = datetime.fromtimestamp(last_closed - 2000 * 900, tz=timezone.utc)
+        windows = plan_fetch_windows(self.symbol_active, '15min', now)
+        self.assertEqual(len(windows), 2)
+        self.assertEqual(windows[0][0], last_closed - 1999 * 900)
+        self.assertEqual(windows[-1][1], last_closed + 900)
+
+    def test_ingest_symbols_is_incremental(self):
+        """Test that a gap is backfilled once and an up-to-date symbol is not requested again."""
+        base_url = self._start_stub_server()
+        last_closed = last_closed_candle_start('15min', datetime.now(timezone.utc))
+        self.symbol_active.last_candle_at = datetime.fromtimestamp(last_closed - 3 * 900, tz=timezone.utc)
+        self.symbol_active.save()
+
+        summary = ingest_symbols([self.symbol_active], base_url=base_url)
+        self.assertEqual(summary['rows'], 3)
+        self.symbol_active.refresh_from_db()
+        self.assertEqual(self.symbol_active.last_candle_at.timestamp(), last_closed)
+
+        summary = ingest_symbols([self.symbol_active], base_url=base_url)
+        self.assertEqual(summary['skipped'], 1)
+        self.assertEqual(len(StubKucoinHandler.requests_seen), 1)
+
+    # --- Backfill Tests ---
+
+    def test_backfill_records_resumes_and_replays_offline(self):
+        """Test a backfill loads each page once, skips stored pages when rerun, and replays its recording."""
+        base_url = self._start_stub_server()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        now = datetime.now(timezone.utc)
+        last_closed = last_closed_candle_start('15min', now)
+
+        summary = backfill_symbol(self.symbol_active, 20, now=now, base_url=base_url, record_to=directory)
+        self.assertEqual((summary['pages'], summary['rows'], summary['failed']), (2, 20 * 96, False))
+        self.assertEqual(Candle.objects.filter(symbol=self.symbol_active, interval='15min').count(), 20 * 96)
+        self.assertTrue(Candle.objects.filter(symbol=self.symbol_active, interval='1day').exists())
+        self.symbol_active.refresh_from_db()
+        self.assertEqual(self.symbol_active.last_candle_at.timestamp(), last_closed)
+
+        # Everything is stored, so a rerun requests nothing
+        requests_made = len(StubKucoinHandler.requests_seen)
+        self.assertEqual(backfill_symbol(self.symbol_active, 20, now=now, base_url=base_url)['pages'], 0)
+        self.assertEqual(len(StubKucoinHandler.requests_seen), requests_made)
+
+        # The recording replays offline; a symbol that was never recorded fails without writing anything
+        Candle.objects.filter(symbol=self.symbol_active, timestamp__gte=now - timedelta(days=2)).delete()
+        summary = backfill_symbol(self.symbol_active, 20, now=now, replay_from=directory)
+        self.assertEqual(summary['pages'], 1)
+        self.assertEqual(Candle.objects.filter(symbol=self.symbol_active, interval='15min').count(), 20 * 96)
+        self.assertTrue(backfill_symbol(self.symbol_inactive, 20, now=now, replay_from=directory)['failed'])
+        self.assertFalse(Candle.objects.filter(symbol=self.symbol_inactive).exists())
+
+    def test_copy_candles_upserts(self):
+        """Test loaded rows update the candles they collide with and add the rest."""
+        timestamp = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        Candle.objects.create(symbol=self.symbol_active, timestamp=timestamp, open=1, high=1, low=1, close=1, volume=1)
+        rows = [(self.symbol_active.id, '15min', timestamp + timedelta(minutes=15 * i), 2.5, 3, 2, 2.5, 10)
+                for i in range(3)]
+
+        self.assertEqual(copy_candles(iter(rows)), 3)
+        self.assertEqual(Candle.objects.filter(symbol=self.symbol_active).count(), 3)
+        self.assertEqual(Candle.objects.get(timestamp=timestamp).close, 2.5)
+
+    # --- Symbol Registry Tests ---
+
+    def test_symbol_registry_resolves_names_without_queries(self):
+        """Test symbols are resolved case-insensitively from memory once the registry is built."""
+        resolve_symbol('BTC-USDT')  # builds the registry
+        with self.assertNumQueries(0):
+            symbol = resolve_symbol('btc-usdt')
+            self.assertEqual(symbol.id, self.symbol_active.id)
+            self.assertEqual(symbol.name, 'BTC-USDT')
+            self.assertFalse(resolve_symbol('ETH-USDT').is_active)
+            self.assertIsNone(resolve_symbol('NON-EXISTENT'))
+
+    def test_symbol_registry_is_invalidated_by_symbol_changes(self):
+        """Test saving, deleting and the admin actions make the registry reload the symbols."""
+        resolve_symbol('BTC-USDT')
+        with self.captureOnCommitCallbacks(execute=True):
+            new_symbol = Symbol.objects.create(name='SOL-USDT')
+        self.assertEqual(resolve_symbol('sol-usdt').id, new_symbol.id)
+
+        self.symbol_active.last_candle_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.symbol_active.save(update_fields=['last_candle_at'])
+        self.assertEqual(callbacks, [])
+        with self.assertNumQueries(0):  # the high-water mark does not invalidate the registry
+            resolve_symbol('BTC-USDT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_symbol.delete()
+        self.assertIsNone(resolve_symbol('SOL-USDT'))
+
+        admin = SymbolAdmin(Symbol, AdminSite())
+        with patch.object(admin, 'message_user'):
+            with self.captureOnCommitCallbacks(execute=True):
+                admin.deactivate_symbols(None, Symbol.objects.filter(name='BTC-USDT'))
+        self.assertFalse(resolve_symbol('BTC-USDT').is_active)
+
+    def test_symbol_registry_waits_for_the_commit(self):
+        """Test a symbol change does not reach the registry until its transaction commits."""
+        resolve_symbol('BTC-USDT')
+        with self.captureOnCommitCallbacks() as callbacks:
+            Symbol.objects.create(name='SOL-USDT')
+            self.assertIsNone(resolve_symbol('SOL-USDT'))
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertIsNotNone(resolve_symbol('SOL-USDT'))
+
+    def test_symbol_registry_is_shared_through_the_cache(self):
+        """Test a process with an empty local copy loads the registry from the cache, not the database."""
+        resolve_symbol('BTC-USDT')
+        with patch('market_data.symbol_registry._local', (None, None, 0.0)):
+            with self.assertNumQueries(0):
+                self.assertEqual(resolve_symbol('BTC-USDT').id, self.symbol_active.id)
+
+    # --- Event Push Tests ---
+
+    def test_slow_subscriber_drops_oldest_events(self):
+        """Test a full subscription queue keeps the newest events and counts the dropped ones."""
+        async def run():
+            subscription = Subscription(maxsize=2)
+            for i in range(5):
+                subscription.put(('BTC-USDT', CANDLE_EVENT, i))
+            return [(await subscription.get(timeout=0))[2] for _ in range(2)], subscription.take_dropped()
+
+        self.assertEqual(asyncio.run(run()), ([3, 4], 3))
+
+    def test_event_hub_fans_published_events_out_by_symbol(self):
+        """Test one hub subscription delivers each published event to the clients of its symbol."""
+        redis = StubRedis()
+
+        async def run():
+            hub = EventHub(redis)
+            btc_only = hub.subscribe(['BTC-USDT'])
+            everything = hub.subscribe()
+            await asyncio.sleep(0.1)  # let the hub subscribe
+            with patch('market_data.events.get_redis_connection', return_value=redis):
+                publish_events([('BTC-USDT', SIGNAL_EVENT, b'{"a": 1}'), ('ETH-USDT', CANDLE_EVENT, {'b': 2})])
+            received = [await btc_only.get(timeout=2), await everything.get(timeout=2), await everything.get(timeout=2)]
+            extra = await btc_only.get(timeout=0.2)
+            hub.unsubscribe(btc_only)
+            hub.unsubscribe(everything)
+            await hub._reader
+            return received, extra
+
+        received, extra = asyncio.run(run())
+        self.assertEqual(received, [('BTC-USDT', 'signal', b'{"a": 1}'), ('BTC-USDT', 'signal', b'{"a": 1}'),
+                                    ('ETH-USDT', 'candle', b'{"b": 2}')])
+        self.assertIsNone(extra)
+        self.assertEqual(len(redis.pubsubs), 1)  # one Redis subscription for all the clients
+        self.assertTrue(redis.pubsubs[0].closed)
+
+    @patch('market_data.events.RECONNECT_DELAY', 0.01)
+    def test_event_hub_resubscribes_after_losing_redis(self):
+        """Test the hub resubscribes after a lost connection while it has subscribers, and stops without them."""
+        redis = StubRedis()
+
+        async def run():
+            hub = EventHub(redis)
+            subscription = hub.subscribe(['BTC-USDT'])
+            await asyncio.sleep(0.1)  # let the hub subscribe
+            redis.drop_connection()
+            await asyncio.sleep(0.1)  # let the hub resubscribe
+            redis.publish('market-events:BTC-USDT:candle', b'{"close": 1}')
+            event = await subscription.get(timeout=2)
+            hub.unsubscribe(subscription)
+            await asyncio.wait_for(hub._reader, 2)
+            return event
+
+        with self.assertLogs('market_data.events', level='ERROR'):
+            event = asyncio.run(run())
+        self.assertEqual(event, ('BTC-USDT', 'candle', b'{"close": 1}'))
+        self.assertEqual(len(redis.pubsubs), 2)
+        self.assertTrue(all(pubsub.closed for pubsub in redis.pubsubs))
+
+    def test_event_stream_view_pushes_events_as_sse(self):
+        """Test the event stream sends the subscribed symbol's events as Server-Sent Events."""
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from accounts.models import User
+        from .views import MarketEventStreamView
+        redis = StubRedis()
+        request = APIRequestFactory().get('/market/events/', {'symbols': 'btc-usdt'})
+        force_authenticate(request, user=User.objects.create_user(email='events@example.com', password='pw'))
+        resolve_symbol('BTC-USDT')  # build the symbol registry outside the event loop
+
+        async def run():
+            hub = EventHub(redis)
+            with patch('market_data.views.get_event_hub', return_value=hub):
+                response = await MarketEventStreamView.as_view()(request)
+                stream = response.streaming_content
+                first = asyncio.ensure_future(anext(stream))
+                await asyncio.sleep(0.1)  # let the stream subscribe
+                with patch('market_data.events.get_redis_connection', return_value=redis):
+                    publish_events([('ETH-USDT', CANDLE_EVENT, {'close': 1}), ('BTC-USDT', SIGNAL_EVENT, {'a': 1})])
+                event = await asyncio.wait_for(first, 2)
+                await stream.aclose()
+            return response, event, hub.subscriptions
+
+        response, event, subscriptions = asyncio.run(run())
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(event, b'event: signal\ndata: {"symbol": "BTC-USDT", "data": {"a": 1}}\n\n')
+        self.assertEqual(subscriptions, set())  # closing the stream unsubscribes
+
+    # --- Candle History Tests ---
+
+    def _create_candles(self, count, start=datetime(2025, 6, 26, 10, 0, 0, tzinfo=timezone.utc)):
+        for i in range(count):
+            Candle.objects.create(symbol=self.symbol_active, timestamp=start + timedelta(minutes=i * 15),
+                                  open=100 + i, high=110 + i, low=95 + i, close=105 + i, volume=1000)
+        return int(start.timestamp())
+
+    def test_read_candles_uses_the_buffer_and_falls_back_to_keyset_queries(self):
+        """Test pages inside the buffer cost no query and older pages are read from the database."""
+        start = self._create_candles(6)
+        step = 15 * 60
+        small_buffer = lambda symbol_name, interval: load_buffer_from_db(symbol_name, interval, capacity=3)
+        with patch('market_data.candle_buffer.load_buffer_from_db', side_effect=small_buffer):
+            get_candle_buffer('BTC-USDT', '15min')
+
+            with self.assertNumQueries(0):
+                timestamps, ohlcv, has_more = read_candles('BTC-USDT', '15min', limit=2)
+            self.assertEqual(timestamps.tolist(), [start + 4 * step, start + 5 * step])
+            self.assertTrue(has_more)
+
+            with self.assertNumQueries(1):
+                timestamps, ohlcv, has_more = read_candles('BTC-USDT', '15min', until=start + 2 * step, limit=2)
+            self.assertEqual(timestamps.tolist(), [start + step, start + 2 * step])
+            self.assertEqual(ohlcv[CLOSE].tolist(), [106.0, 107.0])
+            self.assertTrue(has_more)
+
+            with self.assertNumQueries(0):  # the buffer holds everything from `since` on
+                timestamps, _, has_more = read_candles('BTC-USDT', '15min', since=start + 4 * step, limit=5)
+            self.assertEqual(timestamps.tolist(), [start + 4 * step, start + 5 * step])
+            self.assertFalse(has_more)
+
+    def test_candle_list_view_paginates_with_a_cursor_and_selects_fields(self):
+        """Test the candle API pages backwards through the Link header and supports a columnar layout."""
+        from accounts.models import User
+        from rest_framework.test import APIClient as DRFAPIClient
+        client = DRFAPIClient()
+        client.force_authenticate(user=User.objects.create_user(email='candles@example.com', password='pw'))
+        start = self._create_candles(5)
+        url = f'/market/candles/{self.symbol_active.name}/'
+
+        response = client.get(url, {'limit': 2, 'fields': 'close'})
+        self.assertEqual(response.data, [{'timestamp': '2025-06-26T11:00:00Z', 'close': 109.0},
+                                         {'timestamp': '2025-06-26T10:45:00Z', 'close': 108.0}])
+        response = client.get(response['Link'].split(';')[0].strip('<>'))
+        self.assertEqual([row['close'] for row in response.data], [107.0, 106.0])
+
+        response = client.get(url, {'layout': 'columnar', 'fields': 'open,volume', 'since': start + 15 * 60,
+                                         'until': '2025-06-26T10:30:00Z'})
+        self.assertEqual(response.data, {'timestamp': [start + 30 * 60, start + 15 * 60], 'open': [102.0, 101.0],
+                                         'volume': [1000.0, 1000.0]})
+        self.assertNotIn('Link', response)
+        self.assertEqual(client.get(url, {'fields': 'rsi'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    # --- Storage Tests ---
+
+    def test_candles_store_exchange_quotes_exactly(self):
+        """Test quoted prices survive the double precision columns and convert back to the exact Decimal."""
+        quotes = ['0.00001234', '65432.12345678', '98765432.1', '1234567.12345678']
+        candles_data = parse_kline_data([['1735725600', quotes[0], quotes[1], quotes[2], quotes[0], quotes[3], '0']])
+        Candle.objects.create(symbol=self.symbol_active, **candles_data[0])
+
+        candle = Candle.objects.get(symbol=self.symbol_active)
+        self.assertEqual([Decimal(repr(getattr(candle, field))) for field in ('open', 'close', 'high', 'volume')],
+                         [Decimal(quotes[0]), Decimal(quotes[1]), Decimal(quotes[2]), Decimal(quotes[3])])
+
+    def test_benchmark_command_leaves_no_data_behind(self):
+        output = StringIO()
+        call_command('benchmark_candles', rows=200, windows='100', repeat=1, stdout=output)
+        self.assertIn('Read and serialise 100 candles as float', output.getvalue())
+        self.assertFalse(Symbol.objects.filter(name='BENCHMARK-USDT').exists())
+
+    # --- Partitioning Tests ---
+
+    def test_partition_ranges_cover_whole_months(self):
+        """Test partitions are monthly, named after their month, and roll over the year."""
+        ranges = partition_ranges(datetime(2025, 11, 20, tzinfo=timezone.utc), datetime(2026, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual([name for name, _, _ in ranges],
+                         ['market_data_candle_p2025_11', 'market_data_candle_p2025_12', 'market_data_candle_p2026_01'])
+        self.assertEqual(ranges[1][1:], (datetime(2025, 12, 1, tzinfo=timezone.utc),
+                                         datetime(2026, 1, 1, tzinfo=timezone.utc)))
+
+    def test_retention_cutoff_is_the_oldest_candle_an_active_symbol_keeps(self):
+        """Test the cutoff follows each active symbol's policy and ignores inactive symbols."""
+        self.symbol_active.retention_policy = {'15min': 100, '1hour': 2}
+        self.symbol_active.save()
+        start_time = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for i in range(5):
+            for symbol in (self.symbol_active, self.symbol_inactive):
+                Candle.objects.create(symbol=symbol, interval='1hour', timestamp=start_time + timedelta(hours=i),
+                                      open=1, high=1, low=1, close=1, volume=1)
+        Candle.objects.create(symbol=self.symbol_active, timestamp=start_time + timedelta(hours=4),
+                              open=1, high=1, low=1, close=1, volume=1)
+
+        # One query for the policy overrides and one for the cutoff, whatever the number of symbols
+        with self.assertNumQueries(2):
+            self.assertEqual(retention_cutoff(), start_time + timedelta(hours=3))
+
+    def test_partition_command_requires_postgresql(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest("Runs against other databases only.")
+        with self.assertRaises(CommandError):
+            call_command('partition_candles', '--convert')
+
+    # --- Query Plan Tests ---
+
+    def test_candle_history_query_reads_the_index_in_order(self):
+        """Test the newest candles of a symbol come from an index scan, without a sort."""
+        plan = query_plan(Candle.objects.filter(symbol_id=self.symbol_active.id, interval='15min').order_by(
+            '-timestamp').values_list('timestamp', 'close')[:100])
+        self.assertRegex(plan, r'USING (COVERING )?INDEX|Index (Only )?Scan')
+        self.assertNotRegex(plan, SORT_IN_PLAN)
 
     # --- API View Tests ---
 
@@ -126,3 +870,60 @@ class ComprehensiveMarketDataTests(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 0)  # Should return an empty list
+
+
+@skipUnless(connection.vendor == 'postgresql', "Native partitioning is PostgreSQL only.")
+class CandlePartitioningTests(TransactionTestCase):
+    """
+    Converting the candle table alters tables, which PostgreSQL refuses while the rows inserted by the
+    same transaction still have pending foreign key checks, so these tests commit like production does.
+    Each test puts the unpartitioned table back for the tests that follow.
+    """
+
+    def setUp(self):
+        self.symbol = Symbol.objects.create(name='BTC-USDT', is_active=True)
+        cache.clear()
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {connection.ops.quote_name(Candle._meta.db_table)} CASCADE")
+        with connection.schema_editor() as editor:
+            editor.create_model(Candle)
+            # Restore the foreign keys the conversion dropped
+            for relation in Candle._meta.related_objects:
+                field = relation.field
+                if field.concrete and field.db_constraint:
+                    unconstrained = copy.copy(field)
+                    unconstrained.db_constraint = False
+                    editor.alter_field(field.model, unconstrained, field)
+
+    def test_partitioned_table_keeps_working_and_drops_expired_months(self):
+        """Test the converted table stores candles by month, prunes recent reads, and drops expired months."""
+        old = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        self.symbol.retention_policy = {'1hour': 1}
+        self.symbol.save()
+        for timestamp in (old, now):
+            Candle.objects.create(symbol=self.symbol, interval='1hour', timestamp=timestamp,
+                                  open=1, high=1, low=1, close=1, volume=1)
+        partition_candle_table()
+
+        # Ids continue from the copied rows, and upserts still find their unique key
+        recent = Candle.objects.create(symbol=self.symbol, timestamp=now, open=1, high=1, low=1, close=1,
+                                       volume=1)
+        self.assertGreater(recent.id, Candle.objects.get(interval='1hour', timestamp=old).id)
+        Candle.objects.bulk_create([Candle(symbol=self.symbol, timestamp=now, open=2, high=2, low=2, close=2,
+                                           volume=2)], update_conflicts=True,
+                                   unique_fields=['symbol', 'interval', 'timestamp'], update_fields=['close'])
+        self.assertEqual(Candle.objects.get(id=recent.id).close, 2)
+
+        partitions = [name for name, _, _ in list_partitions()]
+        self.assertEqual(partitions[0], 'market_data_candle_p2024_01')
+        plan = Candle.objects.filter(symbol=self.symbol, timestamp__gte=now).explain()
+        self.assertIn(f"market_data_candle_p{now:%Y_%m}", plan)
+        self.assertNotIn('market_data_candle_p2024_01', plan)
+
+        result = prune_candles()
+        self.assertEqual(result['partitions'][0], 'market_data_candle_p2024_01')
+        self.assertFalse(Candle.objects.filter(timestamp=old).exists())
+        self.assertTrue(Candle.objects.filter(id=recent.id).exists())
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import SymbolListView, CandleListView
+from .views import SymbolListView, CandleListView, MarketEventStreamView
 
 urlpatterns = [
     path('symbols/', SymbolListView.as_view(), name='symbol-list'),
     path('candles/<str:symbol_name>/', CandleListView.as_view(), name='candle-list'),
+    path('events/', MarketEventStreamView.as_view(), name='market-events'),
 ]
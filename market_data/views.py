@@ -1,6 +1,17 @@
+from datetime import datetime, timezone
+from adrf.views import APIView
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from .models import Symbol, Candle
-from .serializers import SymbolSerializer, CandleSerializer
+from .serializers import SymbolSerializer
+from .candle_buffer import read_candles, OHLCV_FIELDS
+from .symbol_registry import aresolve_symbol, aget_symbol_map
+from .events import get_event_hub
 from accounts.permissions import IsUserVerified
 
 
@@ -13,14 +24,135 @@ class SymbolListView(generics.ListAPIView):
     permission_classes = [IsUserVerified]
 
 
-class CandleListView(generics.ListAPIView):
+class CandleListView(APIView):
     """
-    API view to list the last 1000 candles for a given symbol.
+    API view to list the candles of a given symbol, newest first, a page at a time.
+    Query parameters:
+    - `interval`: the timeframe (15min, 1hour, 4hour or 1day).
+    - `since` / `until`: only candles starting in this range (ISO 8601 or UNIX seconds, inclusive).
+    - `limit`: the page size, up to MAX_PAGE_SIZE.
+    - `before`: the keyset cursor; only candles older than it. The `Link` header carries the URL
+      of the next (older) page, if there is one.
+    - `fields`: a comma-separated subset of open, high, low, close and volume.
+    - `layout`: `rows` (a list of objects) or `columnar` (parallel arrays, timestamps in UNIX seconds).
+    Candles are served from the in-memory candle buffer, so a hot read does no database work.
     """
-    serializer_class = CandleSerializer
     permission_classes = [IsUserVerified]
+    DEFAULT_PAGE_SIZE = 500
+    MAX_PAGE_SIZE = 1000
 
-    def get_queryset(self):
-        symbol_name = self.kwargs['symbol_name']
-        # Fetch the last 1000 candles for the given symbol, ordered by timestamp descending
-        return Candle.objects.filter(symbol__name=symbol_name).order_by('-timestamp')[:1000]
+    async def get(self, request, symbol_name, format=None):
+        params = request.query_params
+        interval = params.get('interval', Candle.Interval.FIFTEEN_MINUTES)
+        if interval not in Candle.Interval.values:
+            raise ValidationError({'interval': f"Must be one of: {', '.join(Candle.Interval.values)}."})
+        fields = params['fields'].split(',') if params.get('fields') else list(OHLCV_FIELDS)
+        if not set(fields) <= set(OHLCV_FIELDS):
+            raise ValidationError({'fields': f"Must be a subset of: {', '.join(OHLCV_FIELDS)}."})
+        layout = params.get('layout', 'rows')
+        if layout not in ('rows', 'columnar'):
+            raise ValidationError({'layout': "Must be rows or columnar."})
+        limit = _parse_int(params, 'limit', self.DEFAULT_PAGE_SIZE)
+        if not 1 <= limit <= self.MAX_PAGE_SIZE:
+            raise ValidationError({'limit': f"Must be between 1 and {self.MAX_PAGE_SIZE}."})
+        since = _parse_time(params, 'since')
+        until = _parse_time(params, 'until')
+        before = _parse_int(params, 'before', None)
+        if before is not None:
+            until = before - 1 if until is None else min(until, before - 1)
+
+        symbol = await aresolve_symbol(symbol_name)
+        if symbol is None:
+            return Response({field: [] for field in ['timestamp', *fields]} if layout == 'columnar' else [])
+
+        timestamps, ohlcv, has_more = await sync_to_async(read_candles)(symbol.name, interval, since, until, limit)
+        columns = {'timestamp': timestamps[::-1].tolist()}
+        columns.update((field, ohlcv[OHLCV_FIELDS.index(field)][::-1].tolist()) for field in fields)
+
+        if layout == 'columnar':
+            response = Response(columns)
+        else:
+            columns['timestamp'] = [
+                datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace('+00:00', 'Z')
+                for ts in columns['timestamp']
+            ]
+            response = Response([dict(zip(columns, row)) for row in zip(*columns.values())])
+
+        if has_more:
+            next_params = params.copy()
+            next_params['before'] = int(timestamps[0])
+            response['Link'] = f'<{request.build_absolute_uri(request.path)}?{next_params.urlencode()}>; rel="next"'
+        return response
+
+
+def _parse_int(params, name: str, default):
+    try:
+        return int(params[name]) if params.get(name) else default
+    except ValueError:
+        raise ValidationError({name: "Must be an integer."})
+
+
+def _parse_time(params, name: str):
+    """Parses an ISO 8601 or UNIX seconds query parameter into UNIX seconds."""
+    value = params.get(name)
+    if not value:
+        return None
+    if value.lstrip('-').isdigit():
+        return int(value)
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: "Must be an ISO 8601 datetime or UNIX seconds."})
+    if is_naive(parsed):
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+class MarketEventStreamView(APIView):
+    """
+    Pushes new candles and signals to the client as Server-Sent Events, instead of the client polling.
+    The symbols are chosen with the comma-separated `symbols` query parameter (all symbols if omitted).
+    Each event is a `candle` or `signal` event whose data carries the symbol; if the client falls
+    behind and events had to be dropped, a `lagged` event says how many, so it can refetch.
+    A comment is sent every HEARTBEAT_INTERVAL seconds to keep idle connections open.
+    """
+    permission_classes = [IsUserVerified]
+    HEARTBEAT_INTERVAL = 15
+
+    async def get(self, request, format=None):
+        symbols = None
+        requested = request.query_params.get('symbols')
+        if requested:
+            registry = await aget_symbol_map()
+            names = {name.strip().lower() for name in requested.split(',')}
+            symbols = {registry[name].name for name in names if name in registry}
+            if not symbols:
+                raise ValidationError({'symbols': "None of the requested symbols exist."})
+
+        response = StreamingHttpResponse(self._stream_events(symbols), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop reverse proxies from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def _stream_events(self, symbols):
+        hub = get_event_hub()
+        subscription = hub.subscribe(symbols)
+        try:
+            while True:
+                event = await subscription.get(timeout=self.HEARTBEAT_INTERVAL)
+                dropped = subscription.take_dropped()
+                if dropped:
+                    yield f"event: lagged\ndata: {{\"dropped\": {dropped}}}\n\n"
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                symbol_name, event_type, data = event
+                if isinstance(data, bytes):
+                    data = data.decode()
+                yield f"event: {event_type}\ndata: {{\"symbol\": \"{symbol_name}\", \"data\": {data}}}\n\n"
+        finally:
+            # Runs when the client disconnects and the stream is closed
+            hub.unsubscribe(subscription)